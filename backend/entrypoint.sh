@@ -1,12 +1,16 @@
 #!/bin/sh
-echo "Running migrations..."
-python manage.py makemigrations
-python manage.py migrate
+set -e
 
-echo "Creating superuser if not exists..."
-echo "from django.contrib.auth.models import User; \
-    User.objects.filter(username='${DJANGO_SUPERUSER_USERNAME}').exists() or \
-    User.objects.create_superuser('${DJANGO_SUPERUSER_USERNAME}', '${DJANGO_SUPERUSER_EMAIL}', '${DJANGO_SUPERUSER_PASSWORD}')" | python manage.py shell
+# Migrations run once per deploy (the migrate service), not every time a server starts
+if [ "${RUN_MIGRATIONS:-False}" = "True" ] || [ "${RUN_MIGRATIONS}" = "1" ]; then
+    echo "Running migrations..."
+    python manage.py migrate --noinput
+
+    echo "Creating superuser if not exists..."
+    echo "from django.contrib.auth.models import User; \
+        User.objects.filter(username='${DJANGO_SUPERUSER_USERNAME}').exists() or \
+        User.objects.create_superuser('${DJANGO_SUPERUSER_USERNAME}', '${DJANGO_SUPERUSER_EMAIL}', '${DJANGO_SUPERUSER_PASSWORD}')" | python manage.py shell
+fi
 
 echo "Starting server..."
 exec "$@"
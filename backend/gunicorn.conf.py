@@ -0,0 +1,66 @@
+# gunicorn.conf.py
+#
+# Production server: `gunicorn -c gunicorn.conf.py`. The default uvicorn
+# worker serves Django over ASGI, which the event stream needs. Set
+# GUNICORN_WORKER_CLASS=sync or gthread to serve WSGI instead.
+#
+# `kill -HUP <master pid>` reloads the code gracefully: new workers are
+# started and the old ones finish their requests within graceful_timeout.
+
+import os
+import shutil
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))  # gthread workers only
+
+if worker_class.startswith('uvicorn'):
+    wsgi_app = 'project.asgi:application'
+else:
+    wsgi_app = 'project.wsgi:application'
+
+# Builds and clones run inside requests, the timeout has to allow for them
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then to contain leaks, jittered so they do not restart together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Auto reload on code changes, for development with the source mounted
+reload = os.environ.get('GUNICORN_RELOAD', 'False').lower() in ('true', '1')
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Samples of the previous server's workers would be summed into the new ones
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # Runs before the worker loads the app, whose ready() starts the
+    # background tasks (health checks, image GC, metrics flush) on this flag.
+    # Keep preload_app off, the master would load the app without it.
+    os.environ['BACKGROUND_TASKS'] = 'true'
+
+
+def worker_exit(server, worker):
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        from project.app.metrics import registry
+        registry.flush(metrics_dir)
+
+
+def child_exit(server, worker):
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        from project.app.metrics import registry
+        registry.fold(metrics_dir, worker.pid)
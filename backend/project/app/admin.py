@@ -11,6 +11,7 @@ from django.conf import settings
 from django.db import transaction
 import logging
 import subprocess
+from .sync import head_revision
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -67,7 +68,7 @@ class ProjectAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         # Only perform cloning on creation (not on edit)
         if not change:
-            repo_dir = os.path.join(settings.BASE_DIR, 'temp_repo', obj.name)
+            repo_dir = os.path.join(settings.CLONE_TEMP_DIR, obj.name)
             try:
                 with transaction.atomic():  # Ensure atomicity
                     # Save the Project object first
@@ -76,6 +77,8 @@ class ProjectAdmin(admin.ModelAdmin):
                     logger.info(f"Cloning repository from {obj.repository_url} into {repo_dir}")
                     # Clone with real-time progress
                     clone_repository(obj.repository_url, repo_dir)
+                    obj.synced_revision = head_revision(git.Repo(repo_dir))
+                    obj.save(update_fields=['synced_revision'])
 
                     files_created = 0  # Counter for created files
 
@@ -1,3 +1,5 @@
+import os
+import sys
 from django.apps import AppConfig
 
 
@@ -7,4 +9,21 @@ class AppConfig(AppConfig):
 
     def ready(self):
         import project.app.signals  # noqa: F401
+        import project.app.search  # noqa: F401  Registers the ilike lookup
 
+        if self._serves_requests():
+            from .docker_gc import start_periodic_gc
+            from .health import start_health_checks
+            from .metrics import start_metrics_flush
+            start_periodic_gc()
+            start_health_checks()
+            start_metrics_flush()
+
+    @staticmethod
+    def _serves_requests():
+        # Background tasks run only where asked for: gunicorn sets the flag in
+        # its workers (post_fork), tests and management commands never do
+        if os.environ.get('BACKGROUND_TASKS', '').lower() in ('true', '1'):
+            return True
+        # runserver's autoreloader imports the project twice, RUN_MAIN marks the serving child
+        return os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1:2] == ['runserver'] and os.environ.get('RUN_MAIN') == 'true'
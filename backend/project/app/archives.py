@@ -0,0 +1,189 @@
+# archives.py
+
+import io
+import stat
+import tarfile
+import zipfile
+import zlib
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from .utils import normalize_file_path
+
+ARCHIVE_FORMATS = {
+    'tar.gz': ('application/gzip', 'tar.gz'),
+    'zip': ('application/zip', 'zip'),
+}
+
+
+class StreamBuffer:
+    """
+    Write-only, non-seekable file object. Archive writers emit into it and the
+    generator drains it after every entry, so only one entry is held at a time.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_tar(files, root=''):
+    """
+    Yields a gzipped tar archive of (file_path, content, updated_at) rows.
+    """
+    buffer = StreamBuffer()
+    with tarfile.open(fileobj=buffer, mode='w|gz') as archive:
+        for file_path, content, updated_at in files:
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(name=f"{root}{file_path}")
+            info.size = len(data)
+            info.mtime = int(updated_at.timestamp())
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(data))
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    yield buffer.drain()
+
+
+def stream_zip(files, root=''):
+    """
+    Yields a zip archive of (file_path, content, updated_at) rows. Sizes and CRCs
+    go into data descriptors since the output cannot be seeked back into.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path, content, updated_at in files:
+            data = content.encode('utf-8')
+            info = zipfile.ZipInfo(f"{root}{file_path}", date_time=max(updated_at.timetuple()[:6], (1980, 1, 1, 0, 0, 0)))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with archive.open(info, 'w', force_zip64=len(data) > zipfile.ZIP64_LIMIT) as entry:
+                entry.write(data)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class UploadLimitHandler(FileUploadHandler):
+    """
+    Stops reading the request body once `limit` bytes of file data arrived,
+    for uploads sent without a Content-Length. Goes before the handlers that
+    store the data.
+    """
+
+    def __init__(self, limit, request=None):
+        super().__init__(request)
+        self.limit = limit
+        self.received = 0
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def iter_archive(fileobj, archive_size, limits, strip_components=0):
+    """
+    Yields (file_path, data) for every regular file of a zip or (optionally
+    compressed) tar archive without extracting it to disk. Entry count, entry
+    size, total size and compression ratio are checked against `limits` while
+    reading, so a bomb is rejected before it is inflated.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        entries = _iter_zip(fileobj, limits)
+    else:
+        fileobj.seek(0)
+        entries = _iter_tar(fileobj, limits)
+
+    remaining = min(limits['max_total_bytes'], archive_size * limits['max_ratio'])
+    for name, read in entries:
+        # Never trust declared sizes, read at most one byte past the budget
+        budget = min(limits['max_file_bytes'], remaining)
+        try:
+            data = read(budget + 1)
+        except (tarfile.TarError, zlib.error, EOFError, OSError) as e:
+            raise ArchiveError(f"Corrupt entry '{name}': {e}")
+        if len(data) > budget:
+            if budget == limits['max_file_bytes']:
+                raise ArchiveError(f"Entry '{name}' exceeds the maximum file size.")
+            raise ArchiveError('Archive expands beyond the allowed size or compression ratio.')
+        remaining -= len(data)
+
+        parts = normalize_file_path(name)
+        if not parts:
+            continue
+        parts = parts.split('/')[strip_components:]
+        if parts:
+            yield '/'.join(parts), data
+
+
+def _iter_zip(fileobj, limits):
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f'Invalid zip archive: {e}')
+    with archive:
+        infos = archive.infolist()
+        if len(infos) > limits['max_entries']:
+            raise ArchiveError('Archive contains too many entries.')
+        for info in infos:
+            mode = info.external_attr >> 16
+            if info.is_dir() or stat.S_ISLNK(mode):
+                continue
+            if info.file_size > limits['max_file_bytes']:
+                raise ArchiveError(f"Entry '{info.filename}' exceeds the maximum file size.")
+
+            def read(size, info=info):
+                try:
+                    with archive.open(info) as entry:
+                        return entry.read(size)
+                except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError, OSError) as e:
+                    raise ArchiveError(f"Corrupt entry '{info.filename}': {e}")
+            yield info.filename, read
+
+
+def _iter_tar(fileobj, limits):
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode='r|*')
+    except tarfile.TarError as e:
+        raise ArchiveError(f'Unsupported or invalid archive: {e}')
+    with archive:
+        count = 0
+        try:
+            for member in archive:
+                count += 1
+                if count > limits['max_entries']:
+                    raise ArchiveError('Archive contains too many entries.')
+                # Links, devices and directories are skipped
+                if not member.isfile():
+                    continue
+                if member.size > limits['max_file_bytes']:
+                    raise ArchiveError(f"Entry '{member.name}' exceeds the maximum file size.")
+                yield member.name, archive.extractfile(member).read
+        except (tarfile.TarError, EOFError, OSError) as e:
+            raise ArchiveError(f'Corrupt archive: {e}')
@@ -0,0 +1,157 @@
+# authentication.py
+
+import copy
+import time
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch, get_md5_hash_password
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Users by id for AUTH_USER_CACHE_TTL seconds. Signals drop a changed user
+    in the process that changed it, other workers see the change once their
+    entry expires.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.users = {}  # str(id) -> (expires, user)
+        self.generation = 0
+
+    def get(self, user_id):
+        key = str(user_id)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(key)
+            generation = self.generation
+        if entry and entry[0] > now:
+            # Requests may modify their user, never hand out the cached instance
+            return copy.copy(entry[1])
+
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None:
+            return None
+        with self.lock:
+            # A user forgotten while we were loading it may be stale already
+            if generation == self.generation:
+                if len(self.users) >= self.max_size:
+                    self.users = {k: v for k, v in self.users.items() if v[0] > now}
+                    if len(self.users) >= self.max_size:
+                        self.users.clear()
+                self.users[key] = (now + settings.AUTH_USER_CACHE_TTL, user)
+        return copy.copy(user)
+
+    def forget(self, user_id):
+        with self.lock:
+            self.users.pop(str(user_id), None)
+            self.generation += 1
+
+
+class TokenBlacklist:
+    """
+    jti of the blacklisted refresh tokens that have not expired, read from the
+    token_blacklist tables at most every AUTH_BLACKLIST_SYNC_INTERVAL seconds.
+    Tokens blacklisted by this process are added right away.
+    """
+
+    # Ids are taken before commit, a row committed late can have a lower id than one
+    # already read. Rows this recent and close to the last id are read again.
+    LATE_COMMIT_WINDOW = timedelta(seconds=60)
+    LATE_COMMIT_IDS = 1000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = {}  # jti -> expires_at
+        self.last_id = 0
+        self.last_sync_started = None
+        self.synced = None
+
+    def sync(self):
+        now = timezone.now()
+        new_rows = Q(id__gt=self.last_id)
+        if self.last_sync_started is not None:
+            new_rows |= Q(id__gt=self.last_id - self.LATE_COMMIT_IDS, blacklisted_at__gte=self.last_sync_started - self.LATE_COMMIT_WINDOW)
+        rows = (
+            BlacklistedToken.objects.filter(new_rows)
+            .order_by('id')
+            .values_list('id', 'token__jti', 'token__expires_at')
+        )
+        for row_id, jti, expires_at in rows.iterator():
+            self.last_id = max(self.last_id, row_id)
+            if expires_at > now:
+                self.tokens[jti] = expires_at
+        self.tokens = {jti: expires_at for jti, expires_at in self.tokens.items() if expires_at > now}
+        self.last_sync_started = now
+        self.synced = time.monotonic()
+
+    def __contains__(self, jti):
+        with self.lock:
+            if self.synced is None or time.monotonic() - self.synced >= settings.AUTH_BLACKLIST_SYNC_INTERVAL:
+                self.sync()
+            return jti in self.tokens
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.tokens[jti] = expires_at
+
+
+user_cache = UserCache()
+blacklisted_tokens = TokenBlacklist()
+
+
+class CachedRefreshToken(RefreshToken):
+    """
+    RefreshToken checking the in-memory blacklist instead of a query per check.
+    """
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in blacklisted_tokens:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklisted_tokens.add(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+        return result
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving users through user_cache, so authenticated
+    requests do not query the user table.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,353 @@
+# benchmarks.py
+
+import io
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import tarfile
+import tempfile
+import threading
+import statistics
+import git
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from django.test import override_settings
+from rest_framework.test import APIClient
+from .models import Project, File, Container
+
+
+def summarize(name, durations, **extra):
+    """
+    Latency summary in milliseconds of a list of durations in seconds.
+    """
+    ordered = sorted(durations)
+
+    def percentile(fraction):
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+    result = {
+        'name': name,
+        'samples': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(0.50), 3),
+        'p90_ms': round(percentile(0.90), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+    result.update(extra)
+    return result
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def consume(response):
+    if getattr(response, 'streaming', False):
+        b''.join(response.streaming_content)
+        response.close()
+    return response
+
+
+def check(response, expected):
+    consume(response)
+    if response.status_code not in expected:
+        raise RuntimeError(f"Unexpected status {response.status_code}: {getattr(response, 'data', '')}")
+    return response
+
+
+class BenchmarkHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # The default backlog of 5 adds SYN retry delays under concurrency
+
+
+class Server:
+    """
+    Threaded HTTP server on a free local port, running on a daemon thread.
+    """
+
+    def __init__(self, handler):
+        self.httpd = BenchmarkHTTPServer(('127.0.0.1', 0), handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for a hosted app: fixed body, cacheable for a minute.
+    """
+    protocol_version = 'HTTP/1.1'
+    body = b'x' * 2048
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('Cache-Control', 'max-age=60')
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DockerStubHandler(BaseHTTPRequestHandler):
+    """
+    The parts of the Docker Engine API used by docker_utils, answering
+    immediately so container benchmarks measure the backend only.
+    """
+    protocol_version = 'HTTP/1.1'
+    containers = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, payload=None, content_type='application/json'):
+        body = b'' if payload is None else (payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8'))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def route(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        # Strip the /v1.xx API version prefix
+        if path.startswith('/v1.'):
+            path = '/' + path.split('/', 2)[2]
+        return path.strip('/').split('/'), parse_qs(parts.query)
+
+    def container_json(self, container_id):
+        container = self.containers[container_id]
+        return {
+            'Id': container_id, 'Name': f"/{container['name']}", 'Image': 'sha256:stub',
+            'State': {'Status': container['status'], 'Running': container['status'] == 'running'},
+            'Config': {'Image': container['image']},
+        }
+
+    def do_GET(self):
+        segments, _ = self.route()
+        if segments in (['version'], ['_ping']):
+            return self.reply(200, {'ApiVersion': '1.44', 'Version': 'stub'} if segments == ['version'] else b'OK', 'application/json' if segments == ['version'] else 'text/plain')
+        if segments[0] == 'images' and segments[-1] == 'json':
+            return self.reply(200, {'Id': 'sha256:stub', 'RepoTags': ['stub:latest']})
+        if segments[0] == 'containers' and segments[-1] == 'json' and segments[1] in self.containers:
+            return self.reply(200, self.container_json(segments[1]))
+        return self.reply(404, {'message': 'not found'})
+
+    def do_POST(self):
+        segments, query = self.route()
+        body = self.read_body()
+        if segments == ['build']:
+            # Touch the uploaded context like the daemon would
+            tarfile.open(fileobj=io.BytesIO(body)).getnames()
+            stream = b'{"stream": "Step 1/1 : FROM scratch\\n"}\r\n{"stream": "Successfully built 0123456789ab\\n"}\r\n'
+            return self.reply(200, stream)
+        if segments == ['containers', 'create']:
+            container_id = uuid.uuid4().hex * 2
+            config = json.loads(body or b'{}')
+            with self.lock:
+                self.containers[container_id] = {'name': query.get('name', [container_id[:12]])[0], 'status': 'created', 'image': config.get('Image')}
+            return self.reply(201, {'Id': container_id, 'Warnings': []})
+        if segments[0] == 'containers' and segments[1] in self.containers:
+            action = segments[2]
+            status = {'start': 'running', 'stop': 'exited', 'restart': 'running'}.get(action)
+            if status:
+                self.containers[segments[1]]['status'] = status
+                return self.reply(204)
+        return self.reply(404, {'message': 'not found'})
+
+    def do_DELETE(self):
+        segments, _ = self.route()
+        if segments[0] == 'containers':
+            with self.lock:
+                found = self.containers.pop(segments[1], None)
+            return self.reply(204 if found else 404)
+        if segments[0] == 'images':
+            return self.reply(200, [{'Untagged': segments[1]}])
+        return self.reply(404, {'message': 'not found'})
+
+
+def make_git_repo(directory, file_count, file_size=512):
+    os.makedirs(directory)
+    repo = git.Repo.init(directory)
+    line = 'print("benchmark")\n'
+    content = line * max(file_size // len(line), 1)
+    for index in range(file_count):
+        path = os.path.join(directory, f"src/module_{index // 100}/file_{index}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+    repo.git.add(A=True)
+    repo.index.commit('benchmark fixture')
+    return f"file://{directory}"
+
+
+def create_project_files(user, name, file_count, file_size=512):
+    """
+    Bulk inserts a project with `file_count` files, bypassing signals.
+    """
+    project = Project.objects.create(name=name, owner=user)
+    content = 'x = 1\n' * max(file_size // 6, 1)
+    batch = []
+    for index in range(file_count):
+        batch.append(File(project=project, file_path=f"src/module_{index // 100}/file_{index}.py", content=content, extension='.py'))
+        if len(batch) == 5000:
+            File.objects.bulk_create(batch)
+            batch = []
+    File.objects.bulk_create(batch)
+    return project
+
+
+def bench_clone(user, workdir, file_counts):
+    results = []
+    for count in file_counts:
+        url = make_git_repo(os.path.join(workdir, f"repo_{count}"), count)
+        client = APIClient()
+        client.force_authenticate(user)
+        name = f"bench_clone_{count}"
+        duration, _ = timed(lambda: check(client.post('/api/clone-repo/', {'repository_url': url, 'project_name': name}, format='json'), {201}))
+        results.append({
+            'name': 'clone.import',
+            'files': count,
+            'seconds': round(duration, 3),
+            'files_per_second': round(count / duration, 1),
+        })
+    return results
+
+
+def bench_files(user, file_counts, iterations):
+    results = []
+    client = APIClient()
+    client.force_authenticate(user)
+    for count in file_counts:
+        project = create_project_files(user, f"bench_files_{count}", count)
+        base = f"/api/projects/{project.name}"
+        paths = list(File.objects.filter(project=project).values_list('file_path', flat=True)[:1000])
+        list_iterations = max(iterations // max(count // 1000, 1), 3)
+
+        durations = [timed(lambda: check(client.get(f"{base}/files/"), {200}))[0] for _ in range(list_iterations)]
+        results.append(summarize('files.list', durations, files=count))
+        durations = [timed(lambda: check(client.get(f"{base}/tree/"), {200}))[0] for _ in range(iterations)]
+        results.append(summarize('files.tree', durations, files=count))
+        durations = [timed(lambda: check(client.get(f"{base}/files/{random.choice(paths)}/"), {200}))[0] for _ in range(iterations)]
+        results.append(summarize('files.content', durations, files=count))
+    return results
+
+
+def bench_proxy(user, requests_count, concurrency):
+    results = []
+    with Server(UpstreamHandler) as upstream:
+        project = Project.objects.create(name='bench_proxy', owner=user)
+        for cached in (False, True):
+            container = Container.objects.create(
+                project=project, container_id=uuid.uuid4().hex, container_name=f"bench_proxy_{'cached' if cached else 'direct'}",
+                status='running', port=upstream.port, proxy_cache=cached,
+            )
+
+            def request(_):
+                return timed(lambda: check(APIClient().get(f"/proxy/{container.container_name}/static/app.js"), {200}))[0]
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                durations = list(executor.map(request, range(requests_count)))
+            elapsed = time.perf_counter() - started
+            results.append(summarize(
+                'proxy.cached' if cached else 'proxy.direct', durations,
+                concurrency=concurrency, requests_per_second=round(requests_count / elapsed, 1),
+            ))
+    return results
+
+
+def bench_containers(user, cycles):
+    client = APIClient()
+    client.force_authenticate(user)
+    with Server(UpstreamHandler) as upstream, Server(DockerStubHandler) as docker_stub:
+        with override_settings(DIND_URL=f"tcp://127.0.0.1:{docker_stub.port}"):
+            project = Project.objects.create(name='bench_containers', owner=user, build_file_path='Dockerfile')
+            File.objects.create(project=project, file_path='Dockerfile', content='FROM scratch\n', extension='')
+
+            duration, response = timed(lambda: check(client.post('/api/containers/create/', {'project_name': project.name, 'port': upstream.port}, format='json'), {201}))
+            results = [{'name': 'containers.create', 'seconds': round(duration, 3)}]
+            container_id = response.data['container_id']
+
+            starts, stops = [], []
+            for _ in range(cycles):
+                stops.append(timed(lambda: check(client.post(f"/api/containers/{container_id}/stop/"), {200}))[0])
+                starts.append(timed(lambda: check(client.post(f"/api/containers/{container_id}/start/"), {200}))[0])
+            results.append(summarize('containers.stop', stops))
+            results.append(summarize('containers.start', starts))
+    return results
+
+
+def run_benchmarks(user, scenarios, options):
+    """
+    Runs the selected scenarios and returns a flat list of results. Settings
+    that would throttle or slow down the measured paths are relaxed.
+    """
+    workdir = tempfile.mkdtemp(prefix='dockerhosting-bench-')
+    overrides = {
+        'PROXY_UPSTREAM_HOST': '127.0.0.1',
+        'PROXY_CLIENT_RATE': 0,
+        'PROXY_CONTAINER_RATE': 0,
+        'PROXY_MAX_IN_FLIGHT': 0,
+        'REPOS_DIR': os.path.join(workdir, 'repos'),
+        'REPO_CACHE_DIR': os.path.join(workdir, 'repo_cache'),
+        'CLONE_TEMP_DIR': os.path.join(workdir, 'temp_repo'),
+        'CONTAINER_READY_TIMEOUT': 5,
+    }
+    results = []
+    try:
+        with override_settings(**overrides):
+            if 'clone' in scenarios:
+                results.extend(bench_clone(user, workdir, options['clone_files']))
+            if 'files' in scenarios:
+                results.extend(bench_files(user, options['file_counts'], options['iterations']))
+            if 'proxy' in scenarios:
+                results.extend(bench_proxy(user, options['proxy_requests'], options['concurrency']))
+            if 'containers' in scenarios:
+                results.extend(bench_containers(user, options['cycles']))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns messages for results slower than the baseline by more than
+    `threshold` (0.2 = 20%), matched by name and parameters.
+    """
+    def key(result):
+        return (result['name'], result.get('files'), result.get('concurrency'))
+
+    previous = {key(result): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if not old:
+            continue
+        for metric in ('p99_ms', 'mean_ms', 'seconds'):
+            if metric in result and old.get(metric):
+                change = result[metric] / old[metric] - 1
+                if change > threshold:
+                    regressions.append(f"{result['name']} {metric}: {old[metric]} -> {result[metric]} (+{change:.0%})")
+    return regressions
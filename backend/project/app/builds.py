@@ -0,0 +1,342 @@
+# builds.py
+
+import os
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from collections import Counter, deque
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .events import publish
+from .models import Build
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+ACTIVE_STATES = (Build.QUEUED, Build.RUNNING)
+
+# pg_advisory_xact_lock key that serializes dispatching across processes
+DISPATCH_LOCK = 0x6275696C64
+
+
+def release_connection():
+    # Hands the request's connection back (to the pool) before a long wait
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+class BuildJob:
+    def __init__(self, key, user_id, priority, func, description, job_id=None, slots=1):
+        self.id = job_id or uuid.uuid4().hex
+        self.key = key
+        self.user_id = user_id
+        self.priority = priority
+        self.slots = slots  # Build slots granted, the job must not run more builds at once
+        self.func = func  # None for jobs loaded from the database, which may run in another process
+        self.description = description
+        self.state = 'queued'  # queued -> running -> succeeded / failed
+        self.submitted_at = timezone.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.coalesced = 0  # Duplicate requests served by this job
+        self.messages = deque(maxlen=50)
+        self.done = threading.Event()
+
+    @classmethod
+    def from_build(cls, build):
+        job = cls(build.key, build.user_id, build.priority, None, build.description, build.job_id, build.slots)
+        job.load(build)
+        return job
+
+    def load(self, build):
+        self.priority = build.priority
+        self.state = build.state
+        self.submitted_at = build.submitted_at
+        self.started_at = build.started_at
+        self.finished_at = build.finished_at
+        self.coalesced = build.coalesced
+        self.messages = deque(build.messages, maxlen=50)
+        if build.state not in ACTIVE_STATES:
+            self.result = build.result
+            self.error = self.error or build.error or None
+            self.done.set()
+
+    def progress(self, message):
+        logger.info(f"Build {self.id} ({self.description}): {message}")
+        self.messages.append(message)
+        Build.objects.filter(job_id=self.id).update(messages=list(self.messages))
+        self.publish(message)
+
+    def release_slots(self):
+        # The rest of the job does not build, queued builds may take its slots
+        self.slots = 0
+        Build.objects.filter(job_id=self.id).update(slots=0)
+
+    def publish(self, message=None):
+        publish(self.user_id, f"build.{self.state}" if message is None else 'build.progress', {
+            'id': self.id,
+            'description': self.description,
+            'state': self.state,
+            'message': message,
+            'error': str(self.error) if self.error else None,
+        })
+
+    def wait(self, timeout=None):
+        if self.func is not None:
+            return self.done.wait(timeout)
+
+        # Runs in another process, poll its row
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done.is_set():
+            build = Build.objects.filter(job_id=self.id).first()
+            release_connection()
+            if build is None:
+                return False
+            self.load(build)
+            if self.done.is_set():
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(settings.BUILD_POLL_INTERVAL)
+        return True
+
+    def as_dict(self, position=None, estimated_wait=None):
+        now = timezone.now()
+        return {
+            'id': self.id,
+            'description': self.description,
+            'state': self.state,
+            'priority': next(name for name, value in PRIORITIES.items() if value == self.priority),
+            'queue_position': position,
+            'estimated_wait_seconds': estimated_wait,
+            'waited_seconds': round(((self.started_at or now) - self.submitted_at).total_seconds(), 3),
+            'duration_seconds': round(((self.finished_at or now) - self.started_at).total_seconds(), 3) if self.started_at else None,
+            'coalesced_requests': self.coalesced,
+            'messages': list(self.messages),
+            'error': str(self.error) if self.error else None,
+        }
+
+
+class BuildScheduler:
+    """
+    Caps concurrent builds across all backend processes, and per user. Jobs
+    are Build rows: dispatching holds a database lock while it starts queued
+    jobs in priority order, then FIFO, as far as the running ones leave slots.
+    Submitting a key that is queued or running anywhere returns that job.
+
+    A job runs on a thread of the process that submitted it. That process
+    checks for a free slot every BUILD_POLL_INTERVAL seconds and keeps a
+    heartbeat on its jobs, the jobs of a process that died are failed after
+    BUILD_HEARTBEAT_TIMEOUT.
+    """
+
+    def __init__(self, max_concurrent, max_per_user):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.lock = threading.Lock()
+        self.local = {}  # id -> job of this process that is queued or running
+        self.poller = None
+
+    @property
+    def worker(self):
+        # Not cached, gunicorn forks the workers
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def submit(self, key, user_id, func, priority='normal', description='', slots=1):
+        """
+        Returns (job, created). `func` is called with the job on a worker thread
+        once `slots` build slots are free.
+        """
+        priority = PRIORITIES[priority]
+        # Never more than exist, or the job could not start
+        slots = max(1, min(slots, self.max_concurrent))
+        key = hashlib.md5(repr(key).encode()).hexdigest()
+        while True:
+            try:
+                with transaction.atomic():
+                    build = Build.objects.create(
+                        job_id=uuid.uuid4().hex, key=key, user_id=user_id, priority=priority, slots=slots,
+                        description=description[:255], worker=self.worker, heartbeat_at=timezone.now(),
+                    )
+                break
+            except IntegrityError:
+                active = Build.objects.filter(key=key, state__in=ACTIVE_STATES)
+                if not active.update(coalesced=F('coalesced') + 1):
+                    continue  # Finished in the meantime
+                # Dispatching follows the stored priority, raising it moves the job ahead
+                active.filter(state=Build.QUEUED, priority__gt=priority).update(priority=priority)
+                return self.get(active.values_list('job_id', flat=True).first()), False
+
+        job = BuildJob(key, user_id, priority, func, description, build.job_id, build.slots)
+        job.submitted_at = build.submitted_at
+        with self.lock:
+            self.local[job.id] = job
+        self._start_polling()
+        self.dispatch()
+        if job.state == 'queued':
+            job.publish()
+        return job, True
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.local.get(job_id)
+        if job is not None:
+            return job
+        build = Build.objects.filter(job_id=job_id).first() if job_id else None
+        return BuildJob.from_build(build) if build else None
+
+    def user_jobs(self, user_id, limit=200):
+        builds = list(Build.objects.filter(user_id=user_id).order_by('-submitted_at')[:limit])
+        with self.lock:
+            return [self.local.get(build.job_id) or BuildJob.from_build(build) for build in builds]
+
+    def position(self, job):
+        """
+        Zero-based position among queued jobs, None once the job has started.
+        """
+        build = Build.objects.filter(job_id=job.id, state=Build.QUEUED).values('id', 'priority', 'submitted_at').first()
+        if build is None:
+            return None
+        ahead = (
+            Q(priority__lt=build['priority'])
+            | Q(priority=build['priority'], submitted_at__lt=build['submitted_at'])
+            | Q(priority=build['priority'], submitted_at=build['submitted_at'], id__lt=build['id'])
+        )
+        return Build.objects.filter(ahead, state=Build.QUEUED).count()
+
+    def average_duration(self, samples=20):
+        durations = [
+            (finished - started).total_seconds()
+            for started, finished in Build.objects.filter(state=Build.SUCCEEDED, started_at__isnull=False)
+            .order_by('-finished_at').values_list('started_at', 'finished_at')[:samples]
+        ]
+        return sum(durations) / len(durations) if durations else None
+
+    def estimated_wait(self, job):
+        position = self.position(job)
+        average_duration = self.average_duration() if position is not None else None
+        if average_duration is None:
+            return None
+        # Jobs ahead drain through max_concurrent slots
+        return round((position // self.max_concurrent + 1) * average_duration, 1)
+
+    def describe(self, job):
+        # The row has what other processes changed, coalesced requests and progress
+        build = Build.objects.filter(job_id=job.id).first()
+        current = BuildJob.from_build(build) if build else job
+        return current.as_dict(self.position(job), self.estimated_wait(job))
+
+    def dispatch(self):
+        """
+        Starts the queued jobs of this process that are next in line.
+        """
+        started = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [DISPATCH_LOCK])
+            now = timezone.now()
+            # Jobs of a process that stopped heartbeating will never finish
+            Build.objects.filter(
+                state__in=ACTIVE_STATES, heartbeat_at__lt=now - timedelta(seconds=settings.BUILD_HEARTBEAT_TIMEOUT),
+            ).update(state=Build.FAILED, error='The backend process running the build exited.', finished_at=now)
+
+            running = list(Build.objects.filter(state=Build.RUNNING).values_list('user_id', 'slots'))
+            free = self.max_concurrent - sum(slots for _, slots in running)
+            per_user = Counter(user_id for user_id, _ in running)
+            queued = Build.objects.filter(state=Build.QUEUED).order_by('priority', 'submitted_at', 'id').values_list('job_id', 'user_id', 'slots')
+            for job_id, user_id, slots in queued.iterator() if free > 0 else ():
+                if per_user[user_id] >= self.max_per_user:
+                    continue
+                if slots > free:
+                    break  # Smaller jobs behind it must not starve it
+                # Taken here, or kept free for the process that owns the job
+                free -= slots
+                per_user[user_id] += 1
+                with self.lock:
+                    job = self.local.get(job_id)
+                if job is not None and job.state == 'queued':
+                    started.append(job)
+                if free <= 0:
+                    break
+            if started:
+                Build.objects.filter(job_id__in=[job.id for job in started]).update(state=Build.RUNNING, started_at=now, worker=self.worker)
+
+        for job in started:
+            job.state = 'running'
+            job.started_at = now
+            self._start(job)
+
+    def _start(self, job):
+        threading.Thread(target=self._thread, args=(job,), name=f"build-{job.id}", daemon=True).start()
+
+    def _thread(self, job):
+        try:
+            self._run(job)
+        finally:
+            connections.close_all()
+
+    def _run(self, job):
+        job.publish()
+        try:
+            job.result = job.func(job)
+            job.state = 'succeeded'
+        except Exception as e:
+            logger.error(f"Build {job.id} ({job.description}) failed: {str(e)}")
+            job.error = e
+            job.state = 'failed'
+        finally:
+            job.finished_at = timezone.now()
+            try:
+                Build.objects.filter(job_id=job.id).update(
+                    state=job.state, finished_at=job.finished_at, result=job.result,
+                    error=str(job.error) if job.error else '', messages=list(job.messages),
+                )
+                Build.objects.filter(finished_at__lt=job.finished_at - timedelta(days=settings.BUILD_HISTORY_DAYS)).delete()
+            except DatabaseError as e:
+                logger.error(f"Could not store the result of build {job.id}: {str(e)}")
+            job.publish()
+            with self.lock:
+                self.local.pop(job.id, None)
+            job.done.set()
+            try:
+                self.dispatch()
+            except DatabaseError as e:
+                logger.warning(f"Could not dispatch builds: {str(e)}")
+
+    def _start_polling(self):
+        with self.lock:
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(target=self._poll, name='build-scheduler', daemon=True)
+                self.poller.start()
+
+    def _poll(self):
+        # Heartbeats for this process' jobs, and slots freed by other processes
+        while True:
+            time.sleep(settings.BUILD_POLL_INTERVAL)
+            with self.lock:
+                jobs = list(self.local.values())
+            if not jobs:
+                continue
+            try:
+                Build.objects.filter(job_id__in=[job.id for job in jobs]).update(heartbeat_at=timezone.now())
+                if any(job.state == 'queued' for job in jobs):
+                    self.dispatch()
+            except DatabaseError as e:
+                logger.warning(f"Could not update builds: {str(e)}")
+            finally:
+                connections.close_all()
+
+
+build_scheduler = BuildScheduler(
+    max_concurrent=settings.BUILD_MAX_CONCURRENT,
+    max_per_user=settings.BUILD_MAX_PER_USER,
+)
@@ -0,0 +1,51 @@
+# bulk.py
+
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import File
+
+
+def copy_project_files(source_id, target_id, directory=''):
+    """
+    Copies the files of one project into another with a single
+    INSERT ... SELECT, optionally limited to a directory. Returns the row count.
+    """
+    quote = connection.ops.quote_name
+    table = quote(File._meta.db_table)
+    now = timezone.now()
+    sql = (
+        f"INSERT INTO {table} ({quote('project_id')}, {quote('file_path')}, {quote('content')}, {quote('extension')}, "
+        f"{quote('to_host')}, {quote('version')}, {quote('created_at')}, {quote('updated_at')}) "
+        f"SELECT %s, {quote('file_path')}, {quote('content')}, {quote('extension')}, false, 1, %s, %s "
+        f"FROM {table} WHERE {quote('project_id')} = %s"
+    )
+    params = [target_id, now, now, source_id]
+    if directory:
+        escaped = directory.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        sql += f" AND {quote('file_path')} LIKE %s"
+        params.append(f"{escaped}/%")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def delete_project_files(project_id, batch_size=5000):
+    """
+    Deletes a project's files with plain DELETE statements in batches, each in
+    its own transaction, without loading rows or sending per-row signals.
+    Returns the number of deleted rows.
+    """
+    quote = connection.ops.quote_name
+    table = quote(File._meta.db_table)
+    sql = (
+        f"DELETE FROM {table} WHERE {quote('id')} IN "
+        f"(SELECT {quote('id')} FROM {table} WHERE {quote('project_id')} = %s LIMIT %s)"
+    )
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [project_id, batch_size])
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
@@ -0,0 +1,78 @@
+# changes.py
+
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Project, FileChange
+
+logger = logging.getLogger(__name__)
+
+
+def record_file_changes(project_id, changes):
+    """
+    Appends (file_path, operation) pairs to the project's change feed. Sequence
+    numbers are reserved by incrementing Project.change_seq, and the row lock
+    is held until the entries are written so readers never observe gaps.
+    """
+    if not changes:
+        return
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote(Project._meta.db_table)} SET {quote('change_seq')} = {quote('change_seq')} + %s "
+                f"WHERE {quote('id')} = %s RETURNING {quote('change_seq')}",
+                [len(changes), project_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return
+        first = row[0] - len(changes) + 1
+        FileChange.objects.bulk_create([
+            FileChange(project_id=project_id, seq=first + offset, file_path=file_path, operation=operation)
+            for offset, (file_path, operation) in enumerate(changes)
+        ], batch_size=1000)
+
+    # Compact now and then instead of on every write
+    interval = settings.FILE_CHANGES_COMPACT_INTERVAL
+    if (first - 1) // interval != row[0] // interval:
+        transaction.on_commit(lambda: compact_file_changes(project_id))
+
+
+def compact_file_changes(project_id, tombstone_retention=None):
+    """
+    Drops entries superseded by a newer entry for the same path, which never
+    changes what a client ends up with. Deletion markers older than the
+    retention are dropped too and raise the project's change floor, clients
+    behind it have to reload the file list.
+    """
+    quote = connection.ops.quote_name
+    table = quote(FileChange._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {quote('project_id')} = %s AND EXISTS ("
+            f"SELECT 1 FROM {table} newer WHERE newer.{quote('project_id')} = {table}.{quote('project_id')} "
+            f"AND newer.{quote('file_path')} = {table}.{quote('file_path')} AND newer.{quote('seq')} > {table}.{quote('seq')})",
+            [project_id],
+        )
+        superseded = cursor.rowcount
+
+    if tombstone_retention is None:
+        tombstone_retention = timedelta(days=settings.FILE_CHANGES_TOMBSTONE_DAYS)
+    with transaction.atomic():
+        tombstones = FileChange.objects.filter(
+            project_id=project_id,
+            operation=FileChange.DELETED,
+            created_at__lt=timezone.now() - tombstone_retention,
+        )
+        floor = tombstones.aggregate(floor=Max('seq'))['floor']
+        expired = 0
+        if floor is not None:
+            Project.objects.filter(pk=project_id, change_floor__lt=floor).update(change_floor=floor)
+            expired, _ = tombstones.delete()
+
+    logger.info(f"Compacted change feed of project {project_id}: {superseded} superseded, {expired} expired entries removed.")
+    return superseded + expired
@@ -0,0 +1,254 @@
+# compose.py
+
+import os
+import posixpath
+import logging
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .models import File, Container
+from .health import mark_started, mark_starting, wait_until_ready
+from . import metrics
+from .docker_utils import (
+    get_docker_client, prepare_build_context, remove_docker_container,
+    service_image_tag, project_network_name,
+)
+
+logger = logging.getLogger(__name__)
+
+COMPOSE_FILE_NAMES = {'docker-compose.yml', 'docker-compose.yaml', 'compose.yml', 'compose.yaml'}
+
+
+class ComposeError(ValueError):
+    pass
+
+
+def is_compose_file(file_path):
+    return posixpath.basename(file_path) in COMPOSE_FILE_NAMES
+
+
+def _parse_ports(service_name, ports):
+    """
+    Returns the docker `ports` mapping and the first published host port.
+    """
+    mapping = {}
+    published = None
+    for entry in ports or []:
+        if isinstance(entry, dict):
+            target, host = entry.get('target'), entry.get('published')
+            protocol = entry.get('protocol', 'tcp')
+        else:
+            spec, _, protocol = str(entry).partition('/')
+            protocol = protocol or 'tcp'
+            parts = spec.split(':')
+            # [ip:]host:container or just container
+            target, host = parts[-1], parts[-2] if len(parts) > 1 else None
+        try:
+            target = int(target)
+            host = int(host) if host not in (None, '') else None
+        except (TypeError, ValueError):
+            raise ComposeError(f"Service '{service_name}' has an unsupported port entry: {entry}")
+        mapping[f"{target}/{protocol}"] = host
+        if published is None and host is not None:
+            published = host
+    return mapping, published
+
+
+def _parse_depends_on(service_name, depends_on):
+    if depends_on is None:
+        return []
+    if isinstance(depends_on, dict):
+        return list(depends_on)
+    if isinstance(depends_on, list):
+        return [str(name) for name in depends_on]
+    raise ComposeError(f"Service '{service_name}' has an invalid depends_on entry.")
+
+
+def load_compose(project, compose_path):
+    """
+    Reads a compose file from the project and returns its services as
+    {name: {...}} with build context, image, ports and dependencies resolved.
+    Only the keys needed to run a service against dind are supported.
+    """
+    content = File.objects.filter(project=project, file_path=compose_path).values_list('content', flat=True).first()
+    if content is None:
+        raise ComposeError(f"Compose file '{compose_path}' not found in project.")
+    try:
+        document = yaml.safe_load(content) or {}
+    except yaml.YAMLError as e:
+        raise ComposeError(f'Invalid compose file: {e}')
+    if not isinstance(document, dict) or not isinstance(document.get('services'), dict) or not document['services']:
+        raise ComposeError('Compose file defines no services.')
+
+    base_dir = posixpath.dirname(compose_path)
+    services = {}
+    for name, spec in document['services'].items():
+        name = str(name)
+        spec = spec or {}
+        if not isinstance(spec, dict):
+            raise ComposeError(f"Service '{name}' must be a mapping.")
+
+        build = spec.get('build')
+        if isinstance(build, str):
+            build = {'context': build}
+        if build is not None:
+            if not isinstance(build, dict):
+                raise ComposeError(f"Service '{name}' has an invalid build entry.")
+            context = posixpath.normpath(posixpath.join(base_dir, build.get('context', '.')))
+            if context.startswith('..'):
+                raise ComposeError(f"Build context of service '{name}' is outside the project.")
+            build = {
+                'context': '' if context == '.' else context,
+                'dockerfile': build.get('dockerfile', 'Dockerfile'),
+                'args': build.get('args') or {},
+            }
+        elif not spec.get('image'):
+            raise ComposeError(f"Service '{name}' needs either build or image.")
+
+        ports, published = _parse_ports(name, spec.get('ports'))
+        services[name] = {
+            'build': build,
+            'image': spec.get('image'),
+            'command': spec.get('command'),
+            'environment': spec.get('environment') or {},
+            'ports': ports,
+            'published_port': published,
+            'depends_on': _parse_depends_on(name, spec.get('depends_on')),
+        }
+
+    for name, service in services.items():
+        for dependency in service['depends_on']:
+            if dependency not in services:
+                raise ComposeError(f"Service '{name}' depends on unknown service '{dependency}'.")
+    start_order(services)
+    return services
+
+
+def start_order(services):
+    """
+    Groups services into levels that only depend on earlier levels.
+    """
+    remaining = {name: set(service['depends_on']) for name, service in services.items()}
+    levels = []
+    started = set()
+    while remaining:
+        level = sorted(name for name, dependencies in remaining.items() if dependencies <= started)
+        if not level:
+            raise ComposeError(f"Circular depends_on between services: {', '.join(sorted(remaining))}.")
+        levels.append(level)
+        started.update(level)
+        for name in level:
+            del remaining[name]
+    return levels
+
+
+def build_slots(services):
+    """
+    Build slots a deployment of `services` takes: its images build in parallel.
+    """
+    builds = sum(1 for service in services.values() if service['build'] is not None)
+    return max(1, min(builds, settings.COMPOSE_BUILD_WORKERS))
+
+
+def _build_service(client, project_name, service_name, service):
+    if service['build'] is None:
+        logger.info(f"Pulling image {service['image']} for service {service_name}")
+        client.images.pull(service['image'])
+        return service['image']
+
+    build = service['build']
+    tag = service_image_tag(project_name, service_name)
+    logger.info(f"Building image {tag} from {build['context'] or '.'}/{build['dockerfile']}")
+    with metrics.DOCKER_SECONDS.time(operation='build'):
+        image, build_logs = client.images.build(
+            path=os.path.join(settings.REPOS_DIR, project_name, build['context']),
+            dockerfile=build['dockerfile'],
+            buildargs={str(key): str(value) for key, value in build['args'].items()} if isinstance(build['args'], dict) else None,
+            tag=tag,
+            nocache=True,
+        )
+    for log in build_logs:
+        logger.info(log)
+    return tag
+
+
+def deploy_compose(project, services, job):
+    """
+    Builds every service in parallel, then starts the containers in
+    depends_on order on a per-project network where each service is reachable
+    by its name. Returns the started containers.
+    """
+    project_name = project.name
+    job.progress('Copying files to the build context')
+    prepare_build_context(project)
+
+    client = get_docker_client()
+
+    job.progress(f"Building {len(services)} services")
+    # As many builds at once as the scheduler granted slots for
+    with ThreadPoolExecutor(max_workers=job.slots) as executor:
+        futures = {
+            name: executor.submit(_build_service, client, project_name, name, service)
+            for name, service in services.items()
+        }
+        images = {}
+        errors = []
+        for name, future in futures.items():
+            try:
+                images[name] = future.result()
+                job.progress(f"Service {name} built")
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+    if errors:
+        raise ComposeError(f"Building services failed: {'; '.join(errors)}")
+    # Nothing is built from here on, waiting for the services must not hold build slots
+    job.release_slots()
+
+    network_name = project_network_name(project_name)
+    if not client.networks.list(names=[network_name]):
+        client.networks.create(network_name, driver='bridge')
+
+    # Replace containers left over from a previous deployment of these services
+    for existing in Container.objects.filter(project=project, service_name__in=list(services)):
+        remove_docker_container(client, existing.container_id)
+        existing.delete()
+
+    started = []
+    for level in start_order(services):
+        level_containers = []
+        for name in level:
+            service = services[name]
+            container_name = f"{project_name}_{name}_container"
+            job.progress(f"Starting service {name}")
+            container = client.containers.run(
+                image=images[name],
+                command=service['command'],
+                environment=service['environment'],
+                ports=service['ports'],
+                name=container_name,
+                detach=True,
+                network=network_name,
+                networking_config={
+                    network_name: client.api.create_endpoint_config(aliases=[name]),
+                },
+            )
+            level_containers.append(Container.objects.create(
+                project=project,
+                container_id=container.id,
+                container_name=container_name,
+                service_name=name,
+                status='running',
+                port=service['published_port'] or 0,  # 0: not published, unreachable through the proxy
+            ))
+            started.append({'service': name, 'container_id': container.id, 'container_name': container_name})
+        # Dependents start once the published services they depend on answer
+        level_ids = [container_record.container_id for container_record in level_containers]
+        mark_starting(level_ids)
+        with ThreadPoolExecutor(max_workers=len(level_containers)) as executor:
+            ready = dict(zip(level, executor.map(wait_until_ready, level_containers)))
+        mark_started(level_ids)
+        for name, container_record in zip(level, level_containers):
+            if container_record.port and not ready[name]:
+                job.progress(f"Service {name} did not become ready within {settings.CONTAINER_READY_TIMEOUT} seconds")
+    job.progress('All services started')
+    return started
@@ -0,0 +1,156 @@
+# docker_gc.py
+
+import time
+import fcntl
+import logging
+import threading
+import docker
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+from .models import Container
+from .docker_utils import get_docker_client
+
+logger = logging.getLogger(__name__)
+
+
+def _is_project_image(tag):
+    # <project>_image or <project>_<service>_image, see docker_utils
+    return tag.split(':', 1)[0].endswith('_image')
+
+
+def _untracked_stopped_containers(client):
+    tracked = set(Container.objects.values_list('container_id', flat=True))
+    for container in client.api.containers(all=True, size=True, filters={'status': 'exited'}):
+        if container['Id'] not in tracked:
+            yield container
+
+
+def _eviction_candidates(client, images):
+    """
+    Project images not used by any container, least recently used first. Use
+    is the last change of a Container row built from the image, falling back
+    to the image creation time.
+    """
+    in_use = {container['ImageID'] for container in client.api.containers(all=True)}
+    # Images of containers recorded as running are kept even if Docker disagrees
+    for container_id in Container.objects.filter(status='running').values_list('container_id', flat=True):
+        try:
+            in_use.add(client.api.inspect_container(container_id)['Image'])
+        except docker.errors.NotFound:
+            pass
+
+    last_used = {}
+    rows = Container.objects.values('project__name', 'service_name').annotate(last_used=Max('updated_at'))
+    for row in rows:
+        name = f"{row['project__name']}_{row['service_name']}_image" if row['service_name'] else f"{row['project__name']}_image"
+        last_used[name] = row['last_used'].timestamp()
+
+    candidates = []
+    for image in images:
+        tags = [tag for tag in image.get('RepoTags') or [] if _is_project_image(tag)]
+        if not tags or image['Id'] in in_use:
+            continue
+        used = max((last_used.get(tag.split(':', 1)[0], 0) for tag in tags), default=0) or image['Created']
+        # Layers shared with other images are not freed
+        reclaimable = image['Size'] - max(image.get('SharedSize', 0), 0)
+        candidates.append((used, image['Id'], tags, reclaimable))
+    candidates.sort()
+    return candidates
+
+
+def collect_garbage(budget_bytes=None, dry_run=False):
+    """
+    Removes stopped containers without a Container row, dangling images and
+    the build cache, then evicts unused project images (least recently used
+    first) until image storage fits in `budget_bytes`. Returns a report with
+    the reclaimed bytes.
+    """
+    if budget_bytes is None:
+        budget_bytes = settings.DOCKER_IMAGE_BUDGET_BYTES
+    client = get_docker_client()
+    report = {
+        'containers_removed': 0,
+        'dangling_images_removed': 0,
+        'build_cache_removed': 0,
+        'images_evicted': [],
+        'reclaimed_bytes': 0,
+        'dry_run': dry_run,
+    }
+
+    for container in _untracked_stopped_containers(client):
+        if not dry_run:
+            try:
+                client.api.remove_container(container['Id'], v=True)
+            except docker.errors.NotFound:
+                continue
+        report['containers_removed'] += 1
+        report['reclaimed_bytes'] += container.get('SizeRw') or 0
+
+    usage = client.df()
+    if dry_run:
+        dangling = [image for image in usage.get('Images') or [] if not image.get('RepoTags') or image['RepoTags'] == ['<none>:<none>']]
+        report['dangling_images_removed'] = len(dangling)
+        report['reclaimed_bytes'] += sum(image['Size'] for image in dangling)
+        unused_cache = [entry for entry in usage.get('BuildCache') or [] if not entry.get('InUse')]
+        report['build_cache_removed'] = len(unused_cache)
+        report['reclaimed_bytes'] += sum(entry.get('Size', 0) for entry in unused_cache)
+    else:
+        pruned = client.images.prune(filters={'dangling': True})
+        report['dangling_images_removed'] = len(pruned.get('ImagesDeleted') or [])
+        report['reclaimed_bytes'] += pruned.get('SpaceReclaimed') or 0
+        pruned = client.images.prune_builds()
+        report['build_cache_removed'] = len(pruned.get('CachesDeleted') or [])
+        report['reclaimed_bytes'] += pruned.get('SpaceReclaimed') or 0
+        usage = client.df()
+
+    images_size = usage.get('LayersSize') or 0
+    for _, image_id, tags, reclaimable in _eviction_candidates(client, usage.get('Images') or []):
+        if images_size <= budget_bytes:
+            break
+        if not dry_run:
+            try:
+                client.images.remove(image=image_id, noprune=False)
+            except docker.errors.APIError as e:
+                # Raced with a new container or build
+                logger.warning(f"Could not evict image {', '.join(tags)}: {str(e)}")
+                continue
+        report['images_evicted'].extend(tags)
+        report['reclaimed_bytes'] += reclaimable
+        images_size -= reclaimable
+
+    report['images_bytes'] = images_size
+    logger.info(
+        f"Docker GC{' (dry run)' if dry_run else ''}: {report['containers_removed']} containers, "
+        f"{report['dangling_images_removed']} dangling images, {report['build_cache_removed']} cache entries, "
+        f"{len(report['images_evicted'])} project images, {report['reclaimed_bytes']} bytes reclaimed."
+    )
+    return report
+
+
+def _run_periodically(interval):
+    while True:
+        time.sleep(interval)
+        # Several backend processes share one daemon, only one collects at a time
+        with open(settings.DOCKER_GC_LOCK_FILE, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                collect_garbage()
+            except Exception as e:
+                logger.error(f"Docker GC failed: {str(e)}")
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                connections.close_all()
+
+
+def start_periodic_gc():
+    interval = settings.DOCKER_GC_INTERVAL
+    if not interval or not settings.DIND_URL:
+        return None
+    thread = threading.Thread(target=_run_periodically, args=(interval,), name='docker-gc', daemon=True)
+    thread.start()
+    logger.info(f"Docker GC scheduled every {interval} seconds.")
+    return thread
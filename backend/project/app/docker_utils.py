@@ -0,0 +1,157 @@
+# docker_utils.py
+
+import os
+import logging
+import docker
+from django.conf import settings
+from .models import File, Container
+from .signals import sync_file_to_host
+from .health import probe_readiness
+from . import metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+
+def get_docker_client(max_pool_size=None):
+    if max_pool_size:
+        # One pooled connection per worker thread sharing the client
+        client = docker.DockerClient(base_url=settings.DIND_URL, max_pool_size=max_pool_size)
+    else:
+        client = docker.DockerClient(base_url=settings.DIND_URL)
+    client.api.hooks['response'].extend([metrics.record_docker_response, profiling.record_docker_response])
+    return client
+
+
+def project_image_tag(project_name):
+    return f"{project_name}_image"
+
+
+def service_image_tag(project_name, service_name):
+    return f"{project_name}_{service_name}_image"
+
+
+def project_network_name(project_name):
+    return f"{project_name}_network"
+
+
+def remove_docker_container(client, container_id):
+    """
+    Stops and removes a container along with its volumes.
+    Returns False when the container no longer exists.
+    """
+    try:
+        docker_container = client.containers.get(container_id)
+    except docker.errors.NotFound:
+        logger.warning(f"Docker container with ID {container_id} not found. Continuing cleanup.")
+        return False
+
+    # Stop the container if it is running.
+    if docker_container.status == 'running':
+        logger.info(f"Stopping container {container_id}")
+        docker_container.stop()
+    # Remove the container along with its volumes.
+    docker_container.remove(v=True, force=True)
+    logger.info(f"Container {container_id} removed successfully.")
+    return True
+
+
+def apply_container_action(client, container_id, action, stop_timeout=None):
+    """
+    Runs start/stop/restart/delete on one container and returns its new
+    Docker status ('removed' after delete, 'missing' if it no longer exists).
+    """
+    if action == 'delete':
+        return 'removed' if remove_docker_container(client, container_id) else 'missing'
+    try:
+        docker_container = client.containers.get(container_id)
+    except docker.errors.NotFound:
+        return 'missing'
+    timeout = {} if stop_timeout is None else {'timeout': stop_timeout}
+    if action == 'start':
+        docker_container.start()
+    elif action == 'stop':
+        docker_container.stop(**timeout)
+    elif action == 'restart':
+        docker_container.restart(**timeout)
+    docker_container.reload()
+    return docker_container.attrs['State']['Status']
+
+
+def remove_project_image(client, project_name, service_name=''):
+    image_tag = service_image_tag(project_name, service_name) if service_name else project_image_tag(project_name)
+    try:
+        client.images.remove(image=image_tag, force=True)
+        logger.info(f"Image {image_tag} removed successfully.")
+        return True
+    except docker.errors.ImageNotFound:
+        logger.warning(f"Image {image_tag} not found. It may have already been removed.")
+        return False
+
+
+def remove_project_network(client, project_name):
+    for network in client.networks.list(names=[project_network_name(project_name)]):
+        network.remove()
+        logger.info(f"Network {network.name} removed successfully.")
+
+
+def prepare_build_context(project):
+    """
+    Marks all project files as hosted and writes them into REPOS_DIR/<project>.
+    """
+    File.objects.filter(project=project).update(to_host=True)
+    files = File.objects.filter(project=project).values_list('file_path', 'content')
+    for file_path, content in files.iterator(chunk_size=200):
+        sync_file_to_host(project.name, file_path, content, True)
+
+
+def deploy_project(project, build_file_path, port, job, health_check_path=''):
+    """
+    Builds the project image and starts its container. Runs as a build job.
+    """
+    project_name = project.name
+    job.progress('Copying files to the build context')
+    prepare_build_context(project)
+
+    logger.info(f"Building image for project {project_name} using Dockerfile: {build_file_path}")
+
+    client = get_docker_client()
+
+    build_context_path = os.path.join(settings.REPOS_DIR, project_name)
+    dockerfile_path = f"{build_context_path}/{build_file_path}"
+
+    logger.info(f"Path to dockerfile: {dockerfile_path}")
+
+    # Always rebuild the image without cache
+    job.progress('Building image')
+    with metrics.DOCKER_SECONDS.time(operation='build'):
+        image, build_logs = client.images.build(
+            path=build_context_path,
+            dockerfile=dockerfile_path,
+            tag=project_image_tag(project_name),
+            nocache=True
+        )
+    for log in build_logs:
+        logger.info(log)
+
+    container_name = f"{project_name}_container"
+
+    job.progress('Starting container')
+    container = client.containers.run(
+        image=project_image_tag(project_name),
+        detach=True,
+        ports={f"{port}/tcp": port},
+        name=container_name
+    )
+
+    container_record = Container.objects.create(
+        project=project,
+        container_id=container.id,
+        container_name=container_name,
+        status='running',
+        port=port,
+        health_check_path=health_check_path,
+    )
+    # The build slot is freed while the container boots, readiness arrives as an event
+    job.progress('Container started, checking readiness in the background')
+    probe_readiness(container_record, job.user_id, project_name)
+    return container.id
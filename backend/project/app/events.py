@@ -0,0 +1,170 @@
+# events.py
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import psycopg
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class EventBroker:
+    """
+    Fans events out to the event streams open in this process. With Postgres,
+    events travel through NOTIFY on EVENTS_CHANNEL and one listener thread per
+    process receives every event, so streams see events published by any
+    worker. Other databases deliver within the publishing process only.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)  # user id -> {(loop, queue)}
+        self.listener = None
+        self.listening = threading.Event()  # Set while LISTEN is active
+        self.stopping = threading.Event()
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """
+        Registers an asyncio queue for the user's events on the running loop.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self.lock:
+            self.subscribers[user_id].add(subscriber)
+        self._ensure_listener()
+        try:
+            yield subscriber[1]
+        finally:
+            with self.lock:
+                self.subscribers[user_id].discard(subscriber)
+                if not self.subscribers[user_id]:
+                    del self.subscribers[user_id]
+
+    def deliver(self, user_id, message):
+        with self.lock:
+            targets = list(self.subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, message)
+            except RuntimeError:
+                pass  # Loop already closed, the subscriber is going away
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            # A slow client lost events, it has to reload its lists
+            while not queue.empty():
+                queue.get_nowait()
+            message = {'event': 'resync', 'data': {}}
+        queue.put_nowait(message)
+
+    def _ensure_listener(self):
+        if connection.vendor != 'postgresql':
+            return
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+                self.listener.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the listener thread, which closes its database connection.
+        """
+        with self.lock:
+            listener, self.listener = self.listener, None
+        if listener is not None:
+            self.stopping.set()
+            listener.join(timeout)
+            self.stopping.clear()
+
+    def _listen(self):
+        database = settings.DATABASES['default']
+        conninfo = psycopg.conninfo.make_conninfo(
+            dbname=database['NAME'], user=database['USER'], password=database['PASSWORD'],
+            host=database['HOST'], port=database['PORT'],
+        )
+        delay = 1
+        while not self.stopping.is_set():
+            try:
+                with psycopg.connect(conninfo, autocommit=True) as listener:
+                    listener.execute(f"LISTEN {settings.EVENTS_CHANNEL}")
+                    self.listening.set()
+                    delay = 1
+                    while not self.stopping.is_set():
+                        # Wakes up every second to notice stop()
+                        for notify in listener.notifies(timeout=1):
+                            message = json.loads(notify.payload)
+                            self.deliver(message.pop('user'), message)
+            except Exception as e:
+                logger.error(f"Event listener disconnected: {str(e)}")
+                self.listening.clear()
+                self.stopping.wait(delay)
+                delay = min(delay * 2, 30)
+        self.listening.clear()
+
+
+broker = EventBroker()
+
+
+def publish(user_id, event, data):
+    """
+    Sends an event to the user's streams once the current transaction commits.
+    Keep `data` small, NOTIFY payloads are limited to 8000 bytes.
+    """
+    message = {'user': user_id, 'event': event, 'data': data}
+
+    def send():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [settings.EVENTS_CHANNEL, json.dumps(message, default=str)])
+        else:
+            broker.deliver(message.pop('user'), message)
+
+    # Events are best effort and never fail the change that caused them
+    transaction.on_commit(send, robust=True)
+
+
+def container_event_data(container, project_name=None):
+    return {
+        'container_id': container.container_id,
+        'container_name': container.container_name,
+        'service_name': container.service_name,
+        'project': project_name,
+        'status': container.status,
+    }
+
+
+TICKET_SALT = 'project.app.events.ticket'
+
+
+def issue_stream_ticket(user_id):
+    """
+    A signed ticket that opens one event stream within EVENTS_TICKET_TTL
+    seconds. EventSource cannot send headers, the ticket goes into the URL
+    (and access logs) instead of the access token.
+    """
+    return signing.dumps({'user': user_id, 'nonce': uuid.uuid4().hex}, salt=TICKET_SALT)
+
+
+async def redeem_stream_ticket(ticket):
+    """
+    Returns the ticket's user id, None when it is invalid, expired or used.
+    """
+    try:
+        data = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.EVENTS_TICKET_TTL)
+    except signing.BadSignature:
+        return None
+    # Single use across workers: the first add() of the nonce wins
+    if not await caches[settings.EVENTS_TICKET_CACHE].aadd(f"events:ticket:{data['nonce']}", True, timeout=settings.EVENTS_TICKET_TTL):
+        return None
+    return data['user']
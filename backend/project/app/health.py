@@ -0,0 +1,214 @@
+# health.py
+
+import math
+import time
+import socket
+import logging
+import threading
+import requests
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from .models import Container
+from .events import publish, container_event_data
+
+logger = logging.getLogger(__name__)
+
+
+def upstream_url(port, path=''):
+    return f"http://{settings.PROXY_UPSTREAM_HOST}:{port}/{path.lstrip('/')}"
+
+
+def probe(container):
+    """
+    HTTP GET of the container's health check path (any status below 500
+    passes) or a TCP connect when no path is set. Returns (healthy, detail).
+    """
+    timeout = settings.HEALTH_CHECK_TIMEOUT
+    if container.health_check_path:
+        try:
+            response = requests.get(upstream_url(container.port, container.health_check_path), timeout=timeout, allow_redirects=False)
+        except requests.RequestException as e:
+            return False, str(e)
+        return response.status_code < 500, f"HTTP {response.status_code}"
+    try:
+        with socket.create_connection((settings.PROXY_UPSTREAM_HOST, container.port), timeout=timeout):
+            return True, 'TCP connect'
+    except OSError as e:
+        return False, str(e)
+
+
+def mark_starting(container_ids):
+    """
+    Holds the containers back while their readiness checks run: the proxy of
+    every worker answers 503 until mark_started() or the deadline passes.
+    """
+    starting_until = timezone.now() + timedelta(seconds=settings.CONTAINER_READY_TIMEOUT + settings.HEALTH_CHECK_TIMEOUT)
+    Container.objects.filter(container_id__in=container_ids).update(starting_until=starting_until)
+
+
+def mark_started(container_ids):
+    Container.objects.filter(container_id__in=container_ids).update(starting_until=None)
+
+
+def is_starting(container):
+    return container.starting_until is not None and container.starting_until > timezone.now()
+
+
+def wait_until_ready(container, timeout=None):
+    """
+    Probes with backoff until the container answers or `timeout` passes.
+    Callers hold the container back with mark_starting() in the meantime.
+    """
+    if not container.port:
+        return False
+    timeout = settings.CONTAINER_READY_TIMEOUT if timeout is None else timeout
+    breaker = get_breaker(container.container_id)
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        healthy, detail = probe(container)
+        if healthy:
+            breaker.record_success()
+            return True
+        if time.monotonic() + delay > deadline:
+            logger.warning(f"Container {container.container_name} not ready after {timeout}s: {detail}")
+            breaker.record_failure()
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 2)
+
+
+def probe_readiness(container, user_id, project_name=None):
+    """
+    wait_until_ready on a thread, so a request that started the container
+    can answer right away. The proxy holds the container back as starting
+    until then, the owner's event streams get container.ready or
+    container.not_ready.
+    """
+    mark_starting([container.container_id])
+
+    def run():
+        try:
+            ready = wait_until_ready(container)
+            mark_started([container.container_id])
+            publish(user_id, 'container.ready' if ready else 'container.not_ready', container_event_data(container, project_name))
+        except Exception as e:
+            logger.error(f"Readiness check of {container.container_name} failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name=f"ready-{container.container_id[:12]}", daemon=True)
+    thread.start()
+    return thread
+
+
+class CircuitBreaker:
+    """
+    Closed: requests pass. After `failure_threshold` consecutive failures it
+    opens and rejects requests for `reset_timeout` seconds, then lets a single
+    trial request through (half open) that closes or re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def allow(self):
+        """
+        Returns (allowed, retry_after_seconds).
+        """
+        with self.lock:
+            if self.state == 'closed':
+                return True, None
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return False, math.ceil(remaining)
+            if self.trial_running:
+                return False, 1
+            self.state = 'half_open'
+            self.trial_running = True
+            return True, None
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+# Per process, keyed by container id
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(container_id):
+    with _breakers_lock:
+        breaker = _breakers.get(container_id)
+        if breaker is None:
+            breaker = _breakers[container_id] = CircuitBreaker(
+                container_id, settings.CIRCUIT_BREAKER_FAILURES, settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+            )
+        return breaker
+
+
+def forget_breaker(container_id):
+    with _breakers_lock:
+        _breakers.pop(container_id, None)
+
+
+def check_running_containers():
+    """
+    One round of active health checks over all running containers.
+    """
+    # Starting containers are being probed by their readiness check
+    containers = (Container.objects.filter(status='running', port__gt=0).exclude(starting_until__gt=timezone.now())
+                  .only('container_id', 'container_name', 'port', 'health_check_path'))
+    unhealthy = 0
+    for container in containers:
+        breaker = get_breaker(container.container_id)
+        healthy, detail = probe(container)
+        if healthy:
+            breaker.record_success()
+        else:
+            unhealthy += 1
+            logger.info(f"Health check of {container.container_name} failed: {detail}")
+            breaker.record_failure()
+    return unhealthy
+
+
+def _run_periodically(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            check_running_containers()
+        except Exception as e:
+            logger.error(f"Health checks failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def start_health_checks():
+    interval = settings.HEALTH_CHECK_INTERVAL
+    if not interval:
+        return None
+    thread = threading.Thread(target=_run_periodically, args=(interval,), name='health-checks', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,44 @@
+# listings.py
+
+import uuid
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _version_key(user_id):
+    return f"listings:{user_id}:version"
+
+
+def _version(cache, user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Never fall back to a fixed version, entries cached under it could be stale
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def cached_listing(user_id, name, params, load):
+    """
+    Returns the user's listing `name` for `params` from LISTING_CACHE, calling
+    `load()` on a miss. Entries are keyed by a per-user version, so one
+    invalidate_listings() call drops all of the user's listings at once.
+    """
+    cache = caches[settings.LISTING_CACHE]
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    key = f"listings:{user_id}:{_version(cache, user_id)}:{name}:{digest}"
+    data = cache.get(key)
+    if data is None:
+        data = load()
+        cache.set(key, data, timeout=settings.LISTING_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_listings(user_id):
+    def bump():
+        caches[settings.LISTING_CACHE].set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+    # After commit, or a request in between could cache the old rows under the new version
+    transaction.on_commit(bump, robust=True)
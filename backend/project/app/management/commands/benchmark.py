@@ -0,0 +1,80 @@
+import json
+import platform
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from project.app.benchmarks import run_benchmarks, compare
+
+SCENARIOS = ('clone', 'files', 'proxy', 'containers')
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks repository import, file listing and content, the container proxy and container '
+        'start/stop against a throwaway test database, local file:// repositories and a stub Docker API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run ({', '.join(SCENARIOS)}), all when omitted")
+        parser.add_argument('--file-counts', type=int_list, default=[1000, 10000, 100000], help='Project sizes for the file scenarios')
+        parser.add_argument('--clone-files', type=int_list, default=[100, 1000], help='Repository sizes for the clone scenario')
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per file endpoint and size')
+        parser.add_argument('--proxy-requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent proxy clients')
+        parser.add_argument('--cycles', type=int, default=20, help='Container stop/start cycles')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+        parser.add_argument('--baseline', help='Results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown against the baseline (0.2 = 20%%)')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or SCENARIOS
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            User.objects.filter(username='benchmark').delete()
+            user = User.objects.create_user('benchmark', password=None)
+            started = timezone.now()
+            results = run_benchmarks(user, scenarios, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'started_at': started.isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'scenarios': list(scenarios),
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+            self.stderr.write(f"Results written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                regressions = compare(results, json.load(file), options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f"{len(regressions)} benchmark regressions against {options['baseline']}.")
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline.'))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from project.app.changes import compact_file_changes
+from project.app.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Compacts the file change feed of all (or the given) projects.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('projects', nargs='*', help='Project names, all projects when omitted')
+        parser.add_argument('--tombstone-days', type=int, default=None,
+                            help='Keep deletion markers for this many days (default: FILE_CHANGES_TOMBSTONE_DAYS)')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['projects']:
+            projects = projects.filter(name__in=options['projects'])
+        retention = timedelta(days=options['tombstone_days']) if options['tombstone_days'] is not None else None
+
+        total = 0
+        for project_id, name in projects.values_list('id', 'name'):
+            removed = compact_file_changes(project_id, retention)
+            total += removed
+            self.stdout.write(f"{name}: removed {removed} entries")
+        self.stdout.write(self.style.SUCCESS(f"Removed {total} change feed entries."))
@@ -0,0 +1,31 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from project.app.docker_gc import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Prunes stopped containers, dangling images and build cache on the dind daemon and evicts unused project images over the budget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, default=None,
+                            help='Image storage budget in bytes (default: DOCKER_IMAGE_BUDGET_BYTES)')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed without removing it')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        budget = options['budget'] if options['budget'] is not None else settings.DOCKER_IMAGE_BUDGET_BYTES
+        report = collect_garbage(budget_bytes=budget, dry_run=options['dry_run'])
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        for tag in report['images_evicted']:
+            self.stdout.write(f"Evicted {tag}")
+        self.stdout.write(
+            f"{report['containers_removed']} stopped containers, {report['dangling_images_removed']} dangling images, "
+            f"{report['build_cache_removed']} build cache entries removed."
+        )
+        self.stdout.write(f"Project images use {report['images_bytes']} of {budget} bytes.")
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {report['reclaimed_bytes']} bytes."))
@@ -0,0 +1,281 @@
+# metrics.py
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.lock = registry.lock
+        self.samples = {}
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def merge(self, current, other):
+        return current + other
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                # Per bucket counts (not cumulative), then sum and count
+                sample = self.samples[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[index] += 1
+                    break
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def merge(self, current, other):
+        return [a + b for a, b in zip(current, other)]
+
+
+class Registry:
+    """
+    Metrics aggregated in process. With METRICS_DIR set, every process writes
+    its samples to <pid>.json there and a scrape sums the files of all
+    processes, the way the gunicorn workers share one /metrics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labels, buckets))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: [[list(key), value if isinstance(value, (int, float)) else list(value)] for key, value in metric.samples.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as target:
+            json.dump(self.snapshot(), target)
+        os.replace(temporary, path)
+
+    def fold(self, directory, pid):
+        """
+        Adds the samples of an exited process to exited.json, so the directory
+        does not grow with every recycled worker.
+        """
+        path = os.path.join(directory, f"{pid}.json")
+        folded = os.path.join(directory, 'exited.json')
+        merged = {}
+        for source_path in (folded, path):
+            try:
+                with open(source_path) as source:
+                    snapshot = json.load(source)
+            except (OSError, ValueError):
+                continue
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                target = merged.setdefault(name, {})
+                for key, value in samples:
+                    key = tuple(key)
+                    target[key] = value if key not in target else metric.merge(target[key], value)
+        temporary = f"{folded}.tmp"
+        with open(temporary, 'w') as target:
+            json.dump({name: [[list(key), value] for key, value in samples.items()] for name, samples in merged.items()}, target)
+        os.replace(temporary, folded)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def collect(self, directory=None):
+        """
+        Returns {name: {labels: value}} summed over all processes.
+        """
+        snapshots = [self.snapshot()]
+        if directory:
+            own = f"{os.getpid()}.json"
+            for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                if not name.endswith('.json') or name == own:
+                    continue
+                try:
+                    with open(os.path.join(directory, name)) as source:
+                        snapshots.append(json.load(source))
+                except (OSError, ValueError):
+                    continue  # Being replaced right now
+
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in samples:
+                    key = tuple(key)
+                    current = merged[name].get(key)
+                    merged[name][key] = value if current is None else metric.merge(current, value)
+        return merged
+
+    def render(self, directory=None):
+        """
+        Prometheus text exposition format.
+        """
+        lines = []
+        for name, samples in self.collect(directory).items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(samples.items()):
+                labels = [f'{label}="{_escape(part)}"' for label, part in zip(metric.labels, key)]
+                if metric.kind == 'counter':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    bucket = labels + ['le="%s"' % _number(bound)]
+                    lines.append(f"{name}_bucket{_labels(bucket)} {cumulative}")
+                bucket = labels + ['le="+Inf"']
+                lines.append(f"{name}_bucket{_labels(bucket)} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram('http_request_duration_seconds', 'Request latency by URL name.', ('view', 'method', 'status'))
+REQUEST_QUERIES = registry.histogram('http_request_db_queries', 'Database queries per request.', ('view',), COUNT_BUCKETS)
+DB_QUERY_SECONDS = registry.counter('db_query_seconds_total', 'Time spent in database queries by URL name.', ('view',))
+DOCKER_SECONDS = registry.histogram('docker_api_duration_seconds', 'Docker API call latency by operation.', ('operation',))
+DOCKER_ERRORS = registry.counter('docker_api_errors_total', 'Docker API calls answered with an error status.', ('operation', 'status'))
+GIT_SECONDS = registry.histogram('git_operation_duration_seconds', 'Duration of git clones and fetches.', ('operation',))
+GIT_BYTES = registry.counter('git_received_bytes_total', 'Size of cloned working trees.', ('operation',))
+# Container names are unbounded, per container series are opt-in
+_PROXY_LABELS = ('container',) if settings.METRICS_PROXY_PER_CONTAINER else ()
+PROXY_SECONDS = registry.histogram('proxy_upstream_duration_seconds', 'Latency of proxied requests until upstream headers arrive.', _PROXY_LABELS)
+PROXY_RESPONSES = registry.counter('proxy_upstream_responses_total', 'Proxied responses by upstream status, "error" when unreachable.', _PROXY_LABELS + ('status',))
+
+# POST /containers/create, POST /containers/<id>/start, DELETE /images/<name>, ...
+_DOCKER_PATH = re.compile(r'^(?:/v[\d.]+)?/(?P<resource>[a-z_]+)(?:/(?P<name>[^/]+))?(?:/(?P<action>[a-z_]+))?')
+
+
+def docker_operation(method, path):
+    match = _DOCKER_PATH.match(path)
+    if not match:
+        return 'other'
+    resource, name, action = match.group('resource', 'name', 'action')
+    if action:
+        return f"{resource}.{'inspect' if action == 'json' else action}"
+    if name in ('create', 'json', 'prune'):
+        return f"{resource}.{name}"
+    if name:
+        return f"{resource}.{'remove' if method == 'DELETE' else 'get'}"
+    return resource
+
+
+def record_docker_response(response, *args, **kwargs):
+    """
+    requests response hook for the Docker client session.
+    """
+    request = response.request
+    operation = docker_operation(request.method, urlsplit(request.url).path)
+    # Streamed builds are timed as a whole by the caller
+    if operation != 'build':
+        DOCKER_SECONDS.observe(response.elapsed.total_seconds(), operation=operation)
+    if response.status_code >= 400:
+        DOCKER_ERRORS.inc(operation=operation, status=response.status_code)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def _flush_periodically(directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            registry.flush(directory)
+        except OSError as e:
+            logger.warning(f"Could not write metrics: {e}")
+
+
+def start_metrics_flush():
+    if not settings.METRICS_DIR:
+        return None
+    thread = threading.Thread(target=_flush_periodically, args=(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL), name='metrics-flush', daemon=True)
+    thread.start()
+    return thread
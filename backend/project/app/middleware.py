@@ -0,0 +1,226 @@
+# middleware.py
+
+import time
+import random
+import logging
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import AuthenticationFailed
+from . import metrics
+from .authentication import CachedJWTAuthentication
+from .profiling import Profile, save_profile
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimer:
+    """
+    connection.execute_wrapper counting the queries of one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.applied = False
+
+    def __enter__(self):
+        self.applied = True
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records latency and database queries of every request, labelled with the
+    URL name. Goes first in MIDDLEWARE so the other middleware is included.
+    Under ASGI only the queries of sync views are counted, see
+    ViewThreadMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with timer, connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        # The queries run on the view's thread, ViewThreadMiddleware counts them there
+        timer = QueryTimer()
+        add_view_instrument(request, timer)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    @staticmethod
+    def record(request, response, seconds, timer):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        # Streaming responses (proxy, exports, events) are timed until the first byte
+        metrics.REQUEST_SECONDS.observe(seconds, view=view, method=request.method, status=response.status_code)
+        if timer.applied:
+            metrics.REQUEST_QUERIES.observe(timer.count, view=view)
+            metrics.DB_QUERY_SECONDS.inc(timer.seconds, view=view)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests sent by staff with an `X-Profile` header, and a random
+    PROFILE_SAMPLE_RATE share of all requests. `X-Profile: deterministic`
+    adds a cProfile function table to the sampled stacks. Other requests
+    only pay for a header lookup. Under ASGI the profile covers the view
+    alone, ViewThreadMiddleware runs it on the view's thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profile = Profile(request, trigger, deterministic=request.META.get('HTTP_X_PROFILE') == 'deterministic')
+        with profile, connection.execute_wrapper(profile):
+            response = self.get_response(request)
+        self.save(profile, response)
+        return response
+
+    async def __acall__(self, request):
+        if 'HTTP_X_PROFILE' in request.META:
+            # Authenticating queries the database
+            trigger = await sync_to_async(self.trigger)(request)
+        else:
+            trigger = self.trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+
+        profile = Profile(request, trigger, deterministic=request.META.get('HTTP_X_PROFILE') == 'deterministic')
+        add_view_instrument(request, profile)
+        response = await self.get_response(request)
+        # Never entered for async views and requests that did not reach a view
+        if profile.started is not None:
+            await sync_to_async(self.save)(profile, response)
+        return response
+
+    @staticmethod
+    def save(profile, response):
+        try:
+            save_profile(profile.as_dict(response.status_code))
+            response['X-Profile-Id'] = profile.id
+        except OSError as e:
+            logger.error(f"Could not save profile of {profile.request}: {str(e)}")
+
+    @staticmethod
+    def trigger(request):
+        if 'HTTP_X_PROFILE' in request.META:
+            # Authenticated here because DRF only authenticates inside the view
+            try:
+                authenticated = CachedJWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                authenticated = None
+            if authenticated and authenticated[0].is_staff:
+                return 'header'
+        if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return 'sample'
+        return None
+
+
+def add_view_instrument(request, instrument):
+    if not hasattr(request, 'view_instruments'):
+        request.view_instruments = []
+    request.view_instruments.append(instrument)
+
+
+_END = object()
+
+
+async def _iterate_on_view_thread(iterator):
+    # One hop per chunk to the request's sync thread, which holds the view's connection and cursors
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(iterator, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+class ViewThreadMiddleware:
+    """
+    Goes last in MIDDLEWARE. Under ASGI the middleware runs on the event loop
+    and sync views on a thread of their own, where connection.execute_wrapper
+    installed by the middleware has no effect. MetricsMiddleware and
+    ProfilingMiddleware leave their instruments in request.view_instruments
+    instead, and this middleware applies them around the view in
+    process_view, which Django runs on the view's thread. Async views are not
+    instrumented.
+
+    It also hands the streaming responses of sync views (exports, the proxy)
+    to the ASGI handler as async iterators, which would read a sync iterator
+    to the end before sending the first byte.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if response.streaming and not response.is_async:
+            # The original iterator stays among the response's closers
+            response.streaming_content = _iterate_on_view_thread(iter(response.streaming_content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        instruments = getattr(request, 'view_instruments', None)
+        if not instruments or iscoroutinefunction(view_func):
+            return None
+        with ExitStack() as stack:
+            for instrument in instruments:
+                stack.enter_context(instrument)
+                stack.enter_context(connection.execute_wrapper(instrument))
+            response = view_func(request, *view_args, **view_kwargs)
+            # DRF responses are rendered lazily, include the rendering
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+        return response
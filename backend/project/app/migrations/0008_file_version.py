@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_project_tree_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
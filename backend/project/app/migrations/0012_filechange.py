@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_filerevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='change_floor',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='FileChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('file_path', models.CharField(max_length=255)),
+                ('operation', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_changes', to='app.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'file_path', 'seq'], name='file_change_path_seq')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'seq'), name='unique_file_change_seq')],
+            },
+        ),
+    ]
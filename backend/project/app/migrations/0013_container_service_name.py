@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_filechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='service_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
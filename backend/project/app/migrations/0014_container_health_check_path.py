@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_container_service_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='health_check_path',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
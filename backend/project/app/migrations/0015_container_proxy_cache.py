@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_container_health_check_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='proxy_cache',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_container_proxy_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='max_in_flight',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='container',
+            name='rate_limit',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_build'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='build',
+            name='slots',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
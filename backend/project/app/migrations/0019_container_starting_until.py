@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_build_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='starting_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
 
 class Project(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -9,6 +10,10 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects', null=True, blank=True)
+    tree_version = models.PositiveBigIntegerField(default=0)  # Bumped whenever a file is added or removed
+    synced_revision = models.CharField(max_length=40, blank=True, default='')  # Commit SHA the files were last imported from
+    change_seq = models.PositiveBigIntegerField(default=0)  # Sequence number of the latest FileChange
+    change_floor = models.PositiveBigIntegerField(default=0)  # Changes at or below this may have been compacted away
 
     def __str__(self):
         return self.name
@@ -31,22 +36,131 @@ class File(models.Model):
     content = models.TextField()  # Code content of the file
     extension = models.TextField()
     to_host = models.BooleanField(default=False)  # New flag to trigger copying to host
+    version = models.PositiveIntegerField(default=1)  # Incremented on every save, used for optimistic concurrency
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Trigram indexes back substring (LIKE/ILIKE) and regex searches
+            GinIndex(fields=['content'], name='file_content_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['file_path'], name='file_path_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the change feed tell edits from saves that only flip to_host
+        instance._stored_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        deferred = self.get_deferred_fields()
+        if 'file_path' in deferred or 'content' in deferred:
+            return None
+        return self.file_path, self.content
+
     def __str__(self):
         return self.file_path
 
 
+class FileRevision(models.Model):
+    # Keyed by path rather than File so history survives deletes and bulk file operations
+    project = models.ForeignKey(Project, related_name='file_revisions', on_delete=models.CASCADE)
+    file_path = models.CharField(max_length=255)
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)  # Full content instead of a delta against the previous revision
+    data = models.BinaryField()  # zlib compressed snapshot or delta
+    checksum = models.CharField(max_length=32)  # MD5 of the full content at this revision
+    size = models.PositiveIntegerField()  # Length of the full content
+    author = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'file_path', 'number'], name='unique_file_revision'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_path}@{self.number}"
+
+
+class FileChange(models.Model):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    OPERATIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    project = models.ForeignKey(Project, related_name='file_changes', on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()  # Per project, monotonically increasing
+    file_path = models.CharField(max_length=255)
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'seq'], name='unique_file_change_seq'),
+        ]
+        indexes = [
+            models.Index(fields=['project', 'file_path', 'seq'], name='file_change_path_seq'),
+        ]
+
+    def __str__(self):
+        return f"{self.seq} {self.operation} {self.file_path}"
+
+
 class Container(models.Model):
     project = models.ForeignKey(Project, related_name='containers', on_delete=models.CASCADE)
     container_id = models.CharField(max_length=255, unique=True)
     container_name = models.CharField(max_length=255, unique=True, null=True)
+    service_name = models.CharField(max_length=255, blank=True, default='')  # Compose service, empty for Dockerfile builds
     status = models.CharField(max_length=50)
     port = models.IntegerField()
+    health_check_path = models.CharField(max_length=255, blank=True, default='')  # HTTP probe path, TCP probe when empty
+    proxy_cache = models.BooleanField(default=False)  # Cache cacheable GET responses in the proxy
+    rate_limit = models.FloatField(null=True, blank=True)  # Proxied requests per second, PROXY_CONTAINER_RATE when unset
+    max_in_flight = models.PositiveIntegerField(null=True, blank=True)  # Concurrent upstream requests, PROXY_MAX_IN_FLIGHT when unset
+    starting_until = models.DateTimeField(null=True, blank=True)  # Readiness check running, every worker's proxy answers 503 until then
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Container {self.container_name} ({self.container_id}) for {self.project.name}"
 
+
+
+class Build(models.Model):
+    # Build jobs of every backend process, the scheduler coordinates through these rows
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    job_id = models.CharField(max_length=32, unique=True)
+    key = models.CharField(max_length=32)  # Digest of the request, identical requests share the active build
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
+    priority = models.PositiveSmallIntegerField()  # 0 is the highest
+    slots = models.PositiveSmallIntegerField(default=1)  # Build slots taken while running, compose builds take one per parallel image build
+    description = models.CharField(max_length=255, blank=True, default='')
+    state = models.CharField(max_length=10, choices=STATES, default=QUEUED)
+    worker = models.CharField(max_length=100)  # host:pid of the process that runs the build
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField()  # Refreshed while the worker is alive
+    coalesced = models.PositiveIntegerField(default=0)  # Duplicate requests served by this build
+    messages = models.JSONField(default=list)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(state__in=['queued', 'running']), name='unique_active_build'),
+        ]
+        indexes = [
+            models.Index(fields=['state', 'priority', 'submitted_at'], name='build_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.state})"
@@ -0,0 +1,219 @@
+# profiling.py
+
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import contextvars
+from collections import Counter
+from functools import lru_cache
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.utils import timezone
+from .metrics import docker_operation
+
+logger = logging.getLogger(__name__)
+
+# The profile of the request running in this thread, if any
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename):
+    # Longest sys.path entry first so site-packages wins over its parents
+    for prefix in sorted((path for path in sys.path if path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def collapse(frame):
+    """
+    One line of the collapsed stack format: root first, frames joined by ';'.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread every `interval` seconds from a helper
+    thread. Costs nothing in the profiled thread itself.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+
+class Profile:
+    def __init__(self, request, trigger, deterministic=False):
+        self.id = uuid.uuid4().hex
+        self.request = f"{request.method} {request.get_full_path()}"
+        self.trigger = trigger
+        self.created_at = timezone.now()
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.docker_calls = []
+        self.sampler = None
+        self.profiler = cProfile.Profile() if deterministic else None
+        self.started = None
+        self.seconds = None
+
+    def __enter__(self):
+        self.token = current_profile.set(self)
+        self.started = time.perf_counter()
+        # Entered on the thread that runs the view, which is the one to sample
+        self.sampler = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL)
+        self.sampler.start()
+        if self.profiler:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler:
+            self.profiler.disable()
+        self.sampler.stop()
+        self.seconds = time.perf_counter() - self.started
+        current_profile.reset(self.token)
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            self.query_count += 1
+            self.query_seconds += seconds
+            if len(self.queries) < settings.PROFILE_MAX_QUERIES:
+                self.queries.append({'sql': sql, 'many': many, 'seconds': round(seconds, 6)})
+
+    def functions(self, limit=50):
+        """
+        Top functions of the deterministic profile by cumulative time.
+        """
+        if not self.profiler:
+            return None
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for (filename, line, name), (calls, _, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f"{name} ({_short_path(filename)}:{line})",
+                'calls': calls,
+                'total_seconds': round(total, 6),
+                'cumulative_seconds': round(cumulative, 6),
+            })
+        rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+        return rows[:limit]
+
+    def as_dict(self, status_code):
+        return {
+            'id': self.id,
+            'request': self.request,
+            'status': status_code,
+            'trigger': self.trigger,
+            'created_at': self.created_at.isoformat(),
+            'seconds': round(self.seconds, 6),
+            'interval': settings.PROFILE_INTERVAL,
+            'samples': sum(self.sampler.stacks.values()),
+            'query_count': self.query_count,
+            'query_seconds': round(self.query_seconds, 6),
+            'queries': self.queries,
+            'docker_calls': self.docker_calls,
+            'docker_seconds': round(sum(call['seconds'] for call in self.docker_calls), 6),
+            'functions': self.functions(),
+            'stacks': '\n'.join(f"{stack} {count}" for stack, count in self.sampler.stacks.most_common()),
+        }
+
+
+def record_docker_response(response, *args, **kwargs):
+    """
+    requests response hook adding Docker calls to the profile of this thread.
+    Builds queued on the scheduler run on its threads and are not included.
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return
+    request = response.request
+    path = urlsplit(request.url).path
+    profile.docker_calls.append({
+        'operation': docker_operation(request.method, path),
+        'method': request.method,
+        'path': path,
+        'status': response.status_code,
+        'seconds': round(response.elapsed.total_seconds(), 6),
+    })
+
+
+def save_profile(data):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILE_DIR, f"{data['id']}.json")
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as target:
+        json.dump(data, target)
+    os.replace(temporary, path)
+
+    # Keep the newest PROFILE_KEEP profiles
+    names = [name for name in os.listdir(settings.PROFILE_DIR) if name.endswith('.json')]
+    if len(names) > settings.PROFILE_KEEP:
+        paths = sorted((os.path.join(settings.PROFILE_DIR, name) for name in names), key=os.path.getmtime)
+        for old in paths[:len(paths) - settings.PROFILE_KEEP]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def load_profile(profile_id):
+    if not profile_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(settings.PROFILE_DIR, f"{profile_id}.json")) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def list_profiles():
+    """
+    Summaries of the stored profiles, newest first.
+    """
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    paths = [os.path.join(settings.PROFILE_DIR, name) for name in os.listdir(settings.PROFILE_DIR) if name.endswith('.json')]
+    summaries = []
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            with open(path) as source:
+                data = json.load(source)
+        except (OSError, ValueError):
+            continue
+        summaries.append({key: data[key] for key in ('id', 'request', 'status', 'trigger', 'created_at', 'seconds', 'query_count', 'query_seconds', 'docker_seconds')})
+    return summaries
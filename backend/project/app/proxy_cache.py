@@ -0,0 +1,323 @@
+# proxy_cache.py
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from email.utils import parsedate_to_datetime
+from django.conf import settings
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_STATUSES = {200, 203, 301, 404, 410}
+
+# Hop-by-hop and per-response headers that are not replayed from the cache
+UNSTORED_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-encoding', 'content-length', 'set-cookie', 'age'}
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _http_timestamp(value):
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers):
+    """
+    Seconds the response may be served without revalidation: s-maxage, then
+    max-age, then Expires - Date. None when upstream gave no explicit lifetime.
+    """
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name):
+            try:
+                return max(int(directives[name]), 0)
+            except ValueError:
+                return 0
+    expires = _http_timestamp(headers.get('Expires'))
+    if expires is not None:
+        date = _http_timestamp(headers.get('Date')) or time.time()
+        return max(expires - date, 0)
+    return None
+
+
+def vary_headers(headers):
+    return sorted({name.strip().lower() for name in headers.get('Vary', '').split(',') if name.strip()})
+
+
+def is_storable(request, response):
+    """
+    Whether an upstream response to a GET may be kept in the shared cache.
+    """
+    if response.status_code not in CACHEABLE_STATUSES:
+        return False
+    request_directives = parse_cache_control(request.headers.get('Cache-Control'))
+    directives = parse_cache_control(response.headers.get('Cache-Control'))
+    if 'no-store' in request_directives or 'no-store' in directives or 'private' in directives:
+        return False
+    if 'set-cookie' in response.headers or '*' in vary_headers(response.headers):
+        return False
+    if 'authorization' in request.headers and 'public' not in directives and 's-maxage' not in directives:
+        return False
+    # Without a lifetime or validator there is nothing to reuse
+    return freshness_lifetime(response.headers) is not None or 'etag' in response.headers or 'last-modified' in response.headers
+
+
+class CacheEntry:
+    def __init__(self, status, reason, headers, body, stored_at, lifetime, vary):
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # list of (name, value)
+        self.body = body
+        self.stored_at = stored_at
+        self.lifetime = lifetime
+        self.vary = vary  # {header: value} the response was selected by
+
+    @classmethod
+    def from_response(cls, request, response, body):
+        headers = [(name, value) for name, value in response.headers.items() if name.lower() not in UNSTORED_HEADERS]
+        vary = {name: request.headers.get(name, '') for name in vary_headers(response.headers)}
+        return cls(response.status_code, response.reason, headers, body, time.time(), cls._lifetime(response.headers), vary)
+
+    @staticmethod
+    def _lifetime(headers):
+        if 'no-cache' in parse_cache_control(headers.get('Cache-Control')):
+            return 0
+        return freshness_lifetime(headers) or 0
+
+    def header(self, name):
+        name = name.lower()
+        return next((value for key, value in self.headers if key.lower() == name), None)
+
+    @property
+    def age(self):
+        return max(time.time() - self.stored_at, 0)
+
+    def is_fresh(self):
+        return self.age < self.lifetime
+
+    def matches(self, request):
+        return all(request.headers.get(name, '') == value for name, value in self.vary.items())
+
+    def revalidated(self, response):
+        """
+        Applies the headers of a 304 and restarts the freshness lifetime.
+        """
+        updated = {name.lower(): (name, value) for name, value in response.headers.items() if name.lower() not in UNSTORED_HEADERS}
+        headers = [updated.pop(key.lower(), (key, value)) for key, value in self.headers]
+        headers.extend(updated.values())
+        merged = CaseInsensitiveDict(self.headers)
+        merged.update(response.headers)
+        return CacheEntry(self.status, self.reason, headers, self.body, time.time(), self._lifetime(merged), self.vary)
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+    def dump(self):
+        meta = {
+            'status': self.status, 'reason': self.reason, 'headers': self.headers,
+            'stored_at': self.stored_at, 'lifetime': self.lifetime, 'vary': self.vary,
+        }
+        return json.dumps(meta).encode('utf-8') + b'\n' + self.body
+
+    @classmethod
+    def load(cls, data):
+        meta, _, body = data.partition(b'\n')
+        meta = json.loads(meta)
+        headers = [tuple(header) for header in meta['headers']]
+        return cls(meta['status'], meta['reason'], headers, body, meta['stored_at'], meta['lifetime'], meta['vary'])
+
+
+class ProxyCache:
+    """
+    Two tier cache of upstream responses keyed by (container, URL) with one
+    variant per combination of Vary header values. The memory tier is an LRU
+    bounded in bytes. The optional disk tier keeps every stored entry as a file
+    and is trimmed oldest first.
+    """
+
+    def __init__(self, memory_bytes, disk_dir=None, disk_bytes=0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.variants = defaultdict(set)  # (container, URL) -> Vary value tuples in memory
+        self.used = 0
+        self.disk_used = None
+        self.stats = defaultdict(lambda: defaultdict(int))
+
+    def _key(self, container_id, url, vary):
+        return (container_id, url, tuple(sorted(vary.items())))
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, key[0], digest)
+
+    def count(self, container_id, event):
+        with self.lock:
+            self.stats[container_id][event] += 1
+
+    def container_stats(self, container_id):
+        with self.lock:
+            stats = dict(self.stats.get(container_id, {}))
+            stats['entries'] = sum(1 for key in self.entries if key[0] == container_id)
+            stats['memory_bytes'] = sum(entry.size for key, entry in self.entries.items() if key[0] == container_id)
+        return stats
+
+    def lookup(self, container_id, url, request):
+        """
+        Returns the stored variant matching the request, or None.
+        """
+        with self.lock:
+            for vary in self.variants.get((container_id, url), ()):
+                key = (container_id, url, vary)
+                entry = self.entries[key]
+                if entry.matches(request):
+                    self.entries.move_to_end(key)
+                    return entry
+        for vary in self._variants_on_disk(container_id, url):
+            entry = self._read_disk(self._key(container_id, url, vary))
+            if entry and entry.matches(request):
+                self._remember(self._key(container_id, url, entry.vary), entry)
+                return entry
+        return None
+
+    def store(self, container_id, url, entry):
+        key = self._key(container_id, url, entry.vary)
+        self._remember(key, entry)
+        if self.disk_dir:
+            self._write_disk(key, entry)
+            self._index_variant(container_id, url, entry.vary)
+
+    def purge(self, container_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == container_id]:
+                self._forget(key)
+            self.stats.pop(container_id, None)
+        if self.disk_dir:
+            directory = os.path.join(self.disk_dir, container_id)
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+            self.disk_used = None
+
+    def _remember(self, key, entry):
+        if entry.size > self.memory_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._forget(key)
+            self.entries[key] = entry
+            self.variants[key[:2]].add(key[2])
+            self.used += entry.size
+            while self.used > self.memory_bytes:
+                evicted = next(iter(self.entries))
+                self._forget(evicted)
+                self.stats[evicted[0]]['evictions'] += 1
+
+    def _forget(self, key):
+        # Called with the lock held
+        self.used -= self.entries.pop(key).size
+        variants = self.variants[key[:2]]
+        variants.discard(key[2])
+        if not variants:
+            del self.variants[key[:2]]
+
+    # Disk tier. Each URL has an index file listing its Vary variants.
+
+    def _index_path(self, container_id, url):
+        return self._disk_path((container_id, url, 'variants'))
+
+    def _variants_on_disk(self, container_id, url):
+        if not self.disk_dir:
+            return []
+        try:
+            with open(self._index_path(container_id, url)) as index:
+                return json.load(index)
+        except (OSError, ValueError):
+            return []
+
+    def _index_variant(self, container_id, url, vary):
+        variants = self._variants_on_disk(container_id, url)
+        if vary not in variants:
+            variants.append(vary)
+            self._atomic_write(self._index_path(container_id, url), json.dumps(variants).encode('utf-8'))
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'rb') as cached:
+                return CacheEntry.load(cached.read())
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key, entry):
+        data = entry.dump()
+        try:
+            self._atomic_write(self._disk_path(key), data)
+        except OSError as e:
+            logger.warning(f"Could not write proxy cache entry: {e}")
+            return
+        with self.lock:
+            if self.disk_used is None:
+                self.disk_used = self._scan_disk()
+            self.disk_used += len(data)
+            over = self.disk_used > self.disk_bytes
+        if over:
+            self._trim_disk()
+
+    def _atomic_write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as target:
+            target.write(data)
+        os.replace(temporary, path)
+
+    def _files(self):
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    continue
+
+    def _scan_disk(self):
+        return sum(info.st_size for _, info in self._files())
+
+    def _trim_disk(self):
+        # Down to 90% of the budget so trimming does not run on every write
+        files = sorted(self._files(), key=lambda item: item[1].st_mtime)
+        used = sum(info.st_size for _, info in files)
+        target = self.disk_bytes * 0.9
+        for path, info in files:
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+                used -= info.st_size
+            except OSError:
+                continue
+        with self.lock:
+            self.disk_used = used
+
+
+proxy_cache = ProxyCache(
+    memory_bytes=settings.PROXY_CACHE_MEMORY_BYTES,
+    disk_dir=settings.PROXY_CACHE_DIR,
+    disk_bytes=settings.PROXY_CACHE_DISK_BYTES,
+)
@@ -0,0 +1,181 @@
+# ratelimit.py
+
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Returns (allowed, retry_after_seconds).
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, None
+        return False, max(math.ceil((1 - self.tokens) / self.rate), 1)
+
+
+class LocalLimiter:
+    """
+    In-process token buckets and in-flight counters. Limits apply per worker
+    process. Idle buckets are dropped least recently used first.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+        self.in_flight = {}
+
+    def take(self, key, rate, burst):
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or bucket.rate != rate or bucket.burst != burst:
+                bucket = self.buckets[key] = TokenBucket(rate, burst)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return bucket.take()
+
+    def acquire(self, key, limit):
+        with self.lock:
+            if self.in_flight.get(key, 0) >= limit:
+                return False
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        with self.lock:
+            remaining = self.in_flight.get(key, 0) - 1
+            if remaining > 0:
+                self.in_flight[key] = remaining
+            else:
+                self.in_flight.pop(key, None)
+
+
+class CacheLimiter:
+    """
+    Limits shared by all workers through a Django cache with atomic incr
+    (Redis, Memcached). The bucket is approximated by a counter per window of
+    burst / rate seconds allowing `burst` requests.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, rate, burst):
+        window = max(burst / rate, 1)
+        slot = int(time.time() // window)
+        counter = f"proxy-rl:{key}:{slot}"
+        self.cache.add(counter, 0, timeout=math.ceil(window) + 1)
+        try:
+            count = self.cache.incr(counter)
+        except ValueError:
+            # Expired between add and incr
+            self.cache.add(counter, 1, timeout=math.ceil(window) + 1)
+            count = 1
+        if count <= burst:
+            return True, None
+        return False, max(math.ceil((slot + 1) * window - time.time()), 1)
+
+    def acquire(self, key, limit):
+        counter = f"proxy-inflight:{key}"
+        # The timeout bounds the damage of a worker dying with requests in flight
+        self.cache.add(counter, 0, timeout=settings.PROXY_IN_FLIGHT_TTL)
+        try:
+            count = self.cache.incr(counter)
+        except ValueError:
+            self.cache.add(counter, 1, timeout=settings.PROXY_IN_FLIGHT_TTL)
+            count = 1
+        if count > limit:
+            self.release(key)
+            return False
+        return True
+
+    def release(self, key):
+        try:
+            self.cache.decr(f"proxy-inflight:{key}")
+        except ValueError:
+            pass
+
+
+class ReleaseOnClose:
+    """
+    Wraps a response body and calls `release` once when the server closes it,
+    whether or not the body was consumed.
+    """
+
+    def __init__(self, iterable, release):
+        self.iterator = iter(iterable)
+        self.release = release
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.iterator)
+
+    def close(self):
+        try:
+            if hasattr(self.iterator, 'close'):
+                self.iterator.close()
+        finally:
+            if not self.released:
+                self.released = True
+                self.release()
+
+
+def get_limiter():
+    if settings.PROXY_RATE_LIMIT_CACHE:
+        return CacheLimiter(settings.PROXY_RATE_LIMIT_CACHE)
+    return LocalLimiter()
+
+
+limiter = get_limiter()
+
+
+def client_ip(request):
+    return request.META.get(settings.PROXY_CLIENT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate_limits(container, request):
+    """
+    Takes a token from the client's and the container's bucket. Returns None
+    when the request may proceed, otherwise the seconds to wait.
+    """
+    # Client first, so a single abusive client does not drain the container's bucket
+    rate = settings.PROXY_CLIENT_RATE
+    if rate:
+        burst = max(rate * settings.PROXY_BURST_SECONDS, 1)
+        allowed, retry_after = limiter.take(f"client:{container.container_id}:{client_ip(request)}", rate, burst)
+        if not allowed:
+            return retry_after
+
+    rate = container.rate_limit if container.rate_limit is not None else settings.PROXY_CONTAINER_RATE
+    if rate:
+        burst = max(rate * settings.PROXY_BURST_SECONDS, 1)
+        allowed, retry_after = limiter.take(f"container:{container.container_id}", rate, burst)
+        if not allowed:
+            return retry_after
+    return None
+
+
+def in_flight_limit(container):
+    return container.max_in_flight if container.max_in_flight is not None else settings.PROXY_MAX_IN_FLIGHT
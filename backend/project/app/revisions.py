@@ -0,0 +1,177 @@
+# revisions.py
+
+import json
+import uuid
+import zlib
+import difflib
+import hashlib
+from django.conf import settings
+from django.db.models import Case, Max, Min, Q, Value, When
+from .models import FileRevision
+
+
+def checksum(content):
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def encode_delta(old, new):
+    """
+    Line based delta from `old` to `new`: ["c", i1, i2] copies old lines
+    i1..i2, ["i", line, ...] inserts new lines.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    delta = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines).get_opcodes():
+        if tag == 'equal':
+            delta.append(['c', i1, i2])
+        elif j2 > j1:
+            delta.append(['i', *new_lines[j1:j2]])
+    return delta
+
+
+def apply_delta(old, delta):
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in delta:
+        if op[0] == 'c':
+            parts.extend(old_lines[op[1]:op[2]])
+        else:
+            parts.extend(op[1:])
+    return ''.join(parts)
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def revision_content(project, file_path, number):
+    """
+    Rebuilds the content of a revision from the nearest snapshot at or before it.
+    Returns None when the revision does not exist.
+    """
+    revisions = FileRevision.objects.filter(project=project, file_path=file_path)
+    snapshot = revisions.filter(number__lte=number, is_snapshot=True).order_by('-number').first()
+    if snapshot is None:
+        return None
+    content = _unpack(snapshot.data)
+    deltas = revisions.filter(number__gt=snapshot.number, number__lte=number).order_by('number')
+    expected = snapshot.number
+    for revision in deltas.only('number', 'data'):
+        expected += 1
+        if revision.number != expected:
+            return None
+        content = apply_delta(content, _unpack(revision.data))
+    return content if expected == number else None
+
+
+def record_revision(project, file_path, old_content, new_content, author=None):
+    """
+    Stores `new_content` as the next revision of a file. The first edit also
+    stores the original content. A full snapshot is written every
+    FILE_REVISION_SNAPSHOT_INTERVAL revisions to bound reconstruction cost, and
+    whenever the content changed outside of the history.
+    """
+    revisions = record_revisions(project, [(file_path, old_content, new_content)], author=author)
+    return revisions[0] if revisions else None
+
+
+def record_revisions(project, edits, author=None):
+    """
+    record_revision for many (file_path, old_content, new_content) edits with
+    a fixed number of queries, plus pruning for files over the retention.
+    Returns the new revisions.
+    """
+    edits = [(file_path, old, new) for file_path, old, new in edits if old != new]
+    if not edits:
+        return []
+    revisions = FileRevision.objects.filter(project=project, file_path__in=[file_path for file_path, _, _ in edits])
+    history = {
+        row['file_path']: row for row in revisions.values('file_path').annotate(
+            first=Min('number'), last=Max('number'), last_snapshot=Max('number', filter=Q(is_snapshot=True)),
+        )
+    }
+    last_checksums = {}
+    if history:
+        latest = Q()
+        for file_path, row in history.items():
+            latest |= Q(file_path=file_path, number=row['last'])
+        last_checksums = dict(revisions.filter(latest).values_list('file_path', 'checksum'))
+
+    created, recorded, prune = [], [], []
+    for file_path, old_content, new_content in edits:
+        row = history.get(file_path)
+        if row is None or row['last_snapshot'] is None or last_checksums.get(file_path) != checksum(old_content):
+            # No history yet or the file was changed elsewhere (sync, import): start a new chain
+            number = row['last'] + 1 if row else 1
+            created.append(FileRevision(
+                project=project, file_path=file_path, number=number, is_snapshot=True,
+                data=_pack(old_content), checksum=checksum(old_content), size=len(old_content),
+            ))
+            last_snapshot = number
+            number += 1
+        else:
+            number = row['last'] + 1
+            last_snapshot = row['last_snapshot']
+
+        if number - last_snapshot >= settings.FILE_REVISION_SNAPSHOT_INTERVAL:
+            is_snapshot, data = True, _pack(new_content)
+        else:
+            is_snapshot, data = False, _pack(encode_delta(old_content, new_content))
+        revision = FileRevision(
+            project=project, file_path=file_path, number=number, is_snapshot=is_snapshot,
+            data=data, checksum=checksum(new_content), size=len(new_content), author=author,
+        )
+        created.append(revision)
+        recorded.append(revision)
+        if row and row['first'] < number - settings.FILE_REVISION_RETENTION + 1:
+            prune.append((file_path, number))
+
+    FileRevision.objects.bulk_create(created, batch_size=500)
+    for file_path, latest in prune:
+        prune_revisions(project, file_path, latest)
+    return recorded
+
+
+def move_revisions(project, paths):
+    """
+    Moves the history of each old path in `paths` ({old_path: new_path}) to
+    its new path, dropping any history left at a new path. Goes through
+    temporary paths so swaps and chains of renames do not collide.
+    """
+    if not paths:
+        return
+    revisions = FileRevision.objects.filter(project=project)
+    token = uuid.uuid4().hex
+    temporary = {old_path: f".rename-{token}/{index}" for index, old_path in enumerate(paths)}
+    revisions.filter(file_path__in=list(paths)).update(
+        file_path=Case(*[When(file_path=old_path, then=Value(path)) for old_path, path in temporary.items()]),
+    )
+    revisions.filter(file_path__in=list(paths.values())).delete()
+    revisions.filter(file_path__in=list(temporary.values())).update(
+        file_path=Case(*[When(file_path=temporary[old_path], then=Value(new_path)) for old_path, new_path in paths.items()]),
+    )
+
+
+def prune_revisions(project, file_path, latest):
+    """
+    Keeps the last FILE_REVISION_RETENTION revisions. The oldest kept revision is
+    turned into a snapshot first so the remaining chain stays reconstructable.
+    """
+    oldest_kept = latest - settings.FILE_REVISION_RETENTION + 1
+    revisions = FileRevision.objects.filter(project=project, file_path=file_path)
+    if oldest_kept <= 1 or not revisions.filter(number__lt=oldest_kept).exists():
+        return
+    boundary = revisions.filter(number=oldest_kept).first()
+    if boundary and not boundary.is_snapshot:
+        content = revision_content(project, file_path, oldest_kept)
+        if content is None:
+            return
+        boundary.data = _pack(content)
+        boundary.is_snapshot = True
+        boundary.save(update_fields=['data', 'is_snapshot'])
+    revisions.filter(number__lt=oldest_kept).delete()
@@ -0,0 +1,140 @@
+# search.py
+
+import re
+from django.db import connection
+from django.db.models import TextField
+from django.db.models.lookups import IContains
+
+
+def glob_to_regex(pattern):
+    """
+    Converts a path glob into an anchored regex usable both by Postgres and Python.
+    '*' and '?' stay within one directory, '**' spans directories and patterns
+    without a '/' match the file name in any directory (like .gitignore).
+    """
+    regex = ['^']
+    if '/' not in pattern:
+        regex.append('(.*/)?')
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex.append('(.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            regex.append('[^/]')
+            i += 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    regex.append('$')
+    return ''.join(regex)
+
+
+class ILikeContains(IContains):
+    """
+    Case-insensitive substring match compiled to ILIKE on Postgres. Django's
+    icontains compiles to UPPER(col) LIKE UPPER(%s), which the trigram index
+    on the raw column cannot serve.
+    """
+    lookup_name = 'ilike'
+
+    def get_rhs_op(self, connection, rhs):
+        return connection.operators['icontains'] % rhs
+
+    def as_postgresql(self, compiler, connection):
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs_sql} ILIKE {rhs_sql}", (*lhs_params, *rhs_params)
+
+
+TextField.register_lookup(ILikeContains)
+
+
+def _snippet(number, column, line, max_line_length):
+    # Keep long lines (minified code) centred around the match
+    start = max(column - max_line_length // 2, 0) if len(line) > max_line_length else 0
+    return {'line': number, 'column': column + 1, 'text': line[start:start + max_line_length]}
+
+
+def find_matches(content, matcher, max_matches, max_line_length=200):
+    """
+    Returns (matches, total) where matches holds up to `max_matches` snippets
+    as {'line', 'column', 'text'} with 1-based positions.
+    """
+    matches, total = [], 0
+    for number, line in enumerate(content.splitlines(), start=1):
+        column = matcher(line)
+        if column is None:
+            continue
+        total += 1
+        if len(matches) < max_matches:
+            matches.append(_snippet(number, column, line, max_line_length))
+    return matches, total
+
+
+def make_matcher(query, case_sensitive=False):
+    """
+    Builds a function returning the column of the first match in a line or None.
+    """
+    if case_sensitive:
+        def match(line):
+            column = line.find(query)
+            return column if column >= 0 else None
+        return match
+
+    folded = query.lower()
+
+    def match(line):
+        column = line.lower().find(folded)
+        return column if column >= 0 else None
+    return match
+
+
+def limit_statement_time(milliseconds):
+    """
+    Caps every following statement of the current transaction (Postgres).
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(milliseconds)])
+
+
+def find_regex_matches(file_ids, pattern, case_sensitive, max_matches, max_line_length=200):
+    """
+    Matches a regular expression line by line in Postgres, so a pathological
+    pattern is bounded by the statement timeout instead of pinning a worker
+    in Python's backtracking engine. Returns {file_id: (matches, total)}.
+    Columns are those of the first occurrence of the matched text.
+    """
+    # The outer group makes substring() return the whole match, (?i) must come first
+    regex = f"{'' if case_sensitive else '(?i)'}({pattern})"
+    found = {file_id: ([], 0) for file_id in file_ids}
+    if not file_ids:
+        return found
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id, number, line, position, total FROM (
+                SELECT f.id, t.number, t.line,
+                       strpos(t.line, substring(t.line FROM %s)) AS position,
+                       row_number() OVER (PARTITION BY f.id ORDER BY t.number) AS rank,
+                       count(*) OVER (PARTITION BY f.id) AS total
+                FROM app_file f, regexp_split_to_table(f.content, E'\\r?\\n') WITH ORDINALITY AS t(line, number)
+                WHERE f.id = ANY(%s) AND t.line ~ %s
+            ) lines
+            WHERE rank <= %s
+            ORDER BY id, number
+            """,
+            [regex, list(file_ids), regex, max_matches],
+        )
+        for file_id, number, line, position, total in cursor.fetchall():
+            matches, _ = found[file_id]
+            matches.append(_snippet(number, max((position or 1) - 1, 0), line, max_line_length))
+            found[file_id] = (matches, total)
+    return found
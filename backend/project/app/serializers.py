@@ -36,4 +36,4 @@ class ContainerSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Container
-        fields = ['id', 'container_id', 'status', 'port', 'created_at', 'updated_at', 'project']
+        fields = ['id', 'container_id', 'container_name', 'service_name', 'status', 'port', 'health_check_path', 'proxy_cache', 'rate_limit', 'max_in_flight', 'created_at', 'updated_at', 'project']
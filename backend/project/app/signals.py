@@ -1,27 +1,37 @@
 import os
 import logging
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import File
+from django.contrib.auth.models import User
+from .models import Project, File, FileChange, Container
+from .changes import record_file_changes
+from .events import publish, container_event_data
+from .listings import invalidate_listings
+from .authentication import user_cache
 from pathlib import Path
 
 
-@receiver(post_save, sender=File)
-def copy_file_to_host(sender, instance, **kwargs):
-    project_name = instance.project.name
-    repo_path = f'/app/repos/{project_name}'
-    file_path = os.path.join(repo_path, instance.file_path)
+def bump_tree_version(project_id):
+    # Invalidates cached file trees (ETags) for the project
+    Project.objects.filter(pk=project_id).update(tree_version=F('tree_version') + 1)
+
+
+def sync_file_to_host(project_name, relative_path, content, to_host):
+    repo_path = os.path.join(settings.REPOS_DIR, project_name)
+    file_path = os.path.join(repo_path, relative_path)
 
-    if instance.to_host:
+    if to_host:
         # Ensure the directory exists
         os.makedirs(repo_path, exist_ok=True)
         Path(file_path).parent.mkdir(parents=True, exist_ok=True)
 
-        logging.info(f"Copying file {os.path.basename(instance.file_path)} to {file_path}")
+        logging.info(f"Copying file {os.path.basename(relative_path)} to {file_path}")
 
         # Write the file content
         with open(file_path, 'w') as file:
-            file.write(instance.content)
+            file.write(content)
     else:
         # Delete file if exists
         if os.path.exists(file_path):
@@ -29,3 +39,85 @@ def copy_file_to_host(sender, instance, **kwargs):
             logging.info(f"Deleted file {file_path} as 'to_host' was set to False.")
         else:
             logging.info(f"File {file_path} not found, skipping deletion.")
+
+
+@receiver(post_save, sender=File)
+def copy_file_to_host(sender, instance, **kwargs):
+    sync_file_to_host(instance.project.name, instance.file_path, instance.content, instance.to_host)
+
+
+@receiver(post_save, sender=File)
+def file_created(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        bump_tree_version(instance.project_id)
+    stored_state = getattr(instance, '_stored_state', None)
+    instance._stored_state = instance.tracked_state()
+    # Nothing a client syncs changed when only to_host did
+    if update_fields is not None and set(update_fields) <= {'to_host'}:
+        return
+    if not created and stored_state is not None and stored_state == instance._stored_state:
+        return
+    if not created and stored_state is not None and stored_state[0] != instance.file_path:
+        # A rename moves the file in the tree, like a move through FileBatchView
+        bump_tree_version(instance.project_id)
+        record_file_changes(instance.project_id, [(stored_state[0], FileChange.DELETED), (instance.file_path, FileChange.CREATED)])
+        return
+    record_file_changes(instance.project_id, [(instance.file_path, FileChange.CREATED if created else FileChange.UPDATED)])
+
+
+@receiver(post_delete, sender=File)
+def file_deleted(sender, instance, origin=None, **kwargs):
+    # Nothing to track when the file goes away with its project (or owner)
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not File:
+        return
+    bump_tree_version(instance.project_id)
+    record_file_changes(instance.project_id, [(instance.file_path, FileChange.DELETED)])
+
+
+@receiver(post_save, sender=Project)
+def project_saved(sender, instance, created, **kwargs):
+    invalidate_listings(instance.owner_id)
+    if created:
+        publish(instance.owner_id, 'project.created', {'name': instance.name})
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    invalidate_listings(instance.owner_id)
+    publish(instance.owner_id, 'project.deleted', {'name': instance.name})
+
+
+@receiver(post_save, sender=Container)
+def container_saved(sender, instance, created, update_fields=None, **kwargs):
+    owner_id, project_name = Project.objects.filter(pk=instance.project_id).values_list('owner_id', 'name').get()
+    invalidate_listings(owner_id)
+    if not created and update_fields is not None and 'status' not in update_fields:
+        return
+    publish(owner_id, 'container.created' if created else 'container.updated', container_event_data(instance, project_name))
+
+
+@receiver(post_delete, sender=Container)
+def container_deleted(sender, instance, origin=None, **kwargs):
+    # Containers removed with their project are covered by project.deleted
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not Container:
+        return
+    project = Project.objects.filter(pk=instance.project_id).values_list('owner_id', 'name').first()
+    if project:
+        invalidate_listings(project[0])
+        publish(project[0], 'container.deleted', container_event_data(instance, project[1]))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    user_cache.forget(instance.pk)
+    # Project listings include the owner's username and email, logins only touch last_login
+    if update_fields is not None and not {'username', 'email'} & set(update_fields):
+        return
+    invalidate_listings(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_cache.forget(instance.pk)
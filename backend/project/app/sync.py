@@ -0,0 +1,153 @@
+# sync.py
+
+import os
+import logging
+import git
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Project, File, FileChange
+from .changes import record_file_changes
+from .signals import bump_tree_version, sync_file_to_host
+from .listings import invalidate_listings
+
+logger = logging.getLogger(__name__)
+
+SUBMODULE_MODE = 0o160000
+
+
+def mirror_path(project_name):
+    return os.path.join(settings.REPO_CACHE_DIR, f"{project_name}.git")
+
+
+def fetch_mirror(project):
+    """
+    Brings the project's bare mirror up to date, cloning it on first use.
+    Only objects missing locally are transferred on later fetches.
+    """
+    path = mirror_path(project.name)
+    if os.path.exists(path):
+        repo = git.Repo(path)
+        repo.git.remote('set-url', 'origin', project.repository_url)
+        logger.info(f"Fetching {project.repository_url} into {path}")
+        repo.git.fetch('origin', '--prune')
+    else:
+        os.makedirs(settings.REPO_CACHE_DIR, exist_ok=True)
+        logger.info(f"Creating mirror of {project.repository_url} in {path}")
+        repo = git.Repo.clone_from(project.repository_url, path, mirror=True)
+    return repo
+
+
+def head_revision(repo):
+    try:
+        return repo.head.commit.hexsha
+    except ValueError:
+        # Empty repository without any commit
+        return ''
+
+
+def read_blob(blob):
+    # Same decoding as the initial import
+    return blob.data_stream.read().decode('utf-8', errors='ignore').replace('\0', '')
+
+
+def diff_revisions(repo, old_revision, new_commit):
+    """
+    Returns (upserts, deletes): a dict of path -> blob for added or modified files
+    and a list of removed paths. Without a usable old revision every tracked
+    file is returned as an upsert and nothing is deleted.
+    """
+    upserts, deletes = {}, []
+    try:
+        old_commit = repo.commit(old_revision) if old_revision else None
+        if old_commit is not None:
+            # A full sha is not looked up until the commit is read
+            old_commit.tree
+    except (ValueError, git.exc.BadName, git.exc.GitError):
+        logger.warning(f"Revision {old_revision} is no longer reachable, re-importing all tracked files.")
+        old_commit = None
+
+    if old_commit is None:
+        for item in new_commit.tree.traverse():
+            if item.type == 'blob' and item.mode != SUBMODULE_MODE:
+                upserts[item.path] = item
+        return upserts, deletes
+
+    for diff in old_commit.diff(new_commit):
+        if diff.change_type == 'D' or diff.renamed_file:
+            deletes.append(diff.a_path)
+        if diff.change_type != 'D' and diff.b_blob is not None and diff.b_mode != SUBMODULE_MODE:
+            upserts[diff.b_path] = diff.b_blob
+    return upserts, deletes
+
+
+def apply_revision(project, repo, new_commit, batch_size=500):
+    """
+    Applies the difference between the project's synced revision and
+    `new_commit` to its File rows and records the new revision.
+    Returns None when the project is already at `new_commit`.
+    """
+    stats = {'added': 0, 'modified': 0, 'deleted': 0}
+    host_updates = []
+
+    with transaction.atomic():
+        # Serialize concurrent syncs of the same project
+        synced_revision = Project.objects.select_for_update().values_list('synced_revision', flat=True).get(pk=project.pk)
+        if synced_revision == new_commit.hexsha:
+            return None
+        upserts, deletes = diff_revisions(repo, synced_revision, new_commit)
+        paths = list(upserts)
+
+        # New files follow the rest of the project onto the host
+        hosted = File.objects.filter(project=project, to_host=True).exists()
+
+        changes = []
+        if deletes:
+            removed = File.objects.filter(project=project, file_path__in=deletes)
+            host_updates += [(path, None) for path in removed.filter(to_host=True).values_list('file_path', flat=True)]
+            # The file_deleted signal records each deletion and bumps the tree version
+            _, deleted = removed.delete()
+            stats['deleted'] = deleted.get(File._meta.label, 0)
+
+        now = timezone.now()
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start:start + batch_size]
+            existing = {f.file_path: f for f in File.objects.filter(project=project, file_path__in=chunk).defer('content')}
+            to_create, to_update = [], []
+            for path in chunk:
+                content = read_blob(upserts[path])
+                file = existing.get(path)
+                if file is None:
+                    to_create.append(File(project=project, file_path=path, content=content,
+                                          extension=os.path.splitext(path)[1], to_host=hosted))
+                    if hosted:
+                        host_updates.append((path, content))
+                else:
+                    file.content = content
+                    file.version = F('version') + 1
+                    file.updated_at = now
+                    to_update.append(file)
+                    if file.to_host:
+                        host_updates.append((path, content))
+            File.objects.bulk_create(to_create)
+            File.objects.bulk_update(to_update, ['content', 'version', 'updated_at'])
+            changes += [(f.file_path, FileChange.CREATED) for f in to_create]
+            changes += [(f.file_path, FileChange.UPDATED) for f in to_update]
+            stats['added'] += len(to_create)
+            stats['modified'] += len(to_update)
+
+        Project.objects.filter(pk=project.pk).update(synced_revision=new_commit.hexsha, updated_at=now)
+        invalidate_listings(project.owner_id)
+        if stats['added']:
+            bump_tree_version(project.pk)
+        record_file_changes(project.pk, changes)
+
+        if host_updates:
+            def sync_host():
+                for file_path, content in host_updates:
+                    sync_file_to_host(project.name, file_path, content, content is not None)
+            transaction.on_commit(sync_host)
+
+    project.synced_revision = new_commit.hexsha
+    return stats
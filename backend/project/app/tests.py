@@ -1,3 +1,1352 @@
-from django.test import TestCase
+import io
+import os
+import gzip
+import asyncio
+import json
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import docker
+import git
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from requests.structures import CaseInsensitiveDict
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import Build, Project, File, FileChange, Container
+from .archives import UploadLimitHandler
+from .benchmarks import compare, run_benchmarks
+from .builds import BuildJob, BuildScheduler
+from .compose import ComposeError, build_slots, deploy_compose, load_compose, start_order
+from .docker_gc import collect_garbage
+from .health import CircuitBreaker, forget_breaker, get_breaker
+from .events import EventBroker, redeem_stream_ticket
+from . import events, metrics
+from .authentication import CachedRefreshToken, TokenBlacklist, user_cache
+from .profiling import load_profile
+from .proxy_cache import CacheEntry, ProxyCache, freshness_lifetime, is_storable
+from .ratelimit import CacheLimiter, LocalLimiter, ReleaseOnClose, TokenBucket, check_rate_limits
+from .revisions import revision_content
 
-# Create your tests here.
+
+@override_settings(LISTING_CACHE='default')
+class ListingQueryTests(TestCase):
+    """
+    Project and container listings issue a constant number of queries and are
+    served from the cache until a change invalidates them.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('owner', email='owner@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_projects(self, count):
+        # Invalidation runs on commit, which TestCase never reaches on its own
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                index = Project.objects.count()
+                project = Project.objects.create(name=f"project-{index}", owner=self.user, repository_url='https://example.com/repo.git')
+                Container.objects.create(project=project, container_id=f"id-{index}", container_name=f"project-{index}_container", status='running', port=8000 + index)
+
+    def test_project_listing_queries_do_not_grow_with_rows(self):
+        for count in (1, 10):
+            self.add_projects(count)
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/user/projects/')
+            self.assertEqual(len(response.data['projects']), Project.objects.count())
+            self.assertEqual(response.data['projects'][0]['owner']['username'], 'owner')
+
+    def test_container_listing_queries_do_not_grow_with_rows(self):
+        for count in (1, 10):
+            self.add_projects(count)
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/containers/')
+            self.assertEqual(len(response.data['containers']), Container.objects.count())
+            self.assertTrue(all(container['project'].startswith('project-') for container in response.data['containers']))
+
+    def test_listings_are_cached_until_a_change(self):
+        self.add_projects(3)
+        self.client.get('/api/user/projects/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/user/projects/')
+        self.assertEqual(len(response.data['projects']), 3)
+
+        self.add_projects(1)
+        response = self.client.get('/api/user/projects/')
+        self.assertEqual(len(response.data['projects']), 4)
+
+    def test_container_status_change_invalidates_listing(self):
+        self.add_projects(1)
+        self.client.get('/api/containers/')
+        container = Container.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            container.status = 'exited'
+            container.save(update_fields=['status', 'updated_at'])
+        response = self.client.get('/api/containers/')
+        self.assertEqual(response.data['containers'][0]['status'], 'exited')
+
+
+class FileTreeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='tree', owner=self.user, repository_url='https://example.com/repo.git')
+        for file_path in ('src/app.py', 'src/lib/util.py', 'README.md'):
+            File.objects.create(project=self.project, file_path=file_path, content='x', extension=file_path[file_path.rindex('.'):])
+
+    def tree(self, etag=None, **params):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/api/projects/tree/tree/', params, headers=headers)
+
+    def test_tree_is_nested(self):
+        response = self.tree()
+        self.assertEqual(response.data['tree'], [
+            {'name': 'src', 'type': 'folder', 'children': [
+                {'name': 'lib', 'type': 'folder', 'children': [{'name': 'util.py', 'type': 'file', 'extension': '.py'}]},
+                {'name': 'app.py', 'type': 'file', 'extension': '.py'},
+            ]},
+            {'name': 'README.md', 'type': 'file', 'extension': '.md'},
+        ])
+
+    def test_path_lists_direct_children(self):
+        response = self.tree(path='src')
+        self.assertEqual(response.data['tree'], [
+            {'name': 'lib', 'type': 'folder', 'has_children': True},
+            {'name': 'app.py', 'type': 'file', 'extension': '.py'},
+        ])
+
+    def test_unchanged_tree_is_not_modified(self):
+        etag = self.tree()['ETag']
+        with self.assertNumQueries(1):
+            response = self.tree(etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Edits leave the tree alone, new files do not
+        File.objects.filter(file_path='README.md').update(content='y')
+        self.assertEqual(self.tree(etag).status_code, 304)
+        File.objects.create(project=self.project, file_path='src/new.py', content='', extension='.py')
+        self.assertEqual(self.tree(etag).status_code, 200)
+
+    def test_renames_change_the_tree(self):
+        etag = self.tree()['ETag']
+        file = File.objects.get(file_path='README.md')
+        file.file_path = 'docs/README.md'
+        file.save()
+        self.assertEqual(self.tree(etag).status_code, 200)
+        self.assertEqual(list(FileChange.objects.filter(project=self.project).order_by('seq').values_list('file_path', 'operation'))[-2:],
+                         [('README.md', FileChange.DELETED), ('docs/README.md', FileChange.CREATED)])
+
+    def test_directories_have_their_own_etag(self):
+        etag = self.tree(path='src')['ETag']
+        self.assertEqual(self.tree(etag, path='src/').status_code, 304)
+        self.assertEqual(self.tree(etag, path='src/lib').status_code, 200)
+        self.assertEqual(self.tree(etag).status_code, 200)
+
+
+class FileContentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='content', owner=self.user, repository_url='https://example.com/repo.git')
+        self.content = ''.join(f'line {number}\n' for number in range(1, 501))
+        File.objects.create(project=self.project, file_path='src/app.py', content=self.content, extension='.py')
+
+    def get(self, headers=None, **params):
+        return self.client.get('/api/projects/content/files/src/app.py/', params, headers=headers or {})
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.data['content'], self.content)
+        self.assertEqual(self.get({'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.get({'If-Modified-Since': response['Last-Modified']}).status_code, 304)
+
+        self.client.post('/api/projects/content/files/src/app.py/', {'content': 'changed'}, format='json')
+        response = self.get({'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['content'], 'changed')
+
+    def test_byte_ranges(self):
+        response = self.get({'Range': 'bytes=0-6'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'line 1\n')
+        self.assertEqual(response['Content-Range'], f'bytes 0-6/{len(self.content)}')
+
+        self.assertEqual(self.get({'Range': 'bytes=-4'}).content, b'500\n')
+        self.assertEqual(self.get({'Range': f'bytes={len(self.content)}-'}).status_code, 416)
+        # A changed file is sent in full
+        self.assertEqual(self.get({'Range': 'bytes=0-6', 'If-Range': '"stale"'}).status_code, 200)
+
+    def test_line_ranges(self):
+        response = self.get(start_line=2, end_line=3)
+        self.assertEqual(response.data['content'], 'line 2\nline 3\n')
+        self.assertEqual(response.data['total_lines'], 500)
+        self.assertEqual(self.get(start_line=3, end_line=2).status_code, 400)
+
+    def test_large_responses_are_compressed(self):
+        response = self.get({'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content))['content'], self.content)
+
+    def test_stale_version_conflicts(self):
+        version = self.get().data['version']
+        self.client.post('/api/projects/content/files/src/app.py/', {'content': 'first', 'version': version}, format='json')
+        response = self.client.post('/api/projects/content/files/src/app.py/', {'content': 'second', 'version': version}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current_version'], version + 1)
+
+
+class CodeSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='search', owner=self.user, repository_url='https://example.com/repo.git')
+        File.objects.create(project=self.project, file_path='src/app.py', content='import os\nprint("Hello World")\n', extension='.py')
+        File.objects.create(project=self.project, file_path='README.md', content='100% coverage_report\n', extension='.md')
+
+    def search(self, **params):
+        return self.client.get('/api/projects/search/search/', params)
+
+    def test_plain_search_is_case_insensitive_ilike(self):
+        sql = str(File.objects.filter(content__ilike='x').query)
+        if connection.vendor == 'postgresql':
+            self.assertIn('ILIKE', sql)
+            self.assertNotIn('UPPER', sql)
+        response = self.search(q='hello world')
+        self.assertEqual(response.data['total_files'], 1)
+        self.assertEqual(response.data['results'][0]['matches'], [{'line': 2, 'column': 8, 'text': 'print("Hello World")'}])
+
+    def test_like_wildcards_are_literal(self):
+        self.assertEqual(self.search(q='100% c').data['total_files'], 1)
+        self.assertEqual(self.search(q='100%_').data['total_files'], 0)
+
+    def test_query_length_is_limited(self):
+        with self.settings(SEARCH_MAX_QUERY_LENGTH=5):
+            self.assertEqual(self.search(q='x' * 6).status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Regex searches run in Postgres')
+    def test_regex_search_positions_come_from_postgres(self):
+        response = self.search(q='w(or)ld', regex='true')
+        self.assertEqual(response.data['results'][0]['matches'], [{'line': 2, 'column': 14, 'text': 'print("Hello World")'}])
+        self.assertEqual(self.search(q='(', regex='true').status_code, 400)
+
+
+class SyncRepositoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        cache_dir = override_settings(REPO_CACHE_DIR=os.path.join(self.directory, 'mirrors'))
+        cache_dir.enable()
+        self.addCleanup(cache_dir.disable)
+        self.upstream = git.Repo.init(os.path.join(self.directory, 'upstream'))
+        self.project = Project.objects.create(name='synced', owner=self.user, repository_url=self.upstream.working_dir)
+
+    def commit(self, files, removed=()):
+        for file_path, content in files.items():
+            path = os.path.join(self.upstream.working_dir, file_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as target:
+                target.write(content)
+        if files:
+            self.upstream.index.add(list(files))
+        if removed:
+            self.upstream.index.remove(list(removed), working_tree=True)
+        author = git.Actor('Upstream', 'upstream@example.com')
+        return self.upstream.index.commit('change', author=author, committer=author).hexsha
+
+    def sync(self):
+        return self.client.post('/api/projects/synced/sync/')
+
+    def test_only_changed_files_are_applied(self):
+        self.commit({'app.py': 'v1', 'src/util.py': 'u1', 'old.txt': 'old'})
+        response = self.sync()
+        self.assertEqual(response.data['added'], 3)
+
+        seq = Project.objects.get(pk=self.project.pk).change_seq
+        revision = self.commit({'app.py': 'v2', 'new.md': 'new'}, removed=['old.txt'])
+        response = self.sync()
+        self.assertEqual((response.data['added'], response.data['modified'], response.data['deleted']), (1, 1, 1))
+        self.assertEqual(response.data['revision'], revision)
+        self.assertEqual(dict(File.objects.values_list('file_path', 'content')), {'app.py': 'v2', 'src/util.py': 'u1', 'new.md': 'new'})
+        self.assertEqual(File.objects.get(file_path='src/util.py').version, 1)
+        self.assertEqual(sorted(FileChange.objects.filter(project=self.project, seq__gt=seq).values_list('file_path', 'operation')),
+                         [('app.py', FileChange.UPDATED), ('new.md', FileChange.CREATED), ('old.txt', FileChange.DELETED)])
+
+    def test_unchanged_upstream_is_up_to_date(self):
+        self.commit({'app.py': 'v1'})
+        self.sync()
+        response = self.sync()
+        self.assertEqual(response.data['message'], 'Already up to date.')
+
+    def test_unreachable_revision_reimports(self):
+        self.commit({'app.py': 'v1'})
+        self.sync()
+        # Gone upstream after a force push
+        for revision in ('0' * 40, 'deadbeef'):
+            Project.objects.filter(pk=self.project.pk).update(synced_revision=revision)
+            response = self.sync()
+            self.assertEqual((response.data['added'], response.data['modified']), (0, 1))
+
+    def test_unknown_branch_is_rejected(self):
+        self.commit({'app.py': 'v1'})
+        response = self.client.post('/api/projects/synced/sync/', {'branch': 'missing'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def archive(self, files):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        return SimpleUploadedFile('project.tar.gz', buffer.getvalue())
+
+    def upload(self, name, files):
+        return self.client.post('/api/import-archive/', {'project_name': name, 'archive': self.archive(files)}, format='multipart')
+
+    def test_import_creates_files(self):
+        response = self.upload('imported', {'app.py': b'print(1)', 'src/util.py': b'x = 1'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(File.objects.values_list('file_path', flat=True)), ['app.py', 'src/util.py'])
+
+    def test_oversized_upload_is_refused_before_parsing(self):
+        limits = {**settings.ARCHIVE_IMPORT_LIMITS, 'max_upload_bytes': 100}
+        with self.settings(ARCHIVE_IMPORT_LIMITS=limits):
+            response = self.upload('big', {'app.py': b'x' * 1000})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Project.objects.filter(name='big').exists())
+
+    def test_upload_limit_handler_stops_reading(self):
+        handler = UploadLimitHandler(10)
+        self.assertEqual(handler.receive_data_chunk(b'x' * 10, 0), b'x' * 10)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'x', 10)
+        self.assertTrue(handler.exceeded)
+
+    def test_duplicate_name_conflicts(self):
+        self.upload('twice', {'app.py': b''})
+        self.assertEqual(self.upload('twice', {'app.py': b''}).status_code, 409)
+
+    def test_concurrent_create_conflicts(self):
+        Project.objects.create(name='raced', owner=self.user)
+        # The other request creates the project between the check and the insert
+        with mock.patch('django.db.models.query.QuerySet.exists', return_value=False):
+            self.assertEqual(self.upload('raced', {'app.py': b''}).status_code, 409)
+
+    def test_sync_without_upstream_is_rejected(self):
+        self.upload('offline', {'app.py': b''})
+        response = self.client.post('/api/projects/offline/sync/')
+        self.assertEqual(response.status_code, 400)
+
+
+class ForkProjectTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='source', owner=self.user, repository_url='https://example.com/repo.git')
+        for file_path in ('src/app.py', 'src_old/app.py', 'README.md'):
+            File.objects.create(project=self.project, file_path=file_path, content=file_path, extension='.py')
+        self.project.files.update(to_host=True, version=4)
+
+    def fork(self, **data):
+        return self.client.post('/api/projects/source/fork/', data, format='json')
+
+    def test_files_are_copied(self):
+        response = self.fork(name='copy')
+        self.assertEqual(response.status_code, 201)
+        fork = Project.objects.get(name='copy')
+        self.assertEqual(
+            sorted(fork.files.values_list('file_path', 'content', 'to_host', 'version')),
+            [('README.md', 'README.md', False, 1), ('src/app.py', 'src/app.py', False, 1), ('src_old/app.py', 'src_old/app.py', False, 1)],
+        )
+        self.assertEqual(self.project.files.count(), 3)
+
+    def test_directory_fork_matches_the_directory_only(self):
+        self.fork(name='copy', path='/src/')
+        fork = Project.objects.get(name='copy')
+        self.assertEqual(list(fork.files.values_list('file_path', flat=True)), ['src/app.py'])
+        # Syncing would bring back the whole upstream repository
+        self.assertEqual(fork.repository_url, '')
+        self.assertEqual(self.client.post('/api/projects/copy/sync/').status_code, 400)
+
+    def test_fork_queries_do_not_grow_with_files(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.fork(name='small')
+        File.objects.bulk_create([File(project=self.project, file_path=f'bulk/{index}.py', content='') for index in range(50)])
+        with self.assertNumQueries(len(queries)):
+            self.fork(name='large')
+        self.assertEqual(Project.objects.get(name='large').files.count(), 53)
+
+    def test_existing_name_is_rejected(self):
+        self.assertEqual(self.fork(name='source').status_code, 409)
+
+    def test_name_taken_concurrently_is_a_conflict(self):
+        with mock.patch('project.app.views.copy_project_files', side_effect=IntegrityError('duplicate key')):
+            self.assertEqual(self.fork(name='copy').status_code, 409)
+
+    def test_description_must_be_a_string(self):
+        self.assertEqual(self.fork(name='copy', description=['x']).status_code, 400)
+        self.assertFalse(Project.objects.filter(name='copy').exists())
+
+
+@mock.patch('project.app.views.remove_directories_in_background')
+@mock.patch('project.app.views.remove_project_network')
+@mock.patch('project.app.views.remove_project_image')
+@mock.patch('project.app.views.remove_docker_container')
+@mock.patch('project.app.views.get_docker_client')
+class DeleteProjectTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='doomed', owner=self.user, repository_url='https://example.com/repo.git')
+        File.objects.bulk_create([File(project=self.project, file_path=f'{index}.py', content='') for index in range(12)])
+        Container.objects.create(project=self.project, container_id='abc', container_name='doomed_container', status='running', port=8000)
+
+    def delete(self, query=''):
+        return self.client.delete(f'/api/projects/doomed/delete/{query}')
+
+    @override_settings(PROJECT_DELETE_BATCH_SIZE=5)
+    def test_files_are_deleted_in_batches(self, get_client, remove_container, remove_image, remove_network, remove_directories):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.delete()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(' LIMIT ' in query['sql'] for query in queries.captured_queries if query['sql'].startswith('DELETE')), 3)
+        self.assertFalse(Project.objects.exists())
+        self.assertFalse(File.objects.exists())
+        remove_container.assert_called_once_with(get_client.return_value, 'abc')
+        # Directories are removed off the request
+        self.assertIn(os.path.join(settings.REPOS_DIR, 'doomed'), remove_directories.call_args.args[0])
+
+    def test_docker_errors_keep_the_project_unless_forced(self, get_client, remove_container, remove_image, remove_network, remove_directories):
+        remove_container.side_effect = docker.errors.APIError('unreachable')
+        self.assertEqual(self.delete().status_code, 500)
+        self.assertEqual(File.objects.count(), 12)
+        self.assertEqual(self.delete('?force=true').status_code, 200)
+        self.assertFalse(Project.objects.exists())
+
+
+class FileBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='batch', owner=self.user, repository_url='https://example.com/repo.git')
+
+    def batch(self, *operations):
+        return self.client.post('/api/projects/batch/batch/', {'operations': list(operations)}, format='json')
+
+    def edit(self, path, content):
+        return {'op': 'update', 'file_path': path, 'content': content}
+
+    def rename(self, path, new_path):
+        return {'op': 'rename', 'file_path': path, 'new_path': new_path}
+
+    def history(self, path):
+        return [revision_content(self.project, path, number) for number in (1, 2)]
+
+    def test_operations_are_applied_together(self):
+        self.batch({'op': 'create', 'file_path': 'a.py', 'content': 'a'}, {'op': 'create', 'file_path': 'b.py', 'content': 'b'})
+        seq = Project.objects.get(pk=self.project.pk).change_seq
+        response = self.batch(self.edit('a.py', 'a2'), {'op': 'delete', 'file_path': 'b.py'}, self.rename('a.py', 'src/a.py'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['files'], [{'file_path': 'src/a.py', 'version': 3}])
+        self.assertEqual(list(File.objects.values_list('file_path', 'content')), [('src/a.py', 'a2')])
+        # Every path once in the change feed
+        self.assertEqual(sorted(FileChange.objects.filter(project=self.project, seq__gt=seq).values_list('file_path', 'operation')),
+                         [('a.py', FileChange.DELETED), ('b.py', FileChange.DELETED), ('src/a.py', FileChange.CREATED)])
+
+    def test_conflicts_apply_nothing(self):
+        self.batch({'op': 'create', 'file_path': 'a.py', 'content': 'a'}, {'op': 'create', 'file_path': 'b.py', 'content': 'b'})
+        response = self.batch(
+            {'op': 'update', 'file_path': 'a.py', 'content': 'a2', 'version': 1},
+            {'op': 'update', 'file_path': 'b.py', 'content': 'b2', 'version': 2},
+            {'op': 'create', 'file_path': 'a.py', 'content': ''},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([(c['index'], c['reason']) for c in response.data['conflicts']], [(1, 'stale'), (2, 'exists')])
+        self.assertEqual(dict(File.objects.values_list('file_path', 'content')), {'a.py': 'a', 'b.py': 'b'})
+
+    def test_invalid_paths_are_rejected(self):
+        self.assertEqual(self.batch({'op': 'create', 'file_path': '../etc/passwd', 'content': ''}).status_code, 400)
+        self.assertEqual(self.batch({'op': 'chmod', 'file_path': 'a.py'}).status_code, 400)
+
+    def test_swapped_files_keep_their_history(self):
+        self.batch({'op': 'create', 'file_path': 'a.py', 'content': 'a1'}, {'op': 'create', 'file_path': 'b.py', 'content': 'b1'})
+        self.batch(self.edit('a.py', 'a2'), self.edit('b.py', 'b2'))
+        response = self.batch(self.rename('a.py', 'tmp.py'), self.rename('b.py', 'a.py'), self.rename('tmp.py', 'b.py'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.history('a.py'), ['b1', 'b2'])
+        self.assertEqual(self.history('b.py'), ['a1', 'a2'])
+
+    def test_chained_renames_keep_their_history(self):
+        self.batch({'op': 'create', 'file_path': 'a.py', 'content': 'a1'}, {'op': 'create', 'file_path': 'b.py', 'content': 'b1'})
+        self.batch(self.edit('a.py', 'a2'), self.edit('b.py', 'b2'))
+        self.batch(self.rename('b.py', 'c.py'), self.rename('a.py', 'b.py'))
+        self.assertEqual(self.history('b.py'), ['a1', 'a2'])
+        self.assertEqual(self.history('c.py'), ['b1', 'b2'])
+        self.assertEqual(self.history('a.py'), [None, None])
+
+    def test_revision_queries_do_not_grow_with_files(self):
+        counts = []
+        for count in (2, 20):
+            self.batch(*[{'op': 'create', 'file_path': f'{count}/{index}.py', 'content': 'x'} for index in range(count)])
+            self.batch(*[self.edit(f'{count}/{index}.py', 'y') for index in range(count)])
+            with CaptureQueriesContext(connection) as queries:
+                self.batch(*[self.edit(f'{count}/{index}.py', 'z') for index in range(count)])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(revision_content(self.project, '20/7.py', 3), 'z')
+
+
+class FileChangeFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.project = Project.objects.create(name='feed', owner=self.user, repository_url='https://example.com/repo.git')
+        self.file = File.objects.create(project=self.project, file_path='app.py', content='x', extension='.py')
+
+    def changes(self, since=0):
+        response = self.client.get('/api/projects/feed/changes/', {'since': since})
+        return [(change['file_path'], change['operation']) for change in response.data['changes']]
+
+    def test_edits_are_recorded(self):
+        file = File.objects.get(pk=self.file.pk)
+        file.content = 'y'
+        file.save()
+        self.assertEqual(self.changes(), [('app.py', 'created'), ('app.py', 'updated')])
+
+    def test_to_host_alone_is_not_a_change(self):
+        with mock.patch('project.app.signals.sync_file_to_host'):
+            file = File.objects.get(pk=self.file.pk)
+            file.to_host = True
+            file.save()
+            self.file.to_host = False
+            self.file.save(update_fields=['to_host'])
+        self.assertEqual(self.changes(), [('app.py', 'created')])
+
+    @mock.patch('project.app.views.remove_directories_in_background')
+    @mock.patch('project.app.views.remove_project_image')
+    @mock.patch('project.app.views.remove_docker_container')
+    @mock.patch('project.app.views.get_docker_client')
+    def test_container_delete_leaves_the_feed_alone(self, get_client, remove_container, remove_image, remove_directories):
+        File.objects.filter(pk=self.file.pk).update(to_host=True)
+        Container.objects.create(project=self.project, container_id='abc', container_name='feed_container', status='running', port=8000)
+        response = self.client.delete('/api/containers/delete/', {'container_id': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(File.objects.get(pk=self.file.pk).to_host)
+        remove_directories.assert_called_once()
+        self.assertEqual(self.changes(), [('app.py', 'created')])
+
+
+class ProcessScheduler(BuildScheduler):
+    """
+    A scheduler standing in for one backend process. Started jobs are kept
+    instead of run on threads, finish() runs them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = []
+
+    def _start(self, job):
+        self.started.append(job)
+
+    def _start_polling(self):
+        pass
+
+    def finish(self, job):
+        self.started.remove(job)
+        self._run(job)
+
+
+class BuildSchedulerTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'user-{index}') for index in range(3)]
+        # Two backend processes sharing the database
+        self.first = ProcessScheduler(max_concurrent=2, max_per_user=1)
+        self.second = ProcessScheduler(max_concurrent=2, max_per_user=1)
+
+    def submit(self, scheduler, key, user, priority='normal'):
+        return scheduler.submit(key, user.pk, lambda job: f'built {key}', priority=priority, description=key)
+
+    def test_concurrency_is_capped_across_processes(self):
+        first, _ = self.submit(self.first, 'a', self.users[0])
+        second, _ = self.submit(self.second, 'b', self.users[1])
+        third, _ = self.submit(self.second, 'c', self.users[2])
+        self.assertEqual([first.state, second.state, third.state], ['running', 'running', 'queued'])
+        self.assertEqual(self.second.describe(third)['queue_position'], 0)
+
+        self.first.finish(first)
+        self.second.dispatch()
+        self.assertEqual(third.state, 'running')
+
+    def test_multi_slot_jobs_wait_for_enough_slots(self):
+        first, _ = self.submit(self.first, 'a', self.users[0])
+        compose, _ = self.second.submit('b', self.users[1].pk, lambda job: None, slots=4)
+        single, _ = self.submit(self.second, 'c', self.users[2])
+        # Clamped to the cap, and the single slot job queues behind it
+        self.assertEqual(Build.objects.get(job_id=compose.id).slots, 2)
+        self.assertEqual([compose.state, single.state], ['queued', 'queued'])
+
+        self.first.finish(first)
+        self.second.dispatch()
+        self.assertEqual([compose.state, single.state], ['running', 'queued'])
+
+        # Done building, the job waits for its services without holding slots
+        compose.release_slots()
+        self.second.dispatch()
+        self.assertEqual(single.state, 'running')
+
+    def test_create_requests_answer_before_the_build_runs(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        Project.objects.create(name='app', owner=self.users[0], build_file_path='Dockerfile')
+        with mock.patch('project.app.views.build_scheduler', self.first), mock.patch.object(BuildJob, 'wait') as wait:
+            response = client.post('/api/containers/create/', {'project_name': 'app'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['build']['id'], self.first.started[0].id)
+        wait.assert_not_called()
+
+    def test_compose_builds_take_a_slot_per_parallel_build(self):
+        services = {name: {'build': {'context': name}} for name in ('api', 'worker', 'web')}
+        services['db'] = {'build': None, 'image': 'postgres'}
+        with self.settings(COMPOSE_BUILD_WORKERS=2):
+            self.assertEqual(build_slots(services), 2)
+        self.assertEqual(build_slots({'db': services['db']}), 1)
+
+    def test_per_user_limit_spans_processes(self):
+        self.submit(self.first, 'a', self.users[0])
+        job, _ = self.submit(self.second, 'b', self.users[0])
+        self.assertEqual(job.state, 'queued')
+
+    def test_duplicates_coalesce_across_processes(self):
+        job, created = self.submit(self.first, 'a', self.users[0])
+        duplicate, duplicate_created = self.submit(self.second, 'a', self.users[0])
+        self.assertTrue(created)
+        self.assertFalse(duplicate_created)
+        self.assertEqual(duplicate.id, job.id)
+        self.assertEqual(self.second.describe(duplicate)['coalesced_requests'], 1)
+
+    def test_status_of_a_job_of_another_process(self):
+        job, _ = self.submit(self.first, 'a', self.users[0])
+        self.first.finish(job)
+        other = self.second.get(job.id)
+        self.assertEqual(other.state, 'succeeded')
+        self.assertTrue(other.wait(0))
+        self.assertEqual(other.result, 'built a')
+
+    def test_queued_jobs_start_by_priority(self):
+        self.submit(self.first, 'a', self.users[0])
+        self.submit(self.first, 'b', self.users[1])
+        low, _ = self.submit(self.second, 'c', self.users[2], priority='low')
+        high, _ = self.submit(self.second, 'd', self.users[2], priority='high')
+        self.assertEqual(self.second.position(high), 0)
+        self.assertEqual(self.second.position(low), 1)
+
+    def test_jobs_of_a_dead_process_are_failed(self):
+        job, _ = self.submit(self.first, 'a', self.users[0])
+        Build.objects.filter(job_id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.second.dispatch()
+        self.assertEqual(self.second.get(job.id).state, 'failed')
+        # The key is free again
+        self.assertTrue(self.submit(self.second, 'a', self.users[0])[1])
+
+
+class ComposeTests(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name='stack', owner=User.objects.create_user('owner'))
+
+    def load(self, content, path='deploy/docker-compose.yml'):
+        File.objects.update_or_create(project=self.project, file_path=path, defaults={'content': content})
+        return load_compose(self.project, path)
+
+    def test_services_are_resolved(self):
+        services = self.load(
+            'services:\n'
+            '  db:\n    image: postgres\n'
+            '  api:\n    build: ../api\n    ports: ["127.0.0.1:8080:80", "9000/udp"]\n    depends_on: [db]\n'
+            '  web:\n    build: {context: web, dockerfile: Dockerfile.prod}\n    depends_on: {api: {condition: service_started}}\n'
+        )
+        self.assertEqual(services['api']['build'], {'context': 'api', 'dockerfile': 'Dockerfile', 'args': {}})
+        self.assertEqual(services['web']['build']['context'], 'deploy/web')
+        self.assertEqual((services['api']['ports'], services['api']['published_port']), ({'80/tcp': 8080, '9000/udp': None}, 8080))
+        self.assertEqual(start_order(services), [['db'], ['api'], ['web']])
+
+    def test_invalid_files_are_rejected(self):
+        for content in (
+            'services: {}\n',
+            'services:\n  api:\n    build: ../../outside\n',
+            'services:\n  api:\n    ports: ["80"]\n',
+            'services:\n  api:\n    image: x\n    depends_on: [db]\n',
+            'services:\n  a:\n    image: x\n    depends_on: [b]\n  b:\n    image: x\n    depends_on: [a]\n',
+            'services:\n  api:\n    image: x\n    ports: ["http:80"]\n',
+        ):
+            with self.subTest(content=content), self.assertRaises(ComposeError):
+                self.load(content)
+
+    @mock.patch('project.app.compose.wait_until_ready', return_value=True)
+    @mock.patch('project.app.compose.prepare_build_context')
+    @mock.patch('project.app.compose.get_docker_client')
+    def test_builds_never_exceed_the_granted_slots(self, get_client, prepare, wait):
+        get_client.return_value.containers.run.side_effect = lambda **options: SimpleNamespace(id=options['name'])
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def build(client, project_name, service_name, service):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return service_name
+
+        services = self.load('services:\n' + ''.join(f'  {name}:\n    build: {name}\n' for name in ('a', 'b', 'c', 'd', 'e')))
+        job = SimpleNamespace(slots=2, progress=lambda message: None, release_slots=mock.Mock())
+        with mock.patch('project.app.compose._build_service', side_effect=build), self.settings(COMPOSE_BUILD_WORKERS=4):
+            started = deploy_compose(self.project, services, job)
+        self.assertEqual(len(started), 5)
+        self.assertEqual(peak[0], 2)
+        # Waiting for the services to answer does not hold build slots
+        job.release_slots.assert_called_once_with()
+
+
+@mock.patch('project.app.views.get_docker_client')
+class BulkContainerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ('web', 'api'):
+            project = Project.objects.create(name=name, owner=self.user, repository_url='https://example.com/repo.git')
+            for index in range(2):
+                Container.objects.create(project=project, container_id=f'{name}-{index}', container_name=f'{name}_{index}', status='running', port=8000 + index)
+        other = Project.objects.create(name='other', owner=User.objects.create_user('other'))
+        Container.objects.create(project=other, container_id='theirs', container_name='theirs', status='running', port=9000)
+
+    def bulk(self, **data):
+        return self.client.post('/api/containers/bulk/', data, format='json')
+
+    def test_project_containers_are_stopped(self, get_client):
+        with mock.patch('project.app.views.apply_container_action', return_value='exited') as apply_action:
+            response = self.bulk(action='stop', project_name='web', timeout=3)
+        self.assertEqual((response.data['status'], response.data['succeeded']), ('success', 2))
+        self.assertEqual(sorted(call.args[1:] for call in apply_action.call_args_list), [('web-0', 'stop', 3), ('web-1', 'stop', 3)])
+        self.assertEqual(dict(Container.objects.values_list('container_id', 'status')),
+                         {'web-0': 'exited', 'web-1': 'exited', 'api-0': 'running', 'api-1': 'running', 'theirs': 'running'})
+
+    def test_failures_are_reported_per_container(self, get_client):
+        def apply_action(client, container_id, action, timeout):
+            if container_id == 'api-1':
+                raise docker.errors.APIError('boom')
+            return 'running'
+
+        with mock.patch('project.app.views.apply_container_action', side_effect=apply_action):
+            response = self.bulk(action='restart', container_ids=['api-1', 'theirs', 'api-0'])
+        self.assertEqual(response.data['status'], 'partial')
+        self.assertEqual([(result['container_id'], result['status']) for result in response.data['results']],
+                         [('api-1', 'error'), ('theirs', 'error'), ('api-0', 'success')])
+
+    def test_queries_do_not_grow_with_containers(self, get_client):
+        counts = []
+        with mock.patch('project.app.views.apply_container_action', return_value='exited'):
+            for project_name in ('web', None):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.bulk(action='stop', **({'project_name': project_name} if project_name else {'all': True}))
+                counts.append(len(queries))
+        self.assertEqual(response.data['succeeded'], 4)
+        self.assertEqual(counts[0], counts[1])
+
+    @mock.patch('project.app.views.remove_directories_in_background')
+    @mock.patch('project.app.views.remove_project_image')
+    def test_deleted_containers_are_removed(self, remove_image, remove_directories, get_client):
+        with mock.patch('project.app.views.apply_container_action', return_value='removed'):
+            response = self.bulk(action='delete', all=True)
+        self.assertEqual(response.data['succeeded'], 4)
+        self.assertEqual(list(Container.objects.values_list('container_id', flat=True)), ['theirs'])
+
+    @mock.patch('project.app.views.remove_directories_in_background')
+    @mock.patch('project.app.views.remove_project_image')
+    def test_files_stay_on_the_host_until_the_last_container_is_deleted(self, remove_image, remove_directories, get_client):
+        File.objects.create(project=Project.objects.get(name='web'), file_path='app.py', content='x', extension='.py')
+        Project.objects.get(name='web').files.update(to_host=True)
+        with mock.patch('project.app.views.apply_container_action', return_value='removed'):
+            self.bulk(action='delete', container_ids=['web-0'])
+            self.assertTrue(File.objects.get(file_path='app.py').to_host)
+            remove_directories.assert_not_called()
+            self.bulk(action='delete', container_ids=['web-1'])
+        self.assertFalse(File.objects.get(file_path='app.py').to_host)
+        remove_directories.assert_called_once_with([os.path.join(settings.REPOS_DIR, 'web')])
+
+    def test_invalid_requests_are_rejected(self, get_client):
+        self.assertEqual(self.bulk(action='pause', all=True).status_code, 400)
+        self.assertEqual(self.bulk(action='stop').status_code, 400)
+        self.assertEqual(self.bulk(action='stop', all=True, timeout=-1).status_code, 400)
+
+
+class DockerGarbageCollectorTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner', password='secret')
+        now = timezone.now()
+        for name, age in (('fresh', 1), ('stale', 30)):
+            project = Project.objects.create(name=name, owner=user)
+            Container.objects.create(project=project, container_id=f'{name}-id', container_name=name, status='exited', port=8000)
+            Container.objects.filter(project=project).update(updated_at=now - timedelta(days=age))
+        running = Project.objects.create(name='live', owner=user)
+        Container.objects.create(project=running, container_id='live-id', container_name='live', status='running', port=8001)
+
+        self.client = mock.Mock()
+        self.client.api.containers.side_effect = lambda all=False, size=False, filters=None: (
+            [{'Id': 'orphan', 'SizeRw': 10}, {'Id': 'fresh-id', 'SizeRw': 10}] if filters else [{'ImageID': 'sha:busy'}]
+        )
+        self.client.api.inspect_container.return_value = {'Image': 'sha:live'}
+        images = [
+            {'Id': f'sha:{name}', 'RepoTags': [f'{name}_image:latest'], 'Size': 100, 'SharedSize': 20, 'Created': 0}
+            for name in ('fresh', 'stale', 'live', 'busy')
+        ] + [{'Id': 'sha:base', 'RepoTags': ['python:3.12'], 'Size': 500, 'Created': 0}]
+        self.client.df.return_value = {'Images': images, 'LayersSize': 900, 'BuildCache': []}
+        self.client.images.prune.return_value = {'ImagesDeleted': [{'Deleted': 'sha:x'}], 'SpaceReclaimed': 5}
+        self.client.images.prune_builds.return_value = {'CachesDeleted': ['a', 'b'], 'SpaceReclaimed': 7}
+        patcher = mock.patch('project.app.docker_gc.get_docker_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_untracked_containers_and_least_recently_used_images_go(self):
+        report = collect_garbage(budget_bytes=850)
+        self.client.api.remove_container.assert_called_once_with('orphan', v=True)
+        # Images of running containers and of other images are never evicted
+        self.assertEqual(report['images_evicted'], ['stale_image:latest'])
+        self.client.images.remove.assert_called_once_with(image='sha:stale', noprune=False)
+        self.assertEqual(report['reclaimed_bytes'], 10 + 5 + 7 + 80)
+        self.assertEqual(report['images_bytes'], 820)
+
+        self.assertEqual(collect_garbage(budget_bytes=750)['images_evicted'], ['stale_image:latest', 'fresh_image:latest'])
+
+    def test_dry_run_removes_nothing(self):
+        report = collect_garbage(budget_bytes=0, dry_run=True)
+        self.assertEqual(report['containers_removed'], 1)
+        self.assertEqual(report['images_evicted'], ['stale_image:latest', 'fresh_image:latest'])
+        self.client.api.remove_container.assert_not_called()
+        self.client.images.remove.assert_not_called()
+        self.client.images.prune.assert_not_called()
+
+
+class StartContainerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        project = Project.objects.create(name='web', owner=self.user, repository_url='https://example.com/repo.git')
+        Container.objects.create(project=project, container_id='abc', container_name='web_container', status='exited', port=8000)
+
+    @mock.patch('project.app.health.publish')
+    @mock.patch('project.app.views.get_docker_client')
+    def test_start_answers_before_the_container_is_ready(self, get_client, publish):
+        get_client.return_value.containers.get.return_value.attrs = {'State': {'Status': 'running'}}
+        probing, answer = threading.Event(), threading.Event()
+
+        def probe(container):
+            probing.set()
+            return answer.wait(5), 'HTTP 200'
+
+        with mock.patch('project.app.health.probe', side_effect=probe):
+            response = self.client.post('/api/containers/abc/start/')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.data['ready'])
+            self.assertTrue(probing.wait(5))
+            # Held back in every worker, not just this one
+            self.assertIsNotNone(Container.objects.get(container_id='abc').starting_until)
+            answer.set()
+            for thread in threading.enumerate():
+                if thread.name.startswith('ready-'):
+                    thread.join(5)
+        self.assertIsNone(Container.objects.get(container_id='abc').starting_until)
+        self.assertEqual(get_breaker('abc').state, 'closed')
+        self.assertEqual(publish.call_args[0][:2], (self.user.pk, 'container.ready'))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch('project.app.health.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker('c1', failure_threshold=2, reset_timeout=10)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.allow(), (True, None))
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.allow(), (False, 10))
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 10
+        self.assertEqual(self.breaker.allow(), (True, None))
+        self.assertEqual(self.breaker.allow(), (False, 1))
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.now += 10
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.allow(), (True, None))
+
+
+@override_settings(PROXY_CLIENT_RATE=0, PROXY_CONTAINER_RATE=0, CIRCUIT_BREAKER_FAILURES=2)
+class ProxyBreakerTests(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name='app', owner=User.objects.create_user('owner'))
+        Container.objects.create(project=project, container_id='flaky', container_name='flaky', status='running', port=8000)
+        self.addCleanup(forget_breaker, 'flaky')
+
+    @mock.patch('project.app.views.requests.request', side_effect=requests.ConnectionError('refused'))
+    def test_failing_upstream_is_not_called_while_open(self, request):
+        self.assertEqual([self.client.get('/proxy/flaky/').status_code for _ in range(3)], [502, 502, 503])
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(self.client.get('/proxy/flaky/')['Retry-After'], str(settings.CIRCUIT_BREAKER_RESET_TIMEOUT))
+
+    @mock.patch('project.app.views.requests.request')
+    def test_starting_containers_are_held_back(self, request):
+        Container.objects.filter(container_id='flaky').update(starting_until=timezone.now() + timedelta(seconds=30))
+        response = self.client.get('/proxy/flaky/')
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        request.assert_not_called()
+        # A deadline left behind by a worker that died mid-check expires
+        Container.objects.filter(container_id='flaky').update(starting_until=timezone.now() - timedelta(seconds=1))
+        request.side_effect = requests.ConnectionError('refused')
+        self.assertEqual(self.client.get('/proxy/flaky/').status_code, 502)
+
+
+class ProxyCacheTests(SimpleTestCase):
+    def request(self, **headers):
+        return SimpleNamespace(headers=CaseInsensitiveDict(headers))
+
+    def response(self, status_code=200, body=b'body', **headers):
+        return SimpleNamespace(status_code=status_code, reason='OK', headers=CaseInsensitiveDict(headers)), body
+
+    def entry(self, request, **headers):
+        response, body = self.response(**headers)
+        return CacheEntry.from_response(request, response, body)
+
+    def test_storable_responses(self):
+        request = self.request()
+        self.assertTrue(is_storable(request, self.response(**{'Cache-Control': 'max-age=60'})[0]))
+        self.assertTrue(is_storable(request, self.response(ETag='"v1"')[0]))
+        self.assertFalse(is_storable(request, self.response()[0]))
+        self.assertFalse(is_storable(request, self.response(**{'Cache-Control': 'private, max-age=60'})[0]))
+        self.assertFalse(is_storable(request, self.response(**{'Cache-Control': 'max-age=60', 'Set-Cookie': 'a=b'})[0]))
+        self.assertFalse(is_storable(request, self.response(500, **{'Cache-Control': 'max-age=60'})[0]))
+        # Responses to authorized requests only when upstream marks them shared
+        authorized = self.request(Authorization='Bearer x')
+        self.assertFalse(is_storable(authorized, self.response(**{'Cache-Control': 'max-age=60'})[0]))
+        self.assertTrue(is_storable(authorized, self.response(**{'Cache-Control': 'public, max-age=60'})[0]))
+
+    def test_freshness_lifetime(self):
+        self.assertEqual(freshness_lifetime({'Cache-Control': 's-maxage=30, max-age=60'}), 30)
+        self.assertEqual(freshness_lifetime({'Date': 'Mon, 19 Oct 2026 10:00:00 GMT', 'Expires': 'Mon, 19 Oct 2026 10:02:00 GMT'}), 120)
+        self.assertIsNone(freshness_lifetime({}))
+
+    def test_variants_are_selected_by_vary_headers(self):
+        cache = ProxyCache(memory_bytes=10000)
+        for language in ('en', 'de'):
+            cache.store('c1', '/page', self.entry(self.request(**{'Accept-Language': language}), Vary='Accept-Language', **{'Cache-Control': 'max-age=60'}))
+        self.assertEqual(cache.lookup('c1', '/page', self.request(**{'Accept-Language': 'de'})).vary, {'accept-language': 'de'})
+        self.assertIsNone(cache.lookup('c1', '/page', self.request(**{'Accept-Language': 'fr'})))
+        self.assertIsNone(cache.lookup('c2', '/page', self.request(**{'Accept-Language': 'de'})))
+
+    def test_memory_is_bounded_least_recently_used_first(self):
+        entry = self.entry(self.request(), **{'Cache-Control': 'max-age=60'})
+        cache = ProxyCache(memory_bytes=entry.size * 2)
+        cache.store('c1', '/a', entry)
+        cache.store('c1', '/b', entry)
+        cache.lookup('c1', '/a', self.request())
+        cache.store('c1', '/c', entry)
+        self.assertIsNotNone(cache.lookup('c1', '/a', self.request()))
+        self.assertIsNone(cache.lookup('c1', '/b', self.request()))
+        self.assertEqual(cache.container_stats('c1')['evictions'], 1)
+
+    def test_disk_tier_outlives_memory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        entry = self.entry(self.request(), **{'Cache-Control': 'max-age=60', 'Content-Type': 'text/plain'})
+        ProxyCache(memory_bytes=10000, disk_dir=directory, disk_bytes=10000).store('c1', '/a', entry)
+
+        restarted = ProxyCache(memory_bytes=10000, disk_dir=directory, disk_bytes=10000)
+        cached = restarted.lookup('c1', '/a', self.request())
+        self.assertEqual((cached.body, cached.header('content-type')), (b'body', 'text/plain'))
+        self.assertTrue(cached.is_fresh())
+        restarted.purge('c1')
+        self.assertIsNone(ProxyCache(memory_bytes=10000, disk_dir=directory).lookup('c1', '/a', self.request()))
+
+    def test_revalidation_restarts_the_lifetime(self):
+        entry = self.entry(self.request(), ETag='"v1"', **{'Cache-Control': 'no-cache'})
+        self.assertFalse(entry.is_fresh())
+        not_modified, _ = self.response(304, **{'Cache-Control': 'max-age=60', 'ETag': '"v1"'})
+        revalidated = entry.revalidated(not_modified)
+        self.assertTrue(revalidated.is_fresh())
+        self.assertEqual(revalidated.header('cache-control'), 'max-age=60')
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        for clock in ('monotonic', 'time'):
+            patcher = mock.patch(f'project.app.ratelimit.time.{clock}', side_effect=lambda: self.now)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bucket_refills_at_the_rate(self):
+        bucket = TokenBucket(rate=2, burst=2)
+        self.assertEqual([bucket.take()[0] for _ in range(3)], [True, True, False])
+        self.assertEqual(bucket.take(), (False, 1))
+        self.now += 0.5
+        self.assertEqual(bucket.take(), (True, None))
+
+    def test_local_in_flight_limit(self):
+        limiter = LocalLimiter()
+        self.assertTrue(limiter.acquire('c1', 1))
+        self.assertFalse(limiter.acquire('c1', 1))
+        limiter.release('c1')
+        self.assertTrue(limiter.acquire('c1', 1))
+        self.assertEqual(limiter.in_flight, {'c1': 1})
+
+    def test_idle_buckets_are_dropped(self):
+        limiter = LocalLimiter(max_keys=2)
+        for key in ('a', 'b', 'a', 'c'):
+            limiter.take(key, 1, 1)
+        self.assertEqual(list(limiter.buckets), ['a', 'c'])
+
+    def test_cache_limiter_is_shared(self):
+        caches['default'].clear()
+        workers = [CacheLimiter('default'), CacheLimiter('default')]
+        self.assertEqual([worker.take('c1', 1, 3)[0] for worker in workers * 2], [True, True, True, False])
+        self.assertTrue(workers[0].acquire('c1', 1))
+        self.assertFalse(workers[1].acquire('c1', 1))
+        workers[0].release('c1')
+        self.assertTrue(workers[1].acquire('c1', 1))
+
+    @override_settings(PROXY_CLIENT_RATE=1, PROXY_CONTAINER_RATE=0, PROXY_BURST_SECONDS=1)
+    def test_clients_are_limited_separately(self):
+        container = SimpleNamespace(container_id='limited', rate_limit=None)
+        with mock.patch('project.app.ratelimit.limiter', LocalLimiter()):
+            self.assertIsNone(check_rate_limits(container, SimpleNamespace(META={'REMOTE_ADDR': '10.0.0.1'})))
+            self.assertEqual(check_rate_limits(container, SimpleNamespace(META={'REMOTE_ADDR': '10.0.0.1'})), 1)
+            self.assertIsNone(check_rate_limits(container, SimpleNamespace(META={'REMOTE_ADDR': '10.0.0.2'})))
+
+    def test_release_on_close_runs_once(self):
+        release = mock.Mock()
+        body = ReleaseOnClose([b'a', b'b'], release)
+        self.assertEqual(next(body), b'a')
+        body.close()
+        body.close()
+        release.assert_called_once_with()
+
+
+@override_settings(EVENTS_TICKET_CACHE='default')
+class EventTicketTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('owner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ticket(self):
+        return self.client.post('/api/events/ticket/').data['ticket']
+
+    async def test_ticket_opens_one_stream(self):
+        ticket = await sync_to_async(self.ticket)()
+        response = await self.async_client.get('/api/events/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await anext(aiter(response.streaming_content)), b'retry: 3000\nevent: ready\ndata: {}\n\n')
+        again = await self.async_client.get('/api/events/', {'ticket': ticket})
+        self.assertEqual(again.status_code, 401)
+
+    def test_expired_and_forged_tickets_are_refused(self):
+        ticket = self.ticket()
+        with self.settings(EVENTS_TICKET_TTL=-1):
+            self.assertIsNone(async_to_sync(redeem_stream_ticket)(ticket))
+        self.assertIsNone(async_to_sync(redeem_stream_ticket)(ticket[:-2] + 'xx'))
+        self.assertEqual(async_to_sync(redeem_stream_ticket)(ticket), self.user.pk)
+
+    def test_access_tokens_are_not_accepted_in_the_url(self):
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(self.client.get('/api/events/', {'token': token}).status_code, 401)
+
+
+class EventBrokerTests(TestCase):
+    def setUp(self):
+        # The Postgres LISTEN thread is covered by EventNotifyTests
+        patcher = mock.patch.object(EventBroker, '_ensure_listener')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_events_reach_the_users_streams(self):
+        broker = EventBroker()
+        with broker.subscribe(1) as first, broker.subscribe(1) as second, broker.subscribe(2) as other:
+            broker.deliver(1, {'event': 'container.updated', 'data': {}})
+            self.assertEqual((await first.get())['event'], 'container.updated')
+            self.assertEqual((await second.get())['event'], 'container.updated')
+            self.assertTrue(other.empty())
+        self.assertEqual(dict(broker.subscribers), {})
+
+    async def test_slow_streams_are_told_to_resync(self):
+        broker = EventBroker(queue_size=2)
+        with broker.subscribe(1) as queue:
+            for index in range(3):
+                broker.deliver(1, {'event': 'build.progress', 'data': {'index': index}})
+            await asyncio.sleep(0)
+            self.assertEqual(queue.qsize(), 1)
+            self.assertEqual((await queue.get())['event'], 'resync')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Events travel through NOTIFY on Postgres only')
+class EventNotifyTests(TransactionTestCase):
+    def setUp(self):
+        self.broker = EventBroker()
+        self.addCleanup(self.broker.stop)
+
+    def test_events_published_on_commit_reach_the_listener(self):
+        delivered = threading.Event()
+        with mock.patch.object(self.broker, 'deliver', side_effect=lambda *args: delivered.set()) as deliver:
+            self.broker._ensure_listener()
+            self.assertTrue(self.broker.listening.wait(10))
+            with transaction.atomic():
+                events.publish(1, 'project.updated', {'name': 'web'})
+                self.assertFalse(delivered.wait(0.5))
+            self.assertTrue(delivered.wait(10))
+        deliver.assert_called_once_with(1, {'event': 'project.updated', 'data': {'name': 'web'}})
+
+
+class BenchmarkTests(TestCase):
+    def test_file_scenarios_run(self):
+        user = User.objects.create_user('benchmark')
+        options = {'clone_files': [5], 'file_counts': [20], 'iterations': 3}
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        with self.settings(CLONE_TEMP_DIR=os.path.join(workdir, 'temp_repo')):
+            results = run_benchmarks(user, ['clone', 'files'], options)
+        # Clones go to the benchmark's own directory, removed afterwards
+        self.assertEqual(os.listdir(workdir), [])
+        self.assertEqual([result['name'] for result in results], ['clone.import', 'files.list', 'files.tree', 'files.content'])
+        self.assertEqual(File.objects.filter(project__name='bench_clone_5', file_path__startswith='src/').count(), 5)
+        self.assertEqual(results[3]['samples'], 3)
+
+    def test_slowdowns_over_the_threshold_are_regressions(self):
+        baseline = {'results': [
+            {'name': 'files.tree', 'files': 1000, 'p99_ms': 10.0, 'mean_ms': 5.0},
+            {'name': 'files.tree', 'files': 10000, 'p99_ms': 10.0, 'mean_ms': 5.0},
+        ]}
+        results = [
+            {'name': 'files.tree', 'files': 1000, 'p99_ms': 11.0, 'mean_ms': 5.0},
+            {'name': 'files.tree', 'files': 10000, 'p99_ms': 13.0, 'mean_ms': 5.0},
+            {'name': 'files.list', 'files': 1000, 'p99_ms': 99.0, 'mean_ms': 50.0},
+        ]
+        self.assertEqual(compare(results, baseline, 0.2), ['files.tree p99_ms: 10.0 -> 13.0 (+30%)'])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        Project.objects.create(name='measured', owner=self.user, repository_url='https://example.com/repo.git')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def queries(self):
+        # Sum and count of the per request query histogram
+        sample = metrics.REQUEST_QUERIES.samples.get(('file_changes',), [0, 0])
+        return sample[-2], sample[-1]
+
+    def test_queries_are_counted_under_wsgi(self):
+        before = self.queries()
+        self.assertEqual(self.client.get('/api/projects/measured/changes/', headers=self.headers).status_code, 200)
+        after = self.queries()
+        self.assertEqual(after[1], before[1] + 1)
+        self.assertGreaterEqual(after[0] - before[0], 2)
+
+    async def test_queries_are_counted_under_asgi(self):
+        before = self.queries()
+        response = await self.async_client.get('/api/projects/measured/changes/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        after = self.queries()
+        self.assertEqual(after[1], before[1] + 1)
+        self.assertGreaterEqual(after[0] - before[0], 2)
+
+    def test_metrics_need_the_token(self):
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with self.settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/metrics', headers=self.headers).status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_db_queries', response.content)
+
+
+@override_settings(PROFILE_INTERVAL=0.001)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('admin', password='secret', is_staff=True)
+        Project.objects.create(name='profiled', owner=self.staff, repository_url='https://example.com/repo.git')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.staff)}', 'X-Profile': '1'}
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        profile_dir = self.settings(PROFILE_DIR=directory)
+        profile_dir.enable()
+        self.addCleanup(profile_dir.disable)
+
+    def check(self, response):
+        self.assertEqual(response.status_code, 200)
+        profile = load_profile(response['X-Profile-Id'])
+        self.assertEqual(profile['request'], 'GET /api/projects/profiled/changes/')
+        self.assertGreaterEqual(profile['query_count'], 2)
+
+    def test_staff_requests_are_profiled_under_wsgi(self):
+        self.check(self.client.get('/api/projects/profiled/changes/', headers=self.headers))
+
+    async def test_staff_requests_are_profiled_under_asgi(self):
+        self.check(await self.async_client.get('/api/projects/profiled/changes/', headers=self.headers))
+
+    def test_other_users_are_not_profiled(self):
+        self.staff.is_staff = False
+        self.staff.save()
+        response = self.client.get('/api/projects/profiled/changes/', headers=self.headers)
+        self.assertNotIn('X-Profile-Id', response)
+
+
+class ExportStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        project = Project.objects.create(name='exported', owner=self.user, repository_url='https://example.com/repo.git')
+        for index in range(3):
+            File.objects.create(project=project, file_path=f'src/{index}.py', content=f'x = {index}\n', extension='.py')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def test_export_streams_under_asgi(self):
+        response = await self.async_client.get('/api/projects/exported/export/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        # A sync iterator would be read to the end before the first byte is sent
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        with tarfile.open(fileobj=io.BytesIO(body), mode='r:gz') as archive:
+            self.assertEqual(sorted(archive.getnames()), ['exported/src/0.py', 'exported/src/1.py', 'exported/src/2.py'])
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='secret')
+        user_cache.forget(self.user.pk)
+        # Rolled back rows may reuse ids, every test starts from an empty blacklist
+        blacklist = mock.patch('project.app.authentication.blacklisted_tokens', TokenBlacklist())
+        blacklist.start()
+        self.addCleanup(blacklist.stop)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/builds/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return sum('"auth_user"' in query['sql'] for query in queries.captured_queries)
+
+    def blacklist(self, jti, **fields):
+        token = OutstandingToken.objects.create(user=self.user, jti=jti, token=jti, expires_at=timezone.now() + timedelta(hours=1))
+        return BlacklistedToken.objects.create(token=token, **fields)
+
+    def test_cached_requests_do_not_query_the_user(self):
+        self.assertEqual(self.user_queries(), 1)
+        self.assertEqual(self.user_queries(), 0)
+
+    def test_users_are_reloaded_after_the_ttl(self):
+        with self.settings(AUTH_USER_CACHE_TTL=0):
+            self.assertEqual(self.user_queries(), 1)
+            self.assertEqual(self.user_queries(), 1)
+
+    def test_saving_a_user_drops_the_cached_copy(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/builds/', headers=self.headers).status_code, 401)
+
+    def test_user_forgotten_while_loading_is_not_cached(self):
+        load = User.objects.filter
+
+        def changed_while_loading(*args, **kwargs):
+            user_cache.forget(self.user.pk)
+            return load(*args, **kwargs)
+
+        with mock.patch.object(User.objects, 'filter', side_effect=changed_while_loading):
+            user_cache.get(self.user.pk)
+        with self.assertNumQueries(1):
+            user_cache.get(self.user.pk)
+
+    @override_settings(AUTH_BLACKLIST_SYNC_INTERVAL=0)
+    def test_blacklist_syncs_new_rows_by_id(self):
+        tokens = TokenBlacklist()
+        first = self.blacklist('first')
+        self.assertIn('first', tokens)
+        self.assertEqual(tokens.last_id, first.id)
+
+        self.blacklist('second')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn('second', tokens)
+        self.assertIn(f'"id" > {first.id}', queries.captured_queries[0]['sql'])
+
+    @override_settings(AUTH_BLACKLIST_SYNC_INTERVAL=0)
+    def test_blacklist_sees_rows_committed_after_higher_ids(self):
+        tokens = TokenBlacklist()
+        later = self.blacklist('later', id=100)
+        self.assertIn('later', tokens)
+        # Took its id before 'later' did, but committed after it was read
+        self.blacklist('earlier', id=50)
+        self.assertIn('earlier', tokens)
+        self.assertEqual(tokens.last_id, later.id)
+
+    def test_refresh_is_rejected_right_after_logout(self):
+        tokens = self.client.post('/api/token/', {'username': 'owner', 'password': 'secret'}).data
+        headers = {'Authorization': f"Bearer {tokens['access']}"}
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 200)
+        self.assertEqual(self.client.post('/api/token/logout/', {'refresh': tokens['refresh']}, headers=headers).status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+    @override_settings(AUTH_BLACKLIST_SYNC_INTERVAL=0)
+    def test_logout_reaches_other_processes(self):
+        other_process = TokenBlacklist()
+        refresh = CachedRefreshToken.for_user(self.user)
+        self.assertNotIn(refresh['jti'], other_process)
+        refresh.blacklist()
+        self.assertIn(refresh['jti'], other_process)
@@ -0,0 +1,177 @@
+# utils.py
+
+import os
+import re
+import shutil
+import logging
+import threading
+import brotli
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import compress_string
+from rest_framework.response import Response
+from rest_framework import status
+
+logger = logging.getLogger(__name__)
+
+
+def remove_directories_in_background(paths):
+    """
+    Removes directories on a daemon thread so large trees don't hold up the request.
+    """
+    def remove():
+        for path in paths:
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Removed directory {path}")
+
+    threading.Thread(target=remove, name='directory-cleanup', daemon=True).start()
+
+
+def make_etag(*parts):
+    return quote_etag('-'.join(str(part) for part in parts))
+
+
+def etag_matches(request, etag):
+    """
+    Weak comparison of the If-None-Match header against the current ETag.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    if '*' in etags:
+        return True
+    etag = etag.removeprefix('W/')
+    return any(candidate.removeprefix('W/') == etag for candidate in etags)
+
+
+def not_modified(etag, last_modified=None):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = last_modified
+    return response
+
+
+def normalize_file_path(file_path):
+    """
+    Normalizes a repository relative path, returning None for paths that are
+    empty or would escape the project (absolute paths, '..' components).
+    """
+    if not isinstance(file_path, str):
+        return None
+    parts = [part for part in file_path.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or '\0' in file_path:
+        return None
+    return '/'.join(parts)
+
+
+def parse_byte_range(header, size):
+    """
+    Parses a single "bytes=start-end" Range header into an inclusive (start, end)
+    pair. Returns None when the header should be ignored and raises ValueError
+    when the range cannot be satisfied.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def accepted_encodings(request):
+    encodings = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+def compress_response(request, response, min_length=1024):
+    """
+    Compresses a rendered response with brotli when the client accepts it, gzip
+    otherwise. Small bodies and already encoded or streaming responses are left alone.
+    """
+    if response.streaming or response.has_header('Content-Encoding') or response.status_code != 200:
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if len(response.content) < min_length:
+        return response
+
+    encodings = accepted_encodings(request)
+    if 'br' in encodings:
+        compressed, encoding = brotli.compress(response.content, quality=5), 'br'
+    elif 'gzip' in encodings:
+        compressed, encoding = compress_string(response.content), 'gzip'
+    else:
+        return response
+    if len(compressed) >= len(response.content):
+        return response
+
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encoding
+    # The encoded body is no longer byte-identical, so only a weak ETag still holds
+    etag = response.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response['ETag'] = f"W/{etag}"
+    return response
+
+
+def build_file_tree(files):
+    """
+    Turns (file_path, extension) pairs into the nested structure used by the
+    frontend file tree: [{'name', 'type': 'folder', 'children'}, {'name', 'type': 'file', 'extension'}].
+    """
+    root = {}
+    for file_path, extension in files:
+        *folders, name = file_path.split('/')
+        level = root
+        for folder in folders:
+            level = level.setdefault(folder, {})
+            if not isinstance(level, dict):
+                break  # A file shadows this folder name, skip the entry
+        else:
+            level.setdefault(name, extension)
+    return _tree_nodes(root)
+
+
+def _tree_nodes(level):
+    folders = sorted(name for name, value in level.items() if isinstance(value, dict))
+    files = sorted(name for name, value in level.items() if not isinstance(value, dict))
+    nodes = [{'name': name, 'type': 'folder', 'children': _tree_nodes(level[name])} for name in folders]
+    nodes += [{'name': name, 'type': 'file', 'extension': level[name]} for name in files]
+    return nodes
+
+
+def list_directory(file_paths, directory):
+    """
+    Immediate children of `directory` only, for lazily expanded trees.
+    Folders are returned without their children.
+    """
+    prefix = f"{directory}/" if directory else ''
+    folders, files = set(), {}
+    for file_path, extension in file_paths:
+        if not file_path.startswith(prefix):
+            continue
+        name, separator, _ = file_path[len(prefix):].partition('/')
+        if separator:
+            folders.add(name)
+        else:
+            files[name] = extension
+    nodes = [{'name': name, 'type': 'folder', 'has_children': True} for name in sorted(folders)]
+    nodes += [{'name': name, 'type': 'file', 'extension': files[name]} for name in sorted(files) if name not in folders]
+    return nodes
@@ -1,28 +1,65 @@
 import os
 import git
+import hashlib
+import difflib
 import shutil  # for deleting the repo folder
 import logging
 import docker
+import json
+import asyncio
 import requests
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 
 from django.conf import settings
-from .models import Project, File, Container
+from .models import Project, Environment, File, FileRevision, FileChange, Container
 from .serializers import ProjectSerializer, ContainerSerializer
+from .changes import record_file_changes
+from .bulk import copy_project_files, delete_project_files
+from .builds import PRIORITIES, build_scheduler, release_connection
+from .docker_utils import get_docker_client, deploy_project, apply_container_action, remove_docker_container, remove_project_image, remove_project_network
+from .health import get_breaker, forget_breaker, is_starting, probe_readiness, upstream_url
+from .proxy_cache import proxy_cache, CacheEntry, is_storable, parse_cache_control
+from .ratelimit import ReleaseOnClose, check_rate_limits, in_flight_limit, limiter
+from .events import broker, publish, container_event_data, issue_stream_ticket, redeem_stream_ticket
+from . import metrics
+from .authentication import CachedJWTAuthentication, CachedRefreshToken
+from .listings import cached_listing, invalidate_listings
+from .profiling import list_profiles, load_profile
+from .compose import ComposeError, build_slots, is_compose_file, load_compose, deploy_compose
+from .archives import ARCHIVE_FORMATS, ArchiveError, UploadLimitHandler, iter_archive, stream_tar, stream_zip
+from .revisions import move_revisions, record_revision, record_revisions, revision_content
+from .search import glob_to_regex, make_matcher, find_matches, find_regex_matches, limit_statement_time
+from .signals import bump_tree_version, sync_file_to_host
+from .sync import fetch_mirror, apply_revision, head_revision, mirror_path
+from .utils import (
+    remove_directories_in_background, normalize_file_path, make_etag, etag_matches, not_modified,
+    parse_byte_range, compress_response, build_file_tree, list_directory,
+)
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.shortcuts import get_object_or_404
-from django.http import StreamingHttpResponse
+from django.db import DataError, IntegrityError, OperationalError, transaction
+from django.db.models.functions import MD5
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse, Http404
+from django.views import View
+from django.contrib.auth.models import User
+from django.utils.http import http_date, parse_http_date_safe
 
 logger = logging.getLogger(__name__)
 
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def post(self, request, *args, **kwargs):
         try:
@@ -30,7 +67,7 @@ class LogoutView(APIView):
             if not refresh_token:
                 return Response({"detail": "Refresh token is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()
 
             return Response({"detail": "Logout successful."}, status=status.HTTP_200_OK)
@@ -38,7 +75,7 @@ class LogoutView(APIView):
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class CloneRepositoryView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -54,7 +91,7 @@ class CloneRepositoryView(APIView):
                 logger.error("Project name and repository URL are required.")
                 return Response({'status': 'error', 'message': 'Project name and repository URL are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-            repo_dir = os.path.join(settings.BASE_DIR, 'temp_repo', project_name)
+            repo_dir = os.path.join(settings.CLONE_TEMP_DIR, project_name)
 
             if os.path.exists(repo_dir):
                 logger.info(f"Removing existing directory: {repo_dir}")
@@ -69,7 +106,9 @@ class CloneRepositoryView(APIView):
                 percent_complete = (cur_count / max_count) * 100 if max_count else 0
                 logger.info(f"Cloning progress: {percent_complete:.2f}% complete")
 
-            repo = git.Repo.clone_from(repository_url, repo_dir, progress=progress_callback)
+            with metrics.GIT_SECONDS.time(operation='clone'):
+                repo = git.Repo.clone_from(repository_url, repo_dir, progress=progress_callback)
+            metrics.GIT_BYTES.inc(metrics.directory_size(repo_dir), operation='clone')
             logger.info("Repository cloned successfully.")
 
             project = Project.objects.create(
@@ -77,7 +116,8 @@ class CloneRepositoryView(APIView):
                 description=project_description.replace('\0', ''),
                 repository_url=repository_url,
                 build_file_path=build_file_path,
-                owner=request.user
+                owner=request.user,
+                synced_revision=head_revision(repo),
             )
             logger.info(f"Project {project_name} created successfully.")
 
@@ -114,27 +154,259 @@ class CloneRepositoryView(APIView):
             return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class SyncRepositoryView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, project_name):
+        try:
+            project = Project.objects.get(name=project_name, owner=request.user)
+            if not project.repository_url:
+                return Response({'status': 'error', 'message': 'Project has no upstream repository to sync from.'}, status=status.HTTP_400_BAD_REQUEST)
+            branch = request.data.get('branch') or 'HEAD'
+
+            with metrics.GIT_SECONDS.time(operation='fetch'):
+                repo = fetch_mirror(project)
+            try:
+                new_commit = repo.commit(branch)
+            except (ValueError, git.exc.BadName):
+                return Response({'status': 'error', 'message': f'Unknown branch or revision: {branch}'}, status=status.HTTP_400_BAD_REQUEST)
+
+            previous_revision = project.synced_revision
+            stats = apply_revision(project, repo, new_commit)
+            if stats is None:
+                return Response({'status': 'success', 'message': 'Already up to date.', 'revision': new_commit.hexsha}, status=status.HTTP_200_OK)
+
+            logger.info(f"Project {project_name} synced from {previous_revision or 'unknown revision'} to {new_commit.hexsha}: {stats}")
+            return Response({
+                'status': 'success',
+                'message': 'Project synced successfully.',
+                'previous_revision': previous_revision or None,
+                'revision': new_commit.hexsha,
+                **stats,
+            }, status=status.HTTP_200_OK)
+
+        except Project.DoesNotExist:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except git.exc.GitError as e:
+            logger.error(f"Git error during sync: {str(e)}")
+            return Response({'status': 'error', 'message': f'Git error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ImportArchiveView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        data = {}
+        try:
+            # Refuse oversized uploads before the parser spools them to disk
+            max_upload_bytes = settings.ARCHIVE_IMPORT_LIMITS['max_upload_bytes']
+            content_length = request.META.get('CONTENT_LENGTH', '')
+            if content_length.isdigit() and int(content_length) > max_upload_bytes:
+                return Response({'status': 'error', 'message': 'Archive is too large.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            limit_handler = UploadLimitHandler(max_upload_bytes, request._request)
+            request.upload_handlers.insert(0, limit_handler)
+
+            data = request.data
+            if limit_handler.exceeded:
+                return Response({'status': 'error', 'message': 'Archive is too large.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            upload = request.FILES.get('archive')
+            project_name = data.get('project_name')
+            project_description = data.get('description', '')
+            build_file_path = data.get('build_file_path', 'NOT SET')
+
+            if not project_name or not upload:
+                return Response({'status': 'error', 'message': 'Project name and archive are required.'}, status=status.HTTP_400_BAD_REQUEST)
+            if Project.objects.filter(name=project_name).exists():
+                return Response({'status': 'error', 'message': 'A project with this name already exists.'}, status=status.HTTP_409_CONFLICT)
+            try:
+                strip_components = max(int(data.get('strip_components', 0)), 0)
+            except ValueError:
+                return Response({'status': 'error', 'message': 'strip_components must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            logger.info(f"Importing archive {upload.name} ({upload.size} bytes) into project {project_name}")
+            files_created = 0
+            with transaction.atomic():
+                project = Project.objects.create(
+                    name=project_name,
+                    description=project_description.replace('\0', ''),
+                    repository_url='',
+                    build_file_path=build_file_path,
+                    owner=request.user,
+                    # Files are bulk inserted without feed entries, so clients start from a full listing
+                    change_seq=1,
+                    change_floor=1,
+                )
+
+                # Entries are decoded straight from the upload and inserted in batches
+                batch, seen = [], set()
+                for file_path, content in iter_archive(upload, upload.size, settings.ARCHIVE_IMPORT_LIMITS, strip_components):
+                    if file_path in seen:
+                        continue
+                    seen.add(file_path)
+                    batch.append(File(
+                        project=project,
+                        file_path=file_path,
+                        content=content.decode('utf-8', errors='ignore').replace('\0', ''),
+                        extension=os.path.splitext(file_path)[1]
+                    ))
+                    if len(batch) >= settings.ARCHIVE_IMPORT_BATCH_SIZE:
+                        File.objects.bulk_create(batch)
+                        files_created += len(batch)
+                        batch = []
+                File.objects.bulk_create(batch)
+                files_created += len(batch)
+                bump_tree_version(project.pk)
+
+            logger.info(f"Project {project_name} imported with {files_created} files.")
+            return Response({'status': 'success', 'message': f'Project and {files_created} files created successfully.'}, status=status.HTTP_201_CREATED)
+
+        except ArchiveError as e:
+            logger.error(f"Rejected archive for project {data.get('project_name')}: {str(e)}")
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # Another request created the project after the check above
+            return Response({'status': 'error', 'message': 'A project with this name already exists.'}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ForkProjectView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, project_name):
+        try:
+            source = Project.objects.get(name=project_name, owner=request.user)
+            data = request.data
+            fork_name = data.get('name')
+            directory = (data.get('path') or '').strip('/')
+            description = data.get('description', source.description)
+
+            if not fork_name:
+                return Response({'status': 'error', 'message': 'Name of the new project is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(description, str):
+                return Response({'status': 'error', 'message': 'Description must be a string.'}, status=status.HTTP_400_BAD_REQUEST)
+            if Project.objects.filter(name=fork_name).exists():
+                return Response({'status': 'error', 'message': 'A project with this name already exists.'}, status=status.HTTP_409_CONFLICT)
+
+            with transaction.atomic():
+                fork = Project.objects.create(
+                    name=fork_name,
+                    description=description.replace('\0', ''),
+                    # A fork of a directory no longer matches the upstream layout, syncing it
+                    # would import the whole repository
+                    repository_url=source.repository_url if not directory else '',
+                    build_file_path=source.build_file_path,
+                    owner=request.user,
+                    synced_revision=source.synced_revision if not directory else '',
+                    # Files are copied without feed entries, so clients start from a full listing
+                    change_seq=1,
+                    change_floor=1,
+                )
+                # Files are copied inside the database in one statement
+                files_copied = copy_project_files(source.pk, fork.pk, directory)
+                Environment.objects.bulk_create([
+                    Environment(project=fork, env_vars=env.env_vars, resource_limits=env.resource_limits)
+                    for env in source.environments.all()
+                ])
+
+            logger.info(f"Project {project_name} forked into {fork_name} with {files_copied} files.")
+            return Response({'status': 'success', 'message': f'Project forked with {files_copied} files.', 'project': ProjectSerializer(fork).data}, status=status.HTTP_201_CREATED)
+
+        except Project.DoesNotExist:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except IntegrityError:
+            # Another request created the project after the check above
+            return Response({'status': 'error', 'message': 'A project with this name already exists.'}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class DeleteProjectView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, project_name):
+        try:
+            project = Project.objects.get(name=project_name, owner=request.user)
+            force = request.query_params.get('force', 'false').lower() == 'true'
+
+            # Tear down everything running from this project first
+            try:
+                client = get_docker_client()
+                service_names = set()
+                for container_id, service_name in project.containers.values_list('container_id', 'service_name'):
+                    remove_docker_container(client, container_id)
+                    service_names.add(service_name)
+                for service_name in service_names | {''}:
+                    remove_project_image(client, project.name, service_name)
+                remove_project_network(client, project.name)
+            except docker.errors.DockerException as e:
+                if not force:
+                    logger.error(f"Docker error: {str(e)}")
+                    return Response({'status': 'error', 'message': f'Docker error: {str(e)}. Use ?force=true to delete anyway.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                logger.warning(f"Ignoring Docker error while deleting project {project_name}: {str(e)}")
+
+            # Files go first in batches so the cascade below has nothing big left to collect
+            files_deleted = delete_project_files(project.pk, settings.PROJECT_DELETE_BATCH_SIZE)
+            project.delete()
+
+            remove_directories_in_background([
+                os.path.join(settings.REPOS_DIR, project_name),
+                os.path.join(settings.CLONE_TEMP_DIR, project_name),
+                mirror_path(project_name),
+            ])
+
+            logger.info(f"Project {project_name} deleted with {files_deleted} files.")
+            return Response({'status': 'success', 'message': f'Project and {files_deleted} files deleted successfully.'}, status=status.HTTP_200_OK)
+
+        except Project.DoesNotExist:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Columns read by ProjectSerializer and ContainerSerializer
+PROJECT_LIST_FIELDS = (
+    'id', 'name', 'description', 'repository_url', 'build_file_path', 'created_at', 'updated_at',
+    'owner__id', 'owner__username', 'owner__email',
+)
+CONTAINER_LIST_FIELDS = tuple(field for field in ContainerSerializer.Meta.fields if field != 'project') + ('project__name',)
+
+
 class UserProjectsView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         try:
             user = request.user
             search_term = request.query_params.get('search', '')
-            projects = Project.objects.filter(owner=user)
-            if search_term:
-                projects = projects.filter(name__icontains=search_term)
 
-            serializer = ProjectSerializer(projects, many=True)
-            return Response({'status': 'success', 'projects': serializer.data}, status=status.HTTP_200_OK)
+            def load():
+                projects = Project.objects.filter(owner=user).select_related('owner').only(*PROJECT_LIST_FIELDS)
+                if search_term:
+                    projects = projects.filter(name__icontains=search_term)
+                return ProjectSerializer(projects, many=True).data
+
+            projects = cached_listing(user.pk, 'projects', search_term, load)
+            return Response({'status': 'success', 'projects': projects}, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"An error occurred: {str(e)}")
             return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class ListFilesView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, project_name):
@@ -152,17 +424,120 @@ class ListFilesView(APIView):
             return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class FileTreeView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_name):
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+
+            # The tree only changes when files are added, moved or removed, so the
+            # project's tree version and the listed directory validate a cached copy.
+            listed = request.query_params.get('path')
+            scope = 'all' if listed is None else hashlib.md5(listed.strip('/').encode()).hexdigest()
+            etag = make_etag('tree', project.pk, project.tree_version, scope)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+            files = File.objects.filter(project=project).values_list('file_path', 'extension')
+
+            # ?path=<dir> returns only the direct children of that directory
+            if 'path' in request.query_params:
+                directory = request.query_params.get('path', '').strip('/')
+                if directory:
+                    files = files.filter(file_path__startswith=f"{directory}/")
+                tree = list_directory(files.iterator(), directory)
+            else:
+                tree = build_file_tree(files.iterator())
+
+            response = Response({'status': 'success', 'tree': tree}, status=status.HTTP_200_OK)
+            response['ETag'] = etag
+            return response
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class FileContentView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, project_name, file_path):
         try:
             user = request.user
             project = get_object_or_404(Project, name=project_name, owner=user)
-            file = get_object_or_404(File, project=project, file_path=file_path)
-            return Response({'status': 'success', 'content': file.content}, status=status.HTTP_200_OK)
-        except (Project.DoesNotExist, File.DoesNotExist):
+
+            # Validate against the content hash computed by the database so a
+            # cached copy can be confirmed without transferring the content.
+            meta = (File.objects.filter(project=project, file_path=file_path)
+                    .annotate(content_md5=MD5('content'))
+                    .values('pk', 'version', 'updated_at', 'content_md5')
+                    .first())
+            if meta is None:
+                raise Http404
+            etag = make_etag(meta['content_md5'])
+            last_modified = http_date(meta['updated_at'].timestamp())
+
+            if etag_matches(request, etag):
+                return not_modified(etag, last_modified)
+            if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+            if 'HTTP_IF_NONE_MATCH' not in request.META and if_modified_since \
+                    and int(meta['updated_at'].timestamp()) <= if_modified_since:
+                return not_modified(etag, last_modified)
+
+            content = File.objects.filter(pk=meta['pk']).values_list('content', flat=True).get()
+
+            # Raw byte ranges, for paging through very large files
+            range_header = request.META.get('HTTP_RANGE')
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if range_header and (not if_range or if_range == etag):
+                data = content.encode('utf-8')
+                try:
+                    byte_range = parse_byte_range(range_header, len(data))
+                except ValueError:
+                    response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                    response['Content-Range'] = f"bytes */{len(data)}"
+                    return response
+                if byte_range:
+                    start, end = byte_range
+                    response = HttpResponse(data[start:end + 1], status=status.HTTP_206_PARTIAL_CONTENT,
+                                            content_type='text/plain; charset=utf-8')
+                    response['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+                    response['ETag'] = etag
+                    response['Last-Modified'] = last_modified
+                    return response
+
+            payload = {'status': 'success', 'version': meta['version']}
+            start_line = request.query_params.get('start_line')
+            end_line = request.query_params.get('end_line')
+            if start_line or end_line:
+                try:
+                    start_line = int(start_line or 1)
+                    end_line = int(end_line) if end_line else None
+                except ValueError:
+                    return Response({'status': 'error', 'message': 'start_line and end_line must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+                if start_line < 1 or (end_line is not None and end_line < start_line):
+                    return Response({'status': 'error', 'message': 'Invalid line range.'}, status=status.HTTP_400_BAD_REQUEST)
+                lines = content.splitlines(keepends=True)
+                selected = lines[start_line - 1:end_line]
+                payload.update({
+                    'content': ''.join(selected),
+                    'start_line': start_line,
+                    'end_line': start_line + len(selected) - 1,
+                    'total_lines': len(lines),
+                })
+            else:
+                payload['content'] = content
+
+            response = Response(payload, status=status.HTTP_200_OK)
+            response['ETag'] = etag
+            response['Last-Modified'] = last_modified
+            response['Accept-Ranges'] = 'bytes'
+            return response
+        except Http404:
             return Response({'status': 'error', 'message': 'Project or file not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.error(f"An error occurred: {str(e)}")
@@ -172,21 +547,549 @@ class FileContentView(APIView):
         try:
             user = request.user
             project = get_object_or_404(Project, name=project_name, owner=user)
-            file = get_object_or_404(File, project=project, file_path=file_path)
             data = request.data
             new_content = data.get('content', '')
-            file.content = new_content
-            file.save(update_fields=['content'])
-            return Response({'status': 'success', 'message': 'File updated successfully.'}, status=status.HTTP_200_OK)
-        except (Project.DoesNotExist, File.DoesNotExist):
+            expected_version = data.get('version')
+
+            with transaction.atomic():
+                file = get_object_or_404(File.objects.select_for_update(), project=project, file_path=file_path)
+                if expected_version is not None and str(expected_version) != str(file.version):
+                    return Response({
+                        'status': 'error',
+                        'message': 'File was modified since it was loaded.',
+                        'current_version': file.version,
+                    }, status=status.HTTP_409_CONFLICT)
+                record_revision(project, file.file_path, file.content, new_content, author=user)
+                file.content = new_content
+                file.version += 1
+                file.save(update_fields=['content', 'version', 'updated_at'])
+
+            response = Response({'status': 'success', 'message': 'File updated successfully.', 'version': file.version}, status=status.HTTP_200_OK)
+            response['ETag'] = make_etag(hashlib.md5(new_content.encode('utf-8')).hexdigest())
+            return response
+        except Http404:
             return Response({'status': 'error', 'message': 'Project or file not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.error(f"An error occurred: {str(e)}")
             return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method == 'GET' and response.status_code == status.HTTP_200_OK:
+            response.render()
+            compress_response(request, response)
+        return response
+
+
+class FileBatchView(APIView):
+    """
+    Applies many file operations in one transaction:
+
+        {"operations": [
+            {"op": "create", "file_path": "a.py", "content": "..."},
+            {"op": "update", "file_path": "b.py", "content": "...", "version": 3},
+            {"op": "delete", "file_path": "c.py", "version": 1},
+            {"op": "rename", "file_path": "d.py", "new_path": "e.py", "version": 2}
+        ]}
+
+    When a "version" is given it must match the stored one, otherwise nothing
+    is applied and the conflicts are returned with status 409.
+    """
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    operations = ('create', 'update', 'delete', 'rename')
+
+    def post(self, request, project_name):
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+            operations = request.data.get('operations')
+            if not isinstance(operations, list) or not operations:
+                return Response({'status': 'error', 'message': 'A non-empty list of operations is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(operations) > settings.FILE_BATCH_MAX_OPERATIONS:
+                return Response({'status': 'error', 'message': f'At most {settings.FILE_BATCH_MAX_OPERATIONS} operations per batch.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            for index, operation in enumerate(operations):
+                error = self._validate(operation)
+                if error:
+                    return Response({'status': 'error', 'message': f'Operation {index}: {error}'}, status=status.HTTP_400_BAD_REQUEST)
+
+            with transaction.atomic():
+                result = self._apply(project, operations, author=request.user)
+                if result['conflicts']:
+                    transaction.set_rollback(True)
+                    return Response({
+                        'status': 'error',
+                        'message': 'Some files were modified since they were loaded. No changes were applied.',
+                        'conflicts': result['conflicts'],
+                    }, status=status.HTTP_409_CONFLICT)
+
+            return Response({
+                'status': 'success',
+                'message': f'{len(operations)} operations applied.',
+                'files': [{'file_path': f.file_path, 'version': f.version} for f in result['saved']],
+                'deleted': result['deleted'],
+            }, status=status.HTTP_200_OK)
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _validate(self, operation):
+        if not isinstance(operation, dict) or operation.get('op') not in self.operations:
+            return f"'op' must be one of {', '.join(self.operations)}."
+        if not normalize_file_path(operation.get('file_path')):
+            return 'A valid file_path is required.'
+        if operation['op'] == 'rename' and not normalize_file_path(operation.get('new_path')):
+            return 'A valid new_path is required.'
+        if operation['op'] in ('create', 'update') and not isinstance(operation.get('content', ''), str):
+            return 'content must be a string.'
+        return None
+
+    def _apply(self, project, operations, author=None):
+        paths = set()
+        for operation in operations:
+            paths.add(normalize_file_path(operation['file_path']))
+            if operation['op'] == 'rename':
+                paths.add(normalize_file_path(operation['new_path']))
+
+        # Lock every file the batch touches so concurrent saves queue behind us
+        state = {f.file_path: f for f in File.objects.select_for_update().filter(project=project, file_path__in=paths)}
+        original_paths = {f.pk: f.file_path for f in state.values()}
+        original_contents = {f.pk: f.content for f in state.values()}
+        loaded = list(state.values())
+        conflicts, deleted, touched = [], [], set()
+
+        for index, operation in enumerate(operations):
+            op = operation['op']
+            path = normalize_file_path(operation['file_path'])
+            file = state.get(path)
+
+            def conflict(reason):
+                conflicts.append({
+                    'index': index,
+                    'op': op,
+                    'file_path': path,
+                    'reason': reason,
+                    'current_version': file.version if file else None,
+                })
+
+            if op == 'create':
+                if file:
+                    conflict('exists')
+                    continue
+                state[path] = File(project=project, file_path=path, content=operation.get('content', ''),
+                                   extension=os.path.splitext(path)[1])
+                continue
+
+            if not file:
+                conflict('not_found')
+                continue
+            expected_version = operation.get('version')
+            if expected_version is not None and str(expected_version) != str(file.version):
+                conflict('stale')
+                continue
+
+            if op == 'update':
+                file.content = operation.get('content', '')
+            elif op == 'delete':
+                state[path] = None
+                deleted.append(path)
+                continue
+            elif op == 'rename':
+                new_path = normalize_file_path(operation['new_path'])
+                if state.get(new_path):
+                    conflict('target_exists')
+                    continue
+                state[path] = None
+                state[new_path] = file
+                file.file_path = new_path
+                file.extension = os.path.splitext(new_path)[1]
+            if file.pk:
+                file.version += 1
+                touched.add(file.pk)
+
+        if conflicts:
+            return {'conflicts': conflicts}
+
+        live = [f for f in state.values() if f is not None]
+        live_ids = {f.pk for f in live}
+        to_create = [f for f in live if f.pk is None]
+        to_update = [f for f in live if f.pk in touched]
+        to_delete = [f for f in loaded if f.pk not in live_ids]
+        moved = [f for f in loaded if f.pk not in live_ids or f.file_path != original_paths[f.pk]]
+
+        now = timezone.now()
+        for f in to_update:
+            f.updated_at = now
+        # Deletes go through the file_deleted signal, which records them and bumps
+        # the tree version. Bulk writes skip the per-row signals, so host copies,
+        # the tree version and the feed are handled once for the rest below.
+        if to_delete:
+            File.objects.filter(pk__in=[f.pk for f in to_delete]).delete()
+        File.objects.bulk_create(to_create, batch_size=500)
+        File.objects.bulk_update(to_update, ['file_path', 'content', 'extension', 'version', 'updated_at'], batch_size=500)
+        if to_create or moved:
+            bump_tree_version(project.pk)
+
+        changes = [(original_paths[f.pk], FileChange.DELETED) for f in moved if f.pk in live_ids]
+        changes += [(f.file_path, FileChange.CREATED) for f in to_create]
+        changes += [(f.file_path, FileChange.CREATED if f in moved else FileChange.UPDATED) for f in to_update]
+        record_file_changes(project.pk, changes)
+
+        # History follows renamed files, edits get a new revision
+        move_revisions(project, {original_paths[f.pk]: f.file_path for f in moved if f.pk in live_ids})
+        record_revisions(project, [(f.file_path, original_contents[f.pk], f.content) for f in to_update], author=author)
+
+        host_updates = [(original_paths[f.pk], None) for f in moved if f.to_host]
+        host_updates += [(f.file_path, f.content) for f in to_update if f.to_host]
+        if host_updates:
+            def sync_host():
+                for file_path, content in host_updates:
+                    sync_file_to_host(project.name, file_path, content, content is not None)
+            transaction.on_commit(sync_host)
+
+        return {'conflicts': [], 'saved': to_create + to_update, 'deleted': deleted}
+
+
+class CodeSearchView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_name):
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+            params = request.query_params
+            query = params.get('q', '')
+            use_regex = params.get('regex', 'false').lower() == 'true'
+            case_sensitive = params.get('case_sensitive', 'false').lower() == 'true'
+
+            if not query:
+                return Response({'status': 'error', 'message': 'Search query (q) is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(query) > settings.SEARCH_MAX_QUERY_LENGTH:
+                return Response({'status': 'error', 'message': f'Search query is limited to {settings.SEARCH_MAX_QUERY_LENGTH} characters.'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                page = max(int(params.get('page', 1)), 1)
+                page_size = min(max(int(params.get('page_size', 20)), 1), settings.SEARCH_MAX_PAGE_SIZE)
+            except ValueError:
+                return Response({'status': 'error', 'message': 'page and page_size must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # LIKE/ILIKE and ~/~* are all served by the trigram index on content
+            if use_regex:
+                lookup = 'content__regex' if case_sensitive else 'content__iregex'
+            else:
+                lookup = 'content__contains' if case_sensitive else 'content__ilike'
+            files = File.objects.filter(project=project, **{lookup: query})
+
+            extensions = [ext if ext.startswith('.') else f'.{ext}' for ext in params.get('ext', '').split(',') if ext]
+            if extensions:
+                files = files.filter(extension__in=extensions)
+            if params.get('path'):
+                files = files.filter(file_path__regex=glob_to_regex(params['path']))
+
+            offset = (page - 1) * page_size
+            files = files.order_by('file_path')
+            with transaction.atomic():
+                if use_regex:
+                    # Regular expressions run in Postgres only, bounded by the timeout
+                    limit_statement_time(settings.SEARCH_REGEX_TIMEOUT)
+                    total_files = files.count()
+                    page_files = list(files.only('id', 'file_path', 'extension')[offset:offset + page_size])
+                    found = find_regex_matches([file.id for file in page_files], query, case_sensitive, settings.SEARCH_MAX_MATCHES_PER_FILE)
+                else:
+                    total_files = files.count()
+                    page_files = list(files.only('id', 'file_path', 'extension', 'content')[offset:offset + page_size])
+                    matcher = make_matcher(query, case_sensitive=case_sensitive)
+                    found = {file.id: find_matches(file.content, matcher, settings.SEARCH_MAX_MATCHES_PER_FILE) for file in page_files}
+
+            results = []
+            for file in page_files:
+                matches, match_count = found[file.id]
+                results.append({
+                    'file_path': file.file_path,
+                    'extension': file.extension,
+                    'match_count': match_count,
+                    'matches': matches,
+                })
+
+            return Response({
+                'status': 'success',
+                'query': query,
+                'page': page,
+                'page_size': page_size,
+                'total_files': total_files,
+                'results': results,
+            }, status=status.HTTP_200_OK)
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except DataError as e:
+            # Postgres rejected the regular expression
+            return Response({'status': 'error', 'message': f'Invalid search: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        except OperationalError as e:
+            # statement_timeout cancelled a regular expression search
+            logger.warning(f"Search in {project_name} cancelled: {str(e)}")
+            return Response({'status': 'error', 'message': 'Search took too long, use a more specific pattern.'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ExportProjectView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_name):
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+            # 'format' is reserved by DRF for content negotiation
+            archive_format = request.query_params.get('archive', 'tar.gz')
+            if archive_format not in ARCHIVE_FORMATS:
+                return Response({'status': 'error', 'message': f"Unsupported archive format. Use one of: {', '.join(ARCHIVE_FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+            files = File.objects.filter(project=project)
+            directory = request.query_params.get('path', '').strip('/')
+            if directory:
+                files = files.filter(file_path__startswith=f"{directory}/")
+
+            # Rows are fetched through a server-side cursor in chunks and each
+            # entry is flushed to the client before the next one is read.
+            rows = files.order_by('file_path').values_list('file_path', 'content', 'updated_at').iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+            writer = stream_zip if archive_format == 'zip' else stream_tar
+            content_type, extension = ARCHIVE_FORMATS[archive_format]
+
+            response = StreamingHttpResponse(writer(rows, root=f"{project.name}/"), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{project.name}.{extension}"'
+            logger.info(f"Streaming {archive_format} export of project {project_name}")
+            return response
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class FileHistoryView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_name, file_path):
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+            params = request.query_params
+
+            # ?revision=<n> returns the content of a single revision
+            if 'revision' in params:
+                number = int(params['revision'])
+                content = revision_content(project, file_path, number)
+                if content is None:
+                    return Response({'status': 'error', 'message': 'Revision not found'}, status=status.HTTP_404_NOT_FOUND)
+                return Response({'status': 'success', 'revision': number, 'content': content}, status=status.HTTP_200_OK)
+
+            # ?diff=<n>[&to=<m>] compares a revision with another one or the current content
+            if 'diff' in params:
+                old_number = int(params['diff'])
+                old_content = revision_content(project, file_path, old_number)
+                if 'to' in params:
+                    new_label = f"{file_path}@{params['to']}"
+                    new_content = revision_content(project, file_path, int(params['to']))
+                else:
+                    new_label = file_path
+                    new_content = File.objects.filter(project=project, file_path=file_path).values_list('content', flat=True).first()
+                if old_content is None or new_content is None:
+                    return Response({'status': 'error', 'message': 'Revision not found'}, status=status.HTTP_404_NOT_FOUND)
+                diff = ''.join(difflib.unified_diff(
+                    old_content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+                    fromfile=f"{file_path}@{old_number}", tofile=new_label,
+                ))
+                return Response({'status': 'success', 'diff': diff}, status=status.HTTP_200_OK)
+
+            revisions = (FileRevision.objects.filter(project=project, file_path=file_path)
+                         .order_by('-number')
+                         .values('number', 'size', 'author__username', 'created_at'))
+            return Response({'status': 'success', 'revisions': [
+                {
+                    'revision': revision['number'],
+                    'size': revision['size'],
+                    'author': revision['author__username'],
+                    'created_at': revision['created_at'],
+                } for revision in revisions
+            ]}, status=status.HTTP_200_OK)
+        except ValueError:
+            return Response({'status': 'error', 'message': 'Revision numbers must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def post(self, request, project_name, file_path):
+        # Restores a revision, recreating the file if it was deleted
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+            number = int(request.data.get('revision'))
+            content = revision_content(project, file_path, number)
+            if content is None:
+                return Response({'status': 'error', 'message': 'Revision not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            with transaction.atomic():
+                file = File.objects.select_for_update().filter(project=project, file_path=file_path).first()
+                if file is None:
+                    file = File(project=project, file_path=file_path, content='', extension=os.path.splitext(file_path)[1])
+                else:
+                    file.version += 1
+                record_revision(project, file_path, file.content, content, author=request.user)
+                file.content = content
+                file.save()
+
+            return Response({'status': 'success', 'message': f'Revision {number} restored.', 'version': file.version}, status=status.HTTP_200_OK)
+        except (TypeError, ValueError):
+            return Response({'status': 'error', 'message': 'A revision number is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class FileChangesView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_name):
+        try:
+            project = get_object_or_404(Project, name=project_name, owner=request.user)
+            try:
+                since = max(int(request.query_params.get('since', 0)), 0)
+                limit = min(max(int(request.query_params.get('limit', 1000)), 1), settings.FILE_CHANGES_MAX_PAGE_SIZE)
+            except ValueError:
+                return Response({'status': 'error', 'message': 'since and limit must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Entries the client needs may have been compacted away
+            if since < project.change_floor:
+                return Response({
+                    'status': 'success',
+                    'reset_required': True,
+                    'changes': [],
+                    'latest_seq': project.change_seq,
+                    'has_more': False,
+                }, status=status.HTTP_200_OK)
+
+            changes = list(FileChange.objects.filter(project=project, seq__gt=since)
+                           .order_by('seq')
+                           .values('seq', 'file_path', 'operation')[:limit + 1])
+            has_more = len(changes) > limit
+            changes = changes[:limit]
+            return Response({
+                'status': 'success',
+                'reset_required': False,
+                'changes': changes,
+                'latest_seq': changes[-1]['seq'] if changes else max(since, project.change_floor),
+                'has_more': has_more,
+            }, status=status.HTTP_200_OK)
+        except Http404:
+            return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class EventTicketView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response({
+            'status': 'success',
+            'ticket': issue_stream_ticket(request.user.pk),
+            'expires_in': settings.EVENTS_TICKET_TTL,
+        }, status=status.HTTP_200_OK)
+
+
+class EventStreamView(View):
+    """
+    Server-sent events with the user's container, project and build changes.
+    EventSource cannot set headers, so it opens the stream with ?ticket= from
+    EventTicketView. Other clients may send the access token as a bearer
+    token. Needs an ASGI server, a WSGI server would buffer the stream.
+    """
+
+    async def get(self, request):
+        if 'ticket' in request.GET:
+            user_id = await redeem_stream_ticket(request.GET['ticket'])
+        else:
+            token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+            try:
+                user_id = AccessToken(token)[jwt_settings.USER_ID_CLAIM]
+            except (TokenError, KeyError):
+                user_id = None
+        if user_id is None:
+            return JsonResponse({'status': 'error', 'message': 'Invalid or expired token.'}, status=401)
+        # The claim may be a string, events are keyed by the primary key
+        user_id = await User.objects.filter(pk=user_id, is_active=True).values_list('pk', flat=True).afirst()
+        if user_id is None:
+            return JsonResponse({'status': 'error', 'message': 'Invalid or expired token.'}, status=401)
+
+        response = StreamingHttpResponse(self.stream(user_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering events
+        return response
+
+    async def stream(self, user_id):
+        with broker.subscribe(user_id) as queue:
+            yield 'retry: 3000\nevent: ready\ndata: {}\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), settings.EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+
+
+class MetricsView(View):
+    """
+    Prometheus metrics of every worker process. Not routed through nginx,
+    scrape the backend directly, sending METRICS_TOKEN as a bearer token.
+    Without a token the metrics are only served with DEBUG on.
+    """
+
+    def get(self, request):
+        if not settings.METRICS_TOKEN:
+            if not settings.DEBUG:
+                return JsonResponse({'status': 'error', 'message': 'Metrics are disabled, set METRICS_TOKEN.'}, status=403)
+        elif not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {settings.METRICS_TOKEN}"):
+            return JsonResponse({'status': 'error', 'message': 'Invalid metrics token.'}, status=401)
+        return HttpResponse(metrics.registry.render(settings.METRICS_DIR), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileListView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({'status': 'success', 'profiles': list_profiles()}, status=status.HTTP_200_OK)
+
+
+class ProfileDetailView(APIView):
+    """
+    A stored profile. ?output=collapsed returns the stacks alone, ready for
+    flamegraph.pl or speedscope.
+    """
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        profile = load_profile(profile_id)
+        if profile is None:
+            return Response({'status': 'error', 'message': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if request.query_params.get('output') == 'collapsed':
+            return HttpResponse(profile['stacks'] + '\n', content_type='text/plain; charset=utf-8')
+        return Response({'status': 'success', 'profile': profile}, status=status.HTTP_200_OK)
+
 
 class CreateContainerView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -195,76 +1098,100 @@ class CreateContainerView(APIView):
             project_name = data.get('project_name')
             build_file_path = data.get('build_file_path', '')
             port = data.get('port', 8080)
+            health_check_path = data.get('health_check_path', '')
+            priority = data.get('priority', 'normal')
+            # Builds take minutes, clients poll BuildStatusView or follow the event stream
+            wait = str(data.get('wait', 'false')).lower() == 'true'
 
             if not project_name:
                 return Response({'status': 'error', 'message': 'Project name is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            if priority not in PRIORITIES:
+                return Response({'status': 'error', 'message': f"Priority must be one of {', '.join(PRIORITIES)}."}, status=status.HTTP_400_BAD_REQUEST)
+            if priority == 'high' and not request.user.is_staff:
+                priority = 'normal'
 
             project = Project.objects.get(name=project_name, owner=request.user)
 
-            files = File.objects.filter(project=project)
-            for file in files:
-                file.to_host = True
-                file.save()
-                logger.info(f"File {file.file_path}: to_host set to {file.to_host}")
-
             build_file_path = project.build_file_path if build_file_path == '' else build_file_path
             if build_file_path.startswith('./'):
                 build_file_path = build_file_path[2:]
 
-            logger.info(f"Building image for project {project_name} using Dockerfile: {build_file_path}")
-
-            client = docker.DockerClient(base_url=settings.DIND_URL)
-
-            build_context_path = f"/app/repos/{project_name}"
-            dockerfile_path = f"{build_context_path}/{build_file_path}"
-
-            logger.info(f"Path to dockerfile: {dockerfile_path}")
-
-            # Always rebuild the image without cache
-            image, build_logs = client.images.build(
-                path=build_context_path,
-                dockerfile=dockerfile_path,
-                tag=f"{project_name}_image",
-                nocache=True
-            )
-            for log in build_logs:
-                logger.info(log)
-
-            container_name = f"{project_name}_container"
-
-            container = client.containers.run(
-                image=f"{project_name}_image",
-                detach=True,
-                ports={f"{port}/tcp": port},
-                name=container_name
-            )
-
-            Container.objects.create(
-                project=project,
-                container_id=container.id,
-                container_name=container_name,
-                status='running',
-                port=port,
+            if is_compose_file(build_file_path):
+                services = load_compose(project, build_file_path)
+                deploy = lambda job: deploy_compose(project, services, job)
+                slots = build_slots(services)
+            else:
+                deploy = lambda job: deploy_project(project, build_file_path, port, job, health_check_path)
+                slots = 1
+
+            # Identical requests (same project content and options) share one build
+            key = (project.pk, project.change_seq, build_file_path, str(port), health_check_path)
+            job, created = build_scheduler.submit(
+                key,
+                request.user.pk,
+                deploy,
+                priority=priority,
+                description=project_name,
+                slots=slots,
             )
+            if not created:
+                logger.info(f"Build request for {project_name} coalesced into build {job.id}")
+
+            # Waiting must not hold on to one of the pool's connections
+            release_connection()
+            if not wait or not job.wait(settings.BUILD_WAIT_TIMEOUT):
+                return Response({
+                    'status': 'queued',
+                    'message': 'Build queued.',
+                    'build': build_scheduler.describe(job),
+                }, status=status.HTTP_202_ACCEPTED)
+
+            if isinstance(job.error, docker.errors.DockerException):
+                return Response({'status': 'error', 'message': f'Docker error: {str(job.error)}', 'build': build_scheduler.describe(job)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if job.error:
+                return Response({'status': 'error', 'message': f'An error occurred: {str(job.error)}', 'build': build_scheduler.describe(job)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            if isinstance(job.result, list):
+                return Response({
+                    'status': 'success',
+                    'containers': job.result,
+                    'message': f'{len(job.result)} service containers created and started successfully.',
+                    'build': build_scheduler.describe(job),
+                }, status=status.HTTP_201_CREATED)
 
             return Response({
                 'status': 'success',
-                'container_id': container.id,
-                'message': 'Container created and started successfully.'
+                'container_id': job.result,
+                'message': 'Container created and started successfully.',
+                'build': build_scheduler.describe(job),
             }, status=status.HTTP_201_CREATED)
 
         except Project.DoesNotExist:
             return Response({'status': 'error', 'message': 'Project not found or not yours.'}, status=status.HTTP_404_NOT_FOUND)
-        except docker.errors.DockerException as e:
-            logger.error(f"Docker error: {str(e)}")
-            return Response({'status': 'error', 'message': f'Docker error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except ComposeError as e:
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"An error occurred: {str(e)}")
             return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class BuildStatusView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id=None):
+        if job_id is None:
+            jobs = sorted(build_scheduler.user_jobs(request.user.pk), key=lambda job: job.submitted_at, reverse=True)
+            return Response({'status': 'success', 'builds': [build_scheduler.describe(job) for job in jobs]}, status=status.HTTP_200_OK)
+
+        job = build_scheduler.get(job_id)
+        if job is None or job.user_id != request.user.pk:
+            return Response({'status': 'error', 'message': 'Build not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'success', 'build': build_scheduler.describe(job)}, status=status.HTTP_200_OK)
+
+
 class DeleteContainerView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request):
@@ -294,45 +1221,26 @@ class DeleteContainerView(APIView):
 
         try:
             # Connect to Docker using the same settings as in your creation view.
-            client = docker.DockerClient(base_url=settings.DIND_URL)
+            client = get_docker_client()
 
-            # Try to get the Docker container using its container ID.
-            try:
-                docker_container = client.containers.get(container_id)
-            except docker.errors.NotFound:
-                docker_container = None
-
-            if docker_container:
-                # Stop the container if it is running.
-                if docker_container.status == 'running':
-                    logger.info(f"Stopping container {container_id}")
-                    docker_container.stop()
-                # Remove the container along with its volumes.
-                docker_container.remove(v=True, force=True)
-                logger.info(f"Container {container_id} removed successfully.")
-            else:
-                logger.warning(f"Docker container with ID {container_id} not found. Continuing cleanup.")
+            remove_docker_container(client, container_id)
 
-            # Remove the Docker image associated with the project.
-            # (Assuming the image tag follows the pattern "<project_name>_image")
-            image_tag = f"{container_record.project.name}_image"
-            try:
-                client.images.remove(image=image_tag, force=True)
-                logger.info(f"Image {image_tag} removed successfully.")
-            except docker.errors.ImageNotFound:
-                logger.warning(f"Image {image_tag} not found. It may have already been removed.")
-
-            # Optionally, reverse any other side-effects.
-            # For example, update the files associated with the project to set `to_host` back to False.
-            files = File.objects.filter(project=container_record.project)
-            for file in files:
-                file.to_host = False
-                file.save()
-                logger.info(f"File {file.file_path}: to_host set to {file.to_host}")
+            # Remove the Docker image associated with the project (or compose service).
+            remove_project_image(client, container_record.project.name, container_record.service_name)
 
-            # Finally, remove the container record from the database.
+            # Remove the container record from the database.
+            project = container_record.project
             container_record.delete()
 
+            # Reverse the other side effects once the project's last container is gone:
+            # the files are no longer copied to the host
+            if not Container.objects.filter(project=project).exists():
+                File.objects.filter(project=project).update(to_host=False)
+                remove_directories_in_background([os.path.join(settings.REPOS_DIR, project.name)])
+                logger.info(f"Files of {project.name}: to_host set to False")
+            forget_breaker(container_id)
+            proxy_cache.purge(container_id)
+
             return Response({
                 'status': 'success',
                 'message': 'Container, associated volumes, and image removed successfully.'
@@ -351,21 +1259,127 @@ class DeleteContainerView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BulkContainerView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    ACTIONS = ('start', 'stop', 'restart', 'delete')
+
+    def post(self, request):
+        action = request.data.get('action')
+        container_ids = request.data.get('container_ids')
+        project_name = request.data.get('project_name')
+        stop_timeout = request.data.get('timeout')
+
+        if action not in self.ACTIONS:
+            return Response({'status': 'error', 'message': f"Action must be one of {', '.join(self.ACTIONS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if container_ids is None and not project_name and request.data.get('all') is not True:
+            return Response({'status': 'error', 'message': 'Provide container_ids, project_name or all: true.'}, status=status.HTTP_400_BAD_REQUEST)
+        if container_ids is not None and (not isinstance(container_ids, list) or not all(isinstance(item, str) for item in container_ids)):
+            return Response({'status': 'error', 'message': 'container_ids must be a list of strings.'}, status=status.HTTP_400_BAD_REQUEST)
+        if stop_timeout is not None and (not isinstance(stop_timeout, int) or stop_timeout < 0):
+            return Response({'status': 'error', 'message': 'timeout must be a non-negative integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            containers = Container.objects.filter(project__owner=request.user).select_related('project')
+            if container_ids is not None:
+                containers = containers.filter(container_id__in=container_ids)
+            if project_name:
+                containers = containers.filter(project__name=project_name)
+            containers = list(containers)
+
+            results = {}
+            if container_ids is not None:
+                found = {container.container_id for container in containers}
+                for container_id in container_ids:
+                    if container_id not in found:
+                        results[container_id] = {'container_id': container_id, 'status': 'error', 'message': 'Container not found or not yours.'}
+
+            if containers:
+                workers = min(settings.CONTAINER_BULK_WORKERS, len(containers))
+                client = get_docker_client(max_pool_size=workers)
+                # Only Docker calls run on the pool, the database is updated below in one go
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {
+                        container.container_id: executor.submit(apply_container_action, client, container.container_id, action, stop_timeout)
+                        for container in containers
+                    }
+                    for container in containers:
+                        try:
+                            container.status = futures[container.container_id].result()
+                            results[container.container_id] = {'container_id': container.container_id, 'status': 'success', 'new_status': container.status}
+                        except docker.errors.DockerException as e:
+                            results[container.container_id] = {'container_id': container.container_id, 'status': 'error', 'message': f'Docker error: {str(e)}'}
+
+                succeeded = [container for container in containers if results[container.container_id]['status'] == 'success']
+                if action == 'delete':
+                    self._cleanup_deleted(client, succeeded)
+                else:
+                    now = timezone.now()
+                    for container in succeeded:
+                        container.updated_at = now
+                    Container.objects.bulk_update(succeeded, ['status', 'updated_at'])
+                    invalidate_listings(request.user.pk)
+                    for container in succeeded:
+                        publish(request.user.pk, 'container.updated', container_event_data(container, container.project.name))
+
+            order = container_ids if container_ids is not None else [container.container_id for container in containers]
+            results = [results[container_id] for container_id in dict.fromkeys(order)]
+            failed = sum(1 for result in results if result['status'] == 'error')
+            logger.info(f"Bulk {action} on {len(results)} containers, {failed} failed.")
+            return Response({
+                'status': 'success' if not failed else 'partial',
+                'action': action,
+                'succeeded': len(results) - failed,
+                'failed': failed,
+                'results': results,
+            }, status=status.HTTP_200_OK)
+
+        except docker.errors.DockerException as e:
+            logger.error(f"Docker error: {str(e)}")
+            return Response({'status': 'error', 'message': f'Docker error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _cleanup_deleted(self, client, containers):
+        # Same side effects as DeleteContainerView, once per project or service
+        for project_name, service_name in {(container.project.name, container.service_name) for container in containers}:
+            try:
+                remove_project_image(client, project_name, service_name)
+            except docker.errors.DockerException as e:
+                logger.warning(f"Could not remove image of {project_name} {service_name}: {str(e)}")
+        Container.objects.filter(pk__in=[container.pk for container in containers]).delete()
+        # Projects that still have containers (other compose services) keep their files on the host
+        remaining = set(Container.objects.filter(project_id__in={container.project_id for container in containers}).values_list('project_id', flat=True))
+        projects = {container.project_id: container.project.name for container in containers if container.project_id not in remaining}
+        if projects:
+            File.objects.filter(project_id__in=projects).update(to_host=False)
+            remove_directories_in_background([os.path.join(settings.REPOS_DIR, name) for name in projects.values()])
+        for container in containers:
+            forget_breaker(container.container_id)
+            proxy_cache.purge(container.container_id)
+
+
 class ListContainersView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, project_name=None):
         try:
             user = request.user
-            if project_name:
-                project = get_object_or_404(Project, name=project_name, owner=user)
-                containers = Container.objects.filter(project=project)
-            else:
-                containers = Container.objects.filter(project__owner=user)
 
-            serializer = ContainerSerializer(containers, many=True)
-            return Response({'status': 'success', 'containers': serializer.data}, status=status.HTTP_200_OK)
+            def load():
+                if project_name:
+                    project = Project.objects.only('id').get(name=project_name, owner=user)
+                    containers = Container.objects.filter(project=project)
+                else:
+                    containers = Container.objects.filter(project__owner=user)
+                containers = containers.select_related('project').only(*CONTAINER_LIST_FIELDS)
+                return ContainerSerializer(containers, many=True).data
+
+            containers = cached_listing(user.pk, 'containers', project_name, load)
+            return Response({'status': 'success', 'containers': containers}, status=status.HTTP_200_OK)
 
         except Project.DoesNotExist:
             return Response({'status': 'error', 'message': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -375,13 +1389,13 @@ class ListContainersView(APIView):
 
 
 class StartContainerView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, container_id):
         try:
             container_db = Container.objects.get(container_id=container_id, project__owner=request.user)
-            client = docker.DockerClient(base_url=settings.DIND_URL)
+            client = get_docker_client()
             container = client.containers.get(container_id)
             container.start()
             container.reload()
@@ -389,7 +1403,10 @@ class StartContainerView(APIView):
             docker_status = container.attrs['State']['Status']
             container_db.status = docker_status
             container_db.save()
-            return Response({'status': 'success', 'message': f'Container {container_id} started successfully.', 'new_status': docker_status}, status=status.HTTP_200_OK)
+            # The proxy holds requests back with 503 until the container answers, readiness arrives as an event
+            if container_db.port:
+                probe_readiness(container_db, request.user.pk, container_db.project.name)
+            return Response({'status': 'success', 'message': f'Container {container_id} started successfully.', 'new_status': docker_status, 'ready': False}, status=status.HTTP_200_OK)
         except Container.DoesNotExist:
             return Response({'status': 'error', 'message': 'Container not found or not yours.'}, status=status.HTTP_404_NOT_FOUND)
         except docker.errors.DockerException as e:
@@ -399,13 +1416,13 @@ class StartContainerView(APIView):
 
 
 class StopContainerView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, container_id):
         try:
             container_db = Container.objects.get(container_id=container_id, project__owner=request.user)
-            client = docker.DockerClient(base_url=settings.DIND_URL)
+            client = get_docker_client()
             container = client.containers.get(container_id)
             container.stop()
             container.reload()
@@ -422,7 +1439,7 @@ class StopContainerView(APIView):
 
 
 class SetToHostFlagView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, project_name, flag_value):
@@ -437,7 +1454,7 @@ class SetToHostFlagView(APIView):
                 return Response({'status': 'error', 'message': 'Invalid flag value. Use "true" or "false".'}, status=status.HTTP_400_BAD_REQUEST)
 
             File.objects.filter(project=project).update(to_host=flag)
-            project_dir = os.path.join('/app/repos', project_name)
+            project_dir = os.path.join(settings.REPOS_DIR, project_name)
 
             if flag:
                 if not os.path.exists(project_dir):
@@ -462,6 +1479,43 @@ class SetToHostFlagView(APIView):
             logger.error(f"An error occurred: {str(e)}")
             return Response({'status': 'error', 'message': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class ContainerCacheView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_container(self, request, container_id):
+        return Container.objects.get(container_id=container_id, project__owner=request.user)
+
+    def get(self, request, container_id):
+        try:
+            container = self.get_container(request, container_id)
+            return Response({'status': 'success', 'enabled': container.proxy_cache, 'stats': proxy_cache.container_stats(container_id)}, status=status.HTTP_200_OK)
+        except Container.DoesNotExist:
+            return Response({'status': 'error', 'message': 'Container not found or not yours.'}, status=status.HTTP_404_NOT_FOUND)
+
+    def post(self, request, container_id):
+        enabled = request.data.get('enabled')
+        if not isinstance(enabled, bool):
+            return Response({'status': 'error', 'message': 'enabled must be true or false.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            container = self.get_container(request, container_id)
+            container.proxy_cache = enabled
+            container.save(update_fields=['proxy_cache', 'updated_at'])
+            if not enabled:
+                proxy_cache.purge(container_id)
+            return Response({'status': 'success', 'enabled': enabled}, status=status.HTTP_200_OK)
+        except Container.DoesNotExist:
+            return Response({'status': 'error', 'message': 'Container not found or not yours.'}, status=status.HTTP_404_NOT_FOUND)
+
+    def delete(self, request, container_id):
+        try:
+            self.get_container(request, container_id)
+            proxy_cache.purge(container_id)
+            return Response({'status': 'success', 'message': 'Proxy cache purged.'}, status=status.HTTP_200_OK)
+        except Container.DoesNotExist:
+            return Response({'status': 'error', 'message': 'Container not found or not yours.'}, status=status.HTTP_404_NOT_FOUND)
+
+
 class ContainerProxyView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -474,6 +1528,10 @@ class ContainerProxyView(APIView):
 
     def _get_target_container(self):
         container = Container.objects.filter(container_name=self.container_name).first()
+        if not container and '.' in self.container_name:
+            # Compose services are addressable as <project>.<service>
+            project_name, service_name = self.container_name.split('.', 1)
+            container = Container.objects.filter(project__name=project_name, service_name=service_name).first()
         if not container:
             logger.error(f"Container '{self.container_name}' not found.")
         return container
@@ -484,6 +1542,10 @@ class ContainerProxyView(APIView):
         return {k: v for k, v in headers.items() if k.lower() not in excluded_headers}
 
     def proxy_request(self, request, target_url, headers):
+        """
+        Returns (response, error_status). Connection failures map to 502 and
+        timeouts to 504.
+        """
         try:
             filtered_headers = self.filter_headers(headers)
             response = requests.request(
@@ -492,32 +1554,120 @@ class ContainerProxyView(APIView):
                 headers=filtered_headers,
                 data=request.body if request.body else None,
                 allow_redirects=False,
-                timeout=5,
+                timeout=(settings.PROXY_CONNECT_TIMEOUT, settings.PROXY_READ_TIMEOUT),
                 stream=True  # stream response content
             )
-            return response
+            return response, None
+        except requests.Timeout as e:
+            logger.error(f"Proxy request timed out: {e}")
+            return None, 504
         except requests.RequestException as e:
             logger.error(f"Proxy request failed: {e}")
-            return None
+            return None, 502
+
+    def too_many_requests(self, retry_after):
+        response = Response({"error": "Too many requests."}, status=429)
+        response["Retry-After"] = str(retry_after)
+        return response
+
+    def unavailable(self, retry_after):
+        response = Response({"error": "Container is unavailable, retry later."}, status=503)
+        response["Retry-After"] = str(retry_after)
+        return response
 
     def process_proxy(self, request):
         container = self._get_target_container()
         if not container:
             return Response({"error": "Container not found."}, status=404)
+        if not container.port:
+            return Response({"error": "Container does not publish a port."}, status=404)
+
+        # Cheap in-process checks first so a hot app cannot occupy every worker
+        retry_after = check_rate_limits(container, request)
+        if retry_after is not None:
+            return self.too_many_requests(retry_after)
 
         # Build the target URL (ensure we don't accidentally include extra slashes)
-        target_url = f"http://dind:{container.port}/{self.forwarded_path}"
+        target_url = upstream_url(container.port, self.forwarded_path)
         if request.META.get("QUERY_STRING"):
             target_url += f"?{request.META['QUERY_STRING']}"
 
+        headers = request.headers
+        cached = None
+        use_cache = container.proxy_cache and request.method == 'GET' and 'no-store' not in parse_cache_control(request.headers.get('Cache-Control'))
+        if use_cache:
+            cached = proxy_cache.lookup(container.container_id, target_url, request)
+            if cached and cached.is_fresh() and 'no-cache' not in parse_cache_control(request.headers.get('Cache-Control')):
+                proxy_cache.count(container.container_id, 'hits')
+                return self.cached_response(request, cached, 'HIT')
+            if cached:
+                # Ask the container whether the stale copy is still good
+                headers = {k: v for k, v in request.headers.items() if k.lower() not in ('if-none-match', 'if-modified-since')}
+                if cached.header('ETag'):
+                    headers['If-None-Match'] = cached.header('ETag')
+                if cached.header('Last-Modified'):
+                    headers['If-Modified-Since'] = cached.header('Last-Modified')
+
+        # Fail fast while the container is starting (in any worker) or its circuit is open
+        if is_starting(container):
+            return self.unavailable(1)
+        breaker = get_breaker(container.container_id)
+        allowed, retry_after = breaker.allow()
+        if not allowed:
+            return self.unavailable(retry_after)
+
+        # Slow upstreams must not hold on to one of the pool's connections
+        release_connection()
+        in_flight_key = f"upstream:{container.container_id}"
+        limit = in_flight_limit(container)
+        if limit and not limiter.acquire(in_flight_key, limit):
+            return self.too_many_requests(1)
+        release = lambda: limiter.release(in_flight_key)
+        try:
+            response = self.forward(request, container, target_url, headers, cached, use_cache, breaker)
+        except Exception:
+            release()
+            raise
+        if response.streaming:
+            # The upstream slot is held until the body has been sent
+            response.streaming_content = ReleaseOnClose(response.streaming_content, release)
+        else:
+            release()
+        return response
+
+    def forward(self, request, container, target_url, headers, cached, use_cache, breaker):
         logger.info(f"Forwarding request to: {target_url}")
-        proxied_response = self.proxy_request(request, target_url, request.headers)
+        with metrics.PROXY_SECONDS.time(container=container.container_name):
+            proxied_response, error_status = self.proxy_request(request, target_url, headers)
+        metrics.PROXY_RESPONSES.inc(container=container.container_name, status=proxied_response.status_code if proxied_response is not None else 'error')
         if proxied_response is None:
-            return Response({"error": "Error forwarding request."}, status=500)
+            breaker.record_failure()
+            return Response({"error": "Error forwarding request."}, status=error_status)
+        if proxied_response.status_code in (502, 503, 504):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        chunks = proxied_response.iter_content(chunk_size=8192)
+        if use_cache:
+            if cached and proxied_response.status_code == 304:
+                cached = cached.revalidated(proxied_response)
+                proxy_cache.store(container.container_id, target_url, cached)
+                proxy_cache.count(container.container_id, 'revalidations')
+                return self.cached_response(request, cached, 'REVALIDATED')
+
+            proxy_cache.count(container.container_id, 'misses')
+            if is_storable(request, proxied_response):
+                body, chunks = self.read_body(chunks, settings.PROXY_CACHE_MAX_ENTRY_BYTES)
+                if body is not None:
+                    entry = CacheEntry.from_response(request, proxied_response, body)
+                    proxy_cache.store(container.container_id, target_url, entry)
+                    proxy_cache.count(container.container_id, 'stores')
+                    return self.cached_response(request, entry, 'MISS')
 
         # Build a streaming response using the proxied content
         response = StreamingHttpResponse(
-            proxied_response.iter_content(chunk_size=8192),
+            chunks,
             status=proxied_response.status_code,
             reason=proxied_response.reason,
         )
@@ -527,7 +1677,36 @@ class ContainerProxyView(APIView):
         for header, value in proxied_response.headers.items():
             if header.lower() not in excluded_headers:
                 response[header] = value
+        if use_cache:
+            response["X-Proxy-Cache"] = "MISS"
+
+        return response
 
+    def read_body(self, chunks, limit):
+        """
+        Reads the whole body if it fits in `limit`. Otherwise returns None and
+        an iterator that still yields the complete body.
+        """
+        read = []
+        size = 0
+        for chunk in chunks:
+            read.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                return None, itertools.chain(read, chunks)
+        return b''.join(read), iter(read)
+
+    def cached_response(self, request, entry, cache_status):
+        etag = entry.header('ETag')
+        if etag and entry.status == 200 and etag_matches(request, etag):
+            response = HttpResponse(status=304)
+            response["ETag"] = etag
+        else:
+            response = HttpResponse(entry.body, status=entry.status, reason=entry.reason)
+            for header, value in entry.headers:
+                response[header] = value
+        response["Age"] = str(int(entry.age))
+        response["X-Proxy-Cache"] = cache_status
         return response
 
     def get(self, request, *args, **kwargs): 
@@ -61,6 +61,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'project.app',
     'docker',
     'rest_framework',
@@ -71,6 +72,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'project.app.middleware.MetricsMiddleware',
+    'project.app.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,11 +82,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'project.app.middleware.ViewThreadMiddleware',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'project.app.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -93,8 +97,136 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(hours=1),
+    'TOKEN_REFRESH_SERIALIZER': 'project.app.authentication.CachedTokenRefreshSerializer',
 }
 
+# Authentication fast path, see project.app.authentication. A deactivated user
+# keeps access for up to AUTH_USER_CACHE_TTL seconds on other worker processes.
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 30))
+AUTH_BLACKLIST_SYNC_INTERVAL = int(os.environ.get('AUTH_BLACKLIST_SYNC_INTERVAL', 10))
+
+# File history: a full snapshot every N revisions bounds the delta chain replayed on reads
+FILE_REVISION_SNAPSHOT_INTERVAL = 20
+FILE_REVISION_RETENTION = int(os.environ.get('FILE_REVISION_RETENTION', 200))
+
+# File change feed: compaction runs every N recorded changes, deletion markers are kept for N days
+FILE_CHANGES_COMPACT_INTERVAL = 10000
+FILE_CHANGES_TOMBSTONE_DAYS = 30
+FILE_CHANGES_MAX_PAGE_SIZE = 5000
+
+# Project files written for builds (shared with the dind daemon)
+REPOS_DIR = os.environ.get('REPOS_DIR', '/app/repos')
+
+# Bare mirrors used to fetch upstream changes incrementally
+REPO_CACHE_DIR = os.environ.get('REPO_CACHE_DIR', os.path.join(BASE_DIR, 'repo_cache'))
+
+# Working copies of clones, imported into the database and then removed
+CLONE_TEMP_DIR = os.environ.get('CLONE_TEMP_DIR', os.path.join(BASE_DIR, 'temp_repo'))
+
+# Image builds against the dind daemon. Limits apply across all backend processes.
+BUILD_MAX_CONCURRENT = int(os.environ.get('BUILD_MAX_CONCURRENT', 2))
+BUILD_MAX_PER_USER = int(os.environ.get('BUILD_MAX_PER_USER', 1))
+BUILD_WAIT_TIMEOUT = int(os.environ.get('BUILD_WAIT_TIMEOUT', 240))  # Seconds a create request with wait=true waits before answering 202
+BUILD_POLL_INTERVAL = float(os.environ.get('BUILD_POLL_INTERVAL', 2))  # Seconds between checks for a slot freed by another process
+BUILD_HEARTBEAT_TIMEOUT = int(os.environ.get('BUILD_HEARTBEAT_TIMEOUT', 60))  # Builds of a process silent for longer are failed
+BUILD_HISTORY_DAYS = int(os.environ.get('BUILD_HISTORY_DAYS', 7))
+COMPOSE_BUILD_WORKERS = int(os.environ.get('COMPOSE_BUILD_WORKERS', 4))  # Services of one compose project built in parallel, each takes a build slot
+CONTAINER_BULK_WORKERS = int(os.environ.get('CONTAINER_BULK_WORKERS', 8))  # Concurrent Docker calls per bulk container request
+
+# Container proxy and health checks. Circuit state is kept per process.
+PROXY_UPSTREAM_HOST = os.environ.get('PROXY_UPSTREAM_HOST', 'dind')
+PROXY_CONNECT_TIMEOUT = float(os.environ.get('PROXY_CONNECT_TIMEOUT', 2))
+PROXY_READ_TIMEOUT = float(os.environ.get('PROXY_READ_TIMEOUT', 5))
+HEALTH_CHECK_INTERVAL = int(os.environ.get('HEALTH_CHECK_INTERVAL', 30))  # Seconds, 0 disables active checks
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 2))
+CONTAINER_READY_TIMEOUT = int(os.environ.get('CONTAINER_READY_TIMEOUT', 30))
+CIRCUIT_BREAKER_FAILURES = int(os.environ.get('CIRCUIT_BREAKER_FAILURES', 5))
+CIRCUIT_BREAKER_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_BREAKER_RESET_TIMEOUT', 30))
+
+# Opt-in proxy response cache (Container.proxy_cache). The disk tier is off unless PROXY_CACHE_DIR is set.
+PROXY_CACHE_MEMORY_BYTES = int(os.environ.get('PROXY_CACHE_MEMORY_BYTES', 64 * 1024 ** 2))
+PROXY_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('PROXY_CACHE_MAX_ENTRY_BYTES', 8 * 1024 ** 2))
+PROXY_CACHE_DIR = os.environ.get('PROXY_CACHE_DIR') or None
+PROXY_CACHE_DISK_BYTES = int(os.environ.get('PROXY_CACHE_DISK_BYTES', 1024 ** 3))
+
+# Proxy rate limits, 0 disables a limit. Counters are per process unless PROXY_RATE_LIMIT_CACHE
+# names a cache alias with atomic incr (Redis, Memcached) shared by all workers.
+PROXY_CONTAINER_RATE = float(os.environ.get('PROXY_CONTAINER_RATE', 50))  # Requests per second per container
+PROXY_CLIENT_RATE = float(os.environ.get('PROXY_CLIENT_RATE', 10))  # Requests per second per container and client IP
+PROXY_BURST_SECONDS = float(os.environ.get('PROXY_BURST_SECONDS', 2))  # Bucket size in seconds of rate
+PROXY_MAX_IN_FLIGHT = int(os.environ.get('PROXY_MAX_IN_FLIGHT', 20))  # Concurrent upstream requests per container
+PROXY_IN_FLIGHT_TTL = int(os.environ.get('PROXY_IN_FLIGHT_TTL', 300))
+PROXY_RATE_LIMIT_CACHE = os.environ.get('PROXY_RATE_LIMIT_CACHE') or None
+PROXY_CLIENT_IP_HEADER = os.environ.get('PROXY_CLIENT_IP_HEADER', 'HTTP_X_REAL_IP')  # Set by nginx, falls back to REMOTE_ADDR
+
+# Live event streams (api/events/), delivered between processes with Postgres LISTEN/NOTIFY
+EVENTS_CHANNEL = 'dockerhosting_events'
+EVENTS_KEEPALIVE = int(os.environ.get('EVENTS_KEEPALIVE', 15))  # Seconds between keepalive comments
+EVENTS_TICKET_TTL = int(os.environ.get('EVENTS_TICKET_TTL', 30))  # Seconds a stream ticket can be redeemed in
+EVENTS_TICKET_CACHE = 'shared'  # Remembers redeemed tickets for every worker
+
+# Prometheus metrics at /metrics. Set METRICS_DIR to a directory shared by the
+# worker processes so a scrape sees all of them, empty it when the server starts.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # Seconds between writes to METRICS_DIR
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Label proxy metrics with the container name: one series per container, leave off with many containers
+METRICS_PROXY_PER_CONTAINER = os.environ.get('METRICS_PROXY_PER_CONTAINER', 'False').lower() in ('true', '1')
+
+# Request profiling, see ProfilingMiddleware. Profiles are kept as files in
+# PROFILE_DIR and listed at /api/admin/profiles/.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # Share of all requests profiled, 0 disables sampling
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))  # Seconds between stack samples
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/dockerhosting-profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+PROFILE_MAX_QUERIES = 500  # Queries stored per profile, all are counted
+
+# 'shared' lives on disk, so all worker processes of the backend see the same
+# entries and invalidations. Point it at Redis when running several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SHARED_CACHE_DIR', '/tmp/dockerhosting-cache'),
+    },
+}
+
+# Per-user cache of the project and container listings, invalidated by signals
+LISTING_CACHE = 'shared'
+LISTING_CACHE_TIMEOUT = int(os.environ.get('LISTING_CACHE_TIMEOUT', 60))
+
+# Garbage collection of the dind daemon, see `manage.py docker_gc`
+DOCKER_GC_INTERVAL = int(os.environ.get('DOCKER_GC_INTERVAL', 6 * 60 * 60))  # Seconds, 0 disables the background task
+DOCKER_IMAGE_BUDGET_BYTES = int(os.environ.get('DOCKER_IMAGE_BUDGET_BYTES', 20 * 1024 ** 3))
+DOCKER_GC_LOCK_FILE = os.environ.get('DOCKER_GC_LOCK_FILE', '/tmp/dockerhosting-gc.lock')
+
+# Maximum number of operations accepted by the batch file endpoint
+FILE_BATCH_MAX_OPERATIONS = int(os.environ.get('FILE_BATCH_MAX_OPERATIONS', 1000))
+
+# Number of File rows fetched per round-trip when streaming exports
+EXPORT_CHUNK_SIZE = 200
+
+# Limits for importing projects from uploaded tar/zip archives
+ARCHIVE_IMPORT_LIMITS = {
+    'max_upload_bytes': int(os.environ.get('ARCHIVE_IMPORT_MAX_UPLOAD_BYTES', 512 * 1024 * 1024)),
+    'max_total_bytes': int(os.environ.get('ARCHIVE_IMPORT_MAX_TOTAL_BYTES', 2 * 1024 * 1024 * 1024)),
+    'max_file_bytes': int(os.environ.get('ARCHIVE_IMPORT_MAX_FILE_BYTES', 50 * 1024 * 1024)),
+    'max_entries': int(os.environ.get('ARCHIVE_IMPORT_MAX_ENTRIES', 100000)),
+    'max_ratio': 100,  # Uncompressed size / archive size, guards against zip bombs
+}
+ARCHIVE_IMPORT_BATCH_SIZE = 500
+
+# File rows removed per DELETE statement when deleting a project
+PROJECT_DELETE_BATCH_SIZE = 5000
+
+# Code search limits
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_MATCHES_PER_FILE = 20
+SEARCH_MAX_QUERY_LENGTH = 1000
+SEARCH_REGEX_TIMEOUT = int(os.environ.get('SEARCH_REGEX_TIMEOUT', 5000))  # Milliseconds per statement of a regex search
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
@@ -119,6 +251,11 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Each worker process keeps a psycopg pool of connections. With DB_POOL off,
+# connections persist for DB_CONN_MAX_AGE seconds instead, which only helps
+# sync workers: under ASGI every request would leave its own connection open.
+DB_POOL = os.environ.get('DB_POOL', 'True').lower() in ('true', '1')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -127,8 +264,20 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),  # Per worker process
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # Seconds to wait for a free connection
+            'max_idle': 300,
+            'max_lifetime': 1800,
+        },
+    }
 
 
 # Password validation
@@ -7,22 +7,41 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('api/admin/profiles/', ProfileListView.as_view(), name='profile_list'),
+    path('api/admin/profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='profile_detail'),
 
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/logout/', LogoutView.as_view(), name='logout'),
 
     path('api/clone-repo/', CloneRepositoryView.as_view(), name='clone_repository'),
+    path('api/import-archive/', ImportArchiveView.as_view(), name='import_archive'),
     path('api/user/projects/', UserProjectsView.as_view(), name='user_projects'),
     path('api/projects/<str:project_name>/files/', ListFilesView.as_view(), name='list_files'),
+    path('api/projects/<str:project_name>/tree/', FileTreeView.as_view(), name='file_tree'),
+    path('api/projects/<str:project_name>/batch/', FileBatchView.as_view(), name='file_batch'),
+    path('api/projects/<str:project_name>/search/', CodeSearchView.as_view(), name='code_search'),
+    path('api/projects/<str:project_name>/sync/', SyncRepositoryView.as_view(), name='sync_repository'),
+    path('api/projects/<str:project_name>/export/', ExportProjectView.as_view(), name='export_project'),
+    path('api/projects/<str:project_name>/fork/', ForkProjectView.as_view(), name='fork_project'),
+    path('api/projects/<str:project_name>/delete/', DeleteProjectView.as_view(), name='delete_project'),
+    path('api/projects/<str:project_name>/history/<path:file_path>/', FileHistoryView.as_view(), name='file_history'),
+    path('api/projects/<str:project_name>/changes/', FileChangesView.as_view(), name='file_changes'),
     path('api/projects/<str:project_name>/files/<path:file_path>/', FileContentView.as_view(), name='file_content'),
     path('api/project/<str:project_name>/set-to-host/<str:flag_value>/', SetToHostFlagView.as_view(), name='set_to_host_flag'),
 
     path('api/containers/', ListContainersView.as_view(), name='list_containers'),
     path('api/containers/create/', CreateContainerView.as_view(), name='create_container'),
+    path('api/events/ticket/', EventTicketView.as_view(), name='event_ticket'),
+    path('api/events/', EventStreamView.as_view(), name='event_stream'),
+    path('api/builds/', BuildStatusView.as_view(), name='list_builds'),
+    path('api/builds/<str:job_id>/', BuildStatusView.as_view(), name='build_status'),
+    path('api/containers/bulk/', BulkContainerView.as_view(), name='bulk_containers'),
     path('api/containers/delete/', DeleteContainerView.as_view(), name='delete_container'),
     path('api/containers/<str:project_name>/', ListContainersView.as_view(), name='list_containers_project'),
     path('api/containers/<str:container_id>/start/', StartContainerView.as_view(), name='start_container'),
+    path('api/containers/<str:container_id>/cache/', ContainerCacheView.as_view(), name='container_cache'),
     path('api/containers/<str:container_id>/stop/', StopContainerView.as_view(), name='stop_container'),
     
     path('proxy/<str:container_name>/<path:path>', ContainerProxyView.as_view(), name='container-proxy'),
@@ -104,12 +104,13 @@ export default function ContainersPage() {
     setIsCreating(true);
     setError(null);
     try {
-      await axios.post(
+      const created = await axios.post(
         CREATE_ENDPOINT,
         { project_name: projectName, build_file_path: buildFilePath, port },
         { headers: { Authorization: `Bearer ${accessToken}` } }
       );
-      alert("Container created successfully.");
+      // 202: the build runs in the background, its containers show up once it finishes
+      alert(created.status === 202 ? "Build queued." : "Container created successfully.");
       setProjectName("");
       setBuildFilePath("Dockerfile");
       setPort(8080);